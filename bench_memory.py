@@ -0,0 +1,52 @@
+"""
+Memory benchmark: compares how much memory a catalog takes when it is held as a list of
+Product objects and when it is held in a columnar.ProductTable.
+Usage: python bench_memory.py [number of products]
+"""
+import sys
+import tracemalloc
+
+import columnar
+import products
+
+
+def make_products(size) -> list:
+    product_list = []
+    for i in range(size):
+        if i % 10 == 0:
+            product_list.append(products.NonStockedProduct(f"License {i:07d}", price=125))
+        elif i % 10 == 1:
+            product_list.append(products.LimitedProduct(f"Shipping {i:07d}", price=10, quantity=250, maximum=1))
+        else:
+            product_list.append(products.Product(f"Product {i:07d}", price=99.99, quantity=100))
+    return product_list
+
+
+def measure(build) -> tuple:
+    """
+    Runs build() and returns what it built together with the number of bytes it allocated.
+    :param build:
+    :return:
+    """
+    tracemalloc.start()
+    try:
+        result = build()
+        allocated = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, allocated
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    product_list, objects_bytes = measure(lambda: make_products(size))
+    # The names are shared by both representations, so they are not counted for the table
+    table, table_bytes = measure(lambda: columnar.ProductTable.from_products(product_list))
+    names_bytes = sum(sys.getsizeof(product.name) for product in product_list)
+    print(f"{size} products")
+    print(f"Product objects: {objects_bytes / size:8.1f} bytes per product (incl. names)")
+    print(f"ProductTable:    {(table_bytes + names_bytes) / size:8.1f} bytes per product (incl. names)")
+
+
+if __name__ == "__main__":
+    main()
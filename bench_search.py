@@ -0,0 +1,110 @@
+"""
+Query latency of the search index (search.py) against a linear scan of Store.get_all_products(),
+for prefix, fuzzy, price range and promotion queries over a generated catalog.
+Usage: python bench_search.py [--products 100000] [--queries 200]
+"""
+import argparse
+import random
+import re
+import statistics
+import time
+
+import products
+import promotions
+import search
+import store
+
+WORDS = ["apple", "samsung", "google", "sony", "bose", "dell", "lenovo", "asus", "phone", "laptop", "tablet",
+         "watch", "earbuds", "speaker", "monitor", "camera", "charger", "cable", "pro", "max", "mini", "air",
+         "ultra", "plus", "lite", "wireless", "gaming", "smart", "black", "silver"]
+
+
+def make_store(product_count, seed=1) -> store.Store:
+    generator = random.Random(seed)
+    promotion_list = [None, None, None, promotions.PercentDiscount("30% off!", percent=30),
+                      promotions.ThirdOneFree("Third One Free!")]
+    product_list = []
+    for i in range(product_count):
+        name = " ".join(generator.sample(WORDS, 3)) + f" {i}"
+        product = products.Product(name, price=generator.randint(1, 5000), quantity=100)
+        product.set_promotion(generator.choice(promotion_list))
+        product_list.append(product)
+    return store.Store(product_list)
+
+
+def linear_prefix(best_buy, text):
+    query = text.lower().split()
+    return [product for product in best_buy.get_all_products()
+            if all(any(word.startswith(part) for word in re.findall(r"\w+", product.name.lower())) for part in query)]
+
+
+def linear_fuzzy(best_buy, text):
+    query = search._trigrams(text)
+    scored = []
+    for product in best_buy.get_all_products():
+        trigrams = search._trigrams(product.name)
+        shared = len(query & trigrams)
+        score = shared / (len(query) + len(trigrams) - shared)
+        if score >= 0.3:
+            scored.append((-score, product.name))
+    return sorted(scored)[:10]
+
+
+def linear_price_range(best_buy, low, high):
+    return sorted((product for product in best_buy.get_all_products() if low <= product.price <= high),
+                  key=lambda product: (product.price, product.name))
+
+
+def linear_promotion(best_buy, name):
+    return [product for product in best_buy.get_all_products() if product.promotion and product.promotion.name == name]
+
+
+def timed(function, arguments) -> float:
+    """
+    Returns the median latency of the function over the list of arguments, in seconds.
+    """
+    times = []
+    for argument in arguments:
+        start_time = time.perf_counter()
+        function(*argument)
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search index latency against a linear scan")
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    best_buy = make_store(args.products)
+    start_time = time.perf_counter()
+    index = search.SearchIndex()
+    index.attach(best_buy)
+    print(f"Index of {len(index)} products built in {time.perf_counter() - start_time:.2f}s")
+
+    generator = random.Random(2)
+    prefixes = [(" ".join(word[:3] for word in generator.sample(WORDS, 2)),) for _ in range(args.queries)]
+    typos = [(generator.choice(WORDS)[:-1] + " " + generator.choice(WORDS),) for _ in range(args.queries)]
+    ranges = [(low, low + 20) for low in (generator.randint(1, 5000) for _ in range(args.queries))]
+    promotion_names = [("Third One Free!",)] * args.queries
+    # Linear scans are slow: run fewer of them
+    scans = max(1, args.queries // 20)
+    cases = [
+        ("prefix", lambda text: index.search(text), lambda text: linear_prefix(best_buy, text), prefixes),
+        ("fuzzy", lambda text: index.search(text, fuzzy=True, limit=10), lambda text: linear_fuzzy(best_buy, text),
+         typos),
+        ("price range", lambda low, high: index.search(min_price=low, max_price=high),
+         lambda low, high: linear_price_range(best_buy, low, high), ranges),
+        ("promotion", lambda name: index.search(promotion=name, limit=20),
+         lambda name: linear_promotion(best_buy, name)[:20], promotion_names),
+    ]
+    for label, indexed, linear, arguments in cases:
+        indexed_time = timed(indexed, arguments)
+        linear_time = timed(linear, arguments[:scans])
+        print(f"{label:12} index {indexed_time * 1e3:9.3f} ms   linear scan {linear_time * 1e3:9.3f} ms   "
+              f"(x{linear_time / indexed_time:,.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Load generator for the checkout service (service.py). Opens many concurrent client connections,
+places orders through them and reports the latency percentiles and the throughput.
+Without --port, a service is started in a background thread on a free port, with a store
+that has enough stock for the whole run.
+Usage: python bench_service.py [--clients 1000] [--orders 20] [--host HOST --port PORT]
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+import products
+import service
+import store
+
+
+def start_background_service(product_count=100) -> int:
+    """
+    Starts a service in a thread of its own and returns the port it listens on.
+    :param product_count:
+    :return:
+    """
+    product_list = [products.Product(f"Product {i}", price=10, quantity=10 ** 9) for i in range(product_count)]
+    best_buy = store.Store(product_list)
+    ready = threading.Event()
+    ports = []
+
+    async def run():
+        server = await service.OrderService(best_buy).start(port=0)
+        ports.append(server.sockets[0].getsockname()[1])
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+    ready.wait()
+    return ports[0]
+
+
+async def client(host, port, client_id, orders, product_names, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port, limit=service.MAX_LINE)
+    try:
+        for i in range(orders):
+            name = product_names[(client_id + i) % len(product_names)]
+            request = {"id": i, "op": "order", "lines": [[name, 1]]}
+            start_time = time.perf_counter()
+            writer.write((json.dumps(request) + "\n").encode("utf-8"))
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start_time)
+            if not response["ok"]:
+                errors.append(response["error"])
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, clients, orders) -> tuple:
+    reader, writer = await asyncio.open_connection(host, port, limit=service.MAX_LINE)
+    writer.write(b'{"op": "list"}\n')
+    product_names = [product["name"] for product in json.loads(await reader.readline())["products"]]
+    writer.close()
+
+    latencies, errors = [], []
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client(host, port, client_id, orders, product_names, latencies, errors)
+                           for client_id in range(clients)))
+    return latencies, errors, time.perf_counter() - start_time
+
+
+def percentile(sorted_values, fraction) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the checkout service")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=20, help="orders per client")
+    parser.add_argument("--host", default=service.DEFAULT_HOST)
+    parser.add_argument("--port", type=int, help="port of a running service")
+    args = parser.parse_args()
+
+    port = args.port or start_background_service()
+    latencies, errors, seconds = asyncio.run(run_load(args.host, port, args.clients, args.orders))
+    latencies.sort()
+    print(f"{args.clients} clients x {args.orders} orders in {seconds:.2f}s ({len(errors)} errors)")
+    print(f"p50 latency: {percentile(latencies, 0.50) * 1000:.2f} ms")
+    print(f"p99 latency: {percentile(latencies, 0.99) * 1000:.2f} ms")
+    print(f"{len(latencies) / seconds:,.0f} orders/sec")
+
+
+if __name__ == "__main__":
+    main()
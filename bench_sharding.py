@@ -0,0 +1,55 @@
+"""
+Throughput of the sharded store (sharding.py) for growing shard counts. Every run processes the
+same batches of random orders, of which a small share spans several shards.
+Usage: python bench_sharding.py [--products 100000] [--orders 200000] [--shards 1,2,4,8]
+"""
+import argparse
+import random
+import time
+
+import products
+import sharding
+
+BATCH_SIZE = 20000
+
+
+def make_orders(product_count, order_count, cross_shard_share, seed=1) -> list:
+    """
+    Returns random orders of product names: most of them have one line, the others have three.
+    """
+    generator = random.Random(seed)
+    orders = []
+    for _ in range(order_count):
+        line_count = 3 if generator.random() < cross_shard_share else 1
+        orders.append([(f"Product {generator.randrange(product_count)}", 1) for _ in range(line_count)])
+    return orders
+
+
+def run(shard_count, product_count, orders) -> float:
+    product_list = [products.Product(f"Product {i}", price=10, quantity=10 ** 9) for i in range(product_count)]
+    with sharding.ShardedStore(product_list, shard_count) as sharded_store:
+        start_time = time.perf_counter()
+        for start in range(0, len(orders), BATCH_SIZE):
+            sharded_store.process_orders(orders[start:start + BATCH_SIZE])
+        return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the sharded store per shard count")
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--cross-shard", type=float, default=0.01, help="share of orders with 3 lines")
+    parser.add_argument("--shards", default="1,2,4,8")
+    args = parser.parse_args()
+
+    orders = make_orders(args.products, args.orders, args.cross_shard)
+    baseline = None
+    for shard_count in (int(count) for count in args.shards.split(",")):
+        seconds = run(shard_count, args.products, orders)
+        throughput = len(orders) / seconds
+        baseline = baseline or throughput
+        print(f"{shard_count:3} shards: {throughput:12,.0f} orders/sec  (x{throughput / baseline:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Cold start of the command line interface (main.py):
+    - import time of main, against importing all the store modules up front
+    - time until the interactive menu is shown, against the time to load the whole catalog
+      (python main.py total), for the demo catalog or a generated snapshot of --products products
+Every measure runs a fresh Python process; the median of --runs runs is printed.
+Usage: python bench_startup.py [--products 1000000] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import products
+import snapshot
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_time(statement) -> float:
+    """
+    Returns the time taken by the imports of a statement, in seconds, from python -X importtime.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=HERE,
+                            capture_output=True, text=True, check=True)
+    total = 0
+    for line in result.stderr.splitlines():
+        # Only the top level imports (no indentation) are added up
+        if line.startswith("import time:") and "|" in line:
+            name = line.rsplit("|", 1)[1]
+            if not name.startswith("  ") and name.strip() in ("main", "store", "products", "promotions",
+                                                                "money", "reservations"):
+                total += int(line.split("|")[1])
+    return total / 1e6
+
+
+def time_to_menu(arguments) -> float:
+    """
+    Starts the interactive menu and returns the time until its prompt is printed.
+    """
+    start_time = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py", *arguments], cwd=HERE, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, text=True, bufsize=0)
+    output = ""
+    while "Please choose a number" not in output:
+        character = process.stdout.read(1)
+        if not character:
+            break
+        output += character
+    elapsed = time.perf_counter() - start_time
+    process.communicate("4\n")
+    return elapsed
+
+
+def time_to_run(arguments) -> float:
+    start_time = time.perf_counter()
+    subprocess.run([sys.executable, "main.py", *arguments], cwd=HERE, capture_output=True, check=True)
+    return time.perf_counter() - start_time
+
+
+def median(function, argument, runs) -> float:
+    return statistics.median(function(argument) for _ in range(runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start of main.py")
+    parser.add_argument("--products", type=int, default=0, help="size of a generated snapshot catalog (0: demo)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"import main:                 {median(import_time, 'import main', args.runs) * 1e3:8.1f} ms")
+    print(f"import main + store modules: "
+          f"{median(import_time, 'import main, store, products, promotions, money, reservations', args.runs) * 1e3:8.1f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        catalog = []
+        if args.products:
+            path = os.path.join(directory, "catalog.snap")
+            snapshot.save_snapshot((products.Product(f"Product {i}", price=10, quantity=100)
+                                    for i in range(args.products)), path)
+            catalog = ["--snapshot", path]
+        print(f"time to menu (lazy):         {median(time_to_menu, catalog, args.runs) * 1e3:8.1f} ms")
+        print(f"time to load catalog:        {median(time_to_run, [*catalog, 'total'], args.runs) * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Benchmark suite for the hot paths of the store: ordering, buying, pricing and listing, the
+exact money (integer cents) path against the float path, and the order history.
+
+Every benchmark is a function registered with @benchmark(group). It gets a size (the number of
+products in the catalog, or of lines priced) and returns the callable to time; its setup is not
+timed. Each callable is run in rounds until enough time has been measured, and the min, median
+and mean time of a round are recorded.
+
+Usage:
+    python benchmark.py                              run everything, print a table
+    python benchmark.py --group pricing --sizes 10,1000
+    python benchmark.py --output results.json        save the results (JSON)
+    python benchmark.py --compare baseline.json      fail (exit code 1) if a median time got
+                                                     slower than the baseline by more than --threshold
+"""
+import argparse
+import functools
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+
+import history
+import main
+import products
+import promotions
+import store
+
+DEFAULT_SIZES = (10, 1000, 100000, 1000000)
+# Minimum time measured per benchmark and size, and bounds on the number of rounds
+MIN_TIME = 0.2
+MIN_ROUNDS = 5
+MAX_ROUNDS = 10000
+
+BENCHMARKS = []
+
+
+def benchmark(group):
+    """
+    Decorator that registers a benchmark in a group.
+    :param group:
+    :return:
+    """
+    def register(function):
+        BENCHMARKS.append((group, function.__name__, function))
+        return function
+    return register
+
+
+@functools.lru_cache(maxsize=4)
+def make_catalog(size, cents=False) -> tuple:
+    """
+    Returns a store with `size` products and the list of its products. 80% are Products, 10%
+    NonStockedProducts and 10% LimitedProducts; every promotion type is used. The stock is large
+    enough for any benchmark run, so the same catalog is shared by all the benchmarks of a size.
+    :param size:
+    :param cents: make a store in cents mode.
+    :return:
+    """
+    promotion_list = [None, promotions.PercentDiscount("30% off!", percent=30),
+                      promotions.SecondHalfPrice("Second Half price!"), promotions.ThirdOneFree("Third One Free!")]
+    product_list = []
+    for i in range(size):
+        if i % 10 == 8:
+            product = products.NonStockedProduct(f"License {i}", price=125)
+        elif i % 10 == 9:
+            product = products.LimitedProduct(f"Shipping {i}", price=10, quantity=10 ** 12, maximum=1)
+        else:
+            product = products.Product(f"Product {i}", price=99.99, quantity=10 ** 12)
+        product.set_promotion(promotion_list[i % len(promotion_list)])
+        product_list.append(product)
+    return store.Store(product_list, cents=cents), product_list
+
+
+@benchmark("order")
+def store_order(size):
+    best_buy, product_list = make_catalog(size)
+    basket = store.Basket([(product_list[0], 2), (product_list[size // 2], 1), (product_list[-1], 1)])
+    return lambda: best_buy.order(basket)
+
+
+@benchmark("order")
+def store_process_orders(size):
+    best_buy, product_list = make_catalog(size)
+    orders = [[(product_list[i], 1), (product_list[(i * 7) % size], 1)] for i in range(min(size, 1000))]
+    return lambda: best_buy.process_orders(orders)
+
+
+def _buy_all(product_class, size):
+    _, product_list = make_catalog(size)
+    selected = [product for product in product_list if type(product) is product_class] or product_list[:1]
+
+    def run():
+        for product in selected:
+            product.buy(1)
+    return run
+
+
+@benchmark("buy")
+def product_buy(size):
+    return _buy_all(products.Product, size)
+
+
+@benchmark("buy")
+def non_stocked_product_buy(size):
+    return _buy_all(products.NonStockedProduct, size)
+
+
+@benchmark("buy")
+def limited_product_buy(size):
+    return _buy_all(products.LimitedProduct, size)
+
+
+def _apply_promotion(promotion, size):
+    product = products.Product("MacBook Air M2", price=1450, quantity=100)
+    quantities = range(1, size + 1)
+
+    def run():
+        for quantity in quantities:
+            promotion.apply_promotion(product, quantity)
+    return run
+
+
+@benchmark("pricing")
+def percent_discount(size):
+    return _apply_promotion(promotions.PercentDiscount("30% off!", percent=30), size)
+
+
+@benchmark("pricing")
+def second_half_price(size):
+    return _apply_promotion(promotions.SecondHalfPrice("Second Half price!"), size)
+
+
+@benchmark("pricing")
+def third_one_free(size):
+    return _apply_promotion(promotions.ThirdOneFree("Third One Free!"), size)
+
+
+def _order_batch(cents, size):
+    best_buy, product_list = make_catalog(size, cents)
+    orders = [[(product_list[i], 3), (product_list[(i * 7) % size], 2)] for i in range(min(size, 1000))]
+    return lambda: best_buy.process_orders(orders)
+
+
+@benchmark("money")
+def float_order_batch(size):
+    return _order_batch(False, size)
+
+
+@benchmark("money")
+def cents_order_batch(size):
+    return _order_batch(True, size)
+
+
+def _price_lines(cents, size):
+    promotion_list = [promotions.PercentDiscount("30% off!", percent=30),
+                      promotions.SecondHalfPrice("Second Half price!"), promotions.ThirdOneFree("Third One Free!")]
+    product = products.Product("MacBook Air M2", price=1449.99, quantity=100)
+    price_cents = 144999
+    quantities = range(1, size + 1)
+
+    if cents:
+        def run():
+            for promotion in promotion_list:
+                for quantity in quantities:
+                    promotion.apply_promotion_cents(price_cents, quantity)
+    else:
+        def run():
+            for promotion in promotion_list:
+                for quantity in quantities:
+                    promotion.apply_promotion(product, quantity)
+    return run
+
+
+@benchmark("money")
+def float_pricing(size):
+    return _price_lines(False, size)
+
+
+@benchmark("money")
+def cents_pricing(size):
+    return _price_lines(True, size)
+
+
+def _make_history(size) -> history.OrderHistory:
+    _, product_list = make_catalog(min(size, 1000))
+    order_history = history.OrderHistory(partition_seconds=3600)
+    for i in range(size):
+        product = product_list[i % len(product_list)]
+        order_history.record_lines(i, [(product, 2)], [product.quote(2)])
+    return order_history
+
+
+@benchmark("history")
+def history_record_lines(size):
+    _, product_list = make_catalog(min(size, 1000))
+    lines = [[(product, 2)] for product in product_list]
+    line_prices = [[product.quote(2)] for product in product_list]
+
+    def run():
+        order_history = history.OrderHistory()
+        for timestamp, (shopping_list, prices) in enumerate(zip(lines, line_prices)):
+            order_history.record_lines(timestamp, shopping_list, prices)
+    return run
+
+
+@benchmark("history")
+def history_revenue_by_product(size):
+    order_history = _make_history(size)
+    return lambda: order_history.aggregate(by=("product",))
+
+
+@benchmark("history")
+def history_discount_per_hour(size):
+    order_history = _make_history(size)
+    return lambda: order_history.aggregate(by=("promotion", "time"), bucket=3600)
+
+
+@benchmark("listing")
+def store_get_all_products(size):
+    best_buy, _ = make_catalog(size)
+    return best_buy.get_all_products
+
+
+@benchmark("listing")
+def main_list_all_products(size):
+    best_buy, _ = make_catalog(size)
+    return lambda: main.list_all_products(best_buy)
+
+
+def measure(run) -> dict:
+    """
+    Times a callable in rounds and returns the statistics, in seconds per round.
+    :param run:
+    :return:
+    """
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        total_time = 0
+        while len(timings) < MAX_ROUNDS and (len(timings) < MIN_ROUNDS or total_time < MIN_TIME):
+            start_time = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start_time
+            timings.append(elapsed)
+            total_time += elapsed
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {"min": min(timings), "median": statistics.median(timings),
+            "mean": statistics.fmean(timings), "rounds": len(timings)}
+
+
+def run_benchmarks(groups=None, sizes=DEFAULT_SIZES, names=None) -> list:
+    results = []
+    for size in sizes:
+        for group, name, function in BENCHMARKS:
+            if (groups and group not in groups) or (names and name not in names):
+                continue
+            result = {"group": group, "name": name, "size": size}
+            result.update(measure(function(size)))
+            results.append(result)
+            print(f"{group:10} {name:28} {size:>9} {result['median'] * 1e6:14.2f} us "
+                  f"(min {result['min'] * 1e6:.2f} us, {result['rounds']} rounds)", flush=True)
+        make_catalog.cache_clear()
+    return results
+
+
+def compare(results, baseline, threshold) -> list:
+    """
+    Compares the median times with those of a baseline and returns the list of regressions,
+    as (result, baseline median) tuples.
+    :param results:
+    :param baseline:
+    :param threshold: allowed slowdown, e.g. 0.25 for 25%.
+    :return:
+    """
+    baseline_medians = {(result["group"], result["name"], result["size"]): result["median"]
+                        for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        baseline_median = baseline_medians.get((result["group"], result["name"], result["size"]))
+        if baseline_median and result["median"] > baseline_median * (1 + threshold):
+            regressions.append((result, baseline_median))
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmarks of the store hot paths")
+    parser.add_argument("--group", action="append", help="only run this group (can be repeated)")
+    parser.add_argument("--name", action="append", help="only run this benchmark (can be repeated)")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare the results with")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run_benchmarks(args.group, sizes, args.name)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"python": sys.version, "machine": platform.platform(), "created": time.time(),
+                       "results": results}, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for result, baseline_median in regressions:
+            print(f"REGRESSION {result['group']}/{result['name']}[{result['size']}]: "
+                  f"{baseline_median * 1e6:.2f} us -> {result['median'] * 1e6:.2f} us")
+        if regressions:
+            sys.exit(1)
+        print("No regression.")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,290 @@
+"""
+ProductTable is a memory-compact, array-backed alternative to a list of Product objects.
+Every attribute of the products is stored in its own column (array or list) and a product is
+only a row number. ProductRow is a lightweight view on one row that presents the same API as
+the Product classes (buy, show, set_quantity, ...), so that code written for Product objects
+can work with the rows of a table.
+Note: rows do not support listeners, so a ProductTable cannot be indexed by a Store. Use
+to_products() to turn the table into regular Product objects.
+"""
+import threading
+from array import array
+
+import money
+import products
+
+# Type codes stored in the kind column
+PRODUCT = 0
+NON_STOCKED = 1
+LIMITED = 2
+
+KIND_CLASSES = {PRODUCT: products.Product,
+                NON_STOCKED: products.NonStockedProduct,
+                LIMITED: products.LimitedProduct}
+
+
+def kind_of(product) -> int:
+    """
+    Returns the type code of a Product instance.
+    :param product:
+    :return:
+    """
+    if isinstance(product, products.LimitedProduct):
+        return LIMITED
+    elif isinstance(product, products.NonStockedProduct):
+        return NON_STOCKED
+    return PRODUCT
+
+
+def _number(value):
+    """
+    Floats that hold a whole number are given back as int, so that rows show the same
+    text as the Product they were made from.
+    """
+    return int(value) if value.is_integer() else value
+
+
+class ProductTable:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.names = []
+        self.kinds = array("b")
+        self.prices = array("d")
+        self.quantities = array("d")
+        self.maximums = array("d")
+        self.active = bytearray()
+        # Most products have no promotion, so promotions are kept in a sparse dict: row -> promotion
+        self.promotions = {}
+        self._index = {}
+
+    @classmethod
+    def from_products(cls, product_list):
+        """
+        Builds a table from an iterable of Product objects.
+        :param product_list:
+        :return:
+        """
+        table = cls()
+        for product in product_list:
+            table.append(product)
+        return table
+
+    def append(self, product) -> int:
+        """
+        Adds a copy of a Product object to the table and returns its row number.
+        :raises ValueError: if a product with the same name is already in the table.
+        :param product:
+        :return:
+        """
+        return self.add_row(product.name, kind_of(product), product.price, product.quantity,
+                            getattr(product, "maximum", 0), product.promotion, product.is_active())
+
+    def add_row(self, name, kind, price, quantity, maximum=0, promotion=None, active=True) -> int:
+        """
+        Low-level method to add a row to the table. Returns the row number.
+        :raises ValueError: if a product with the same name is already in the table.
+        :return:
+        """
+        if name in self._index:
+            raise ValueError("A product with the same name already exists!")
+        row = len(self.names)
+        self._index[name] = row
+        self.names.append(name)
+        self.kinds.append(kind)
+        self.prices.append(price)
+        self.quantities.append(quantity)
+        self.maximums.append(maximum)
+        self.active.append(1 if active else 0)
+        if promotion:
+            self.promotions[row] = promotion
+        return row
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, row):
+        if not 0 <= row < len(self.names):
+            raise IndexError("Row out of range")
+        return ProductRow(self, row)
+
+    def __iter__(self):
+        for row in range(len(self.names)):
+            yield ProductRow(self, row)
+
+    def get(self, name):
+        """
+        Returns the row view of the product with the given name, or None if there is no such product.
+        :param name:
+        :return:
+        """
+        row = self._index.get(name)
+        return None if row is None else ProductRow(self, row)
+
+    def get_all_products(self) -> list:
+        """
+        Returns the row views of all the active products, like Store.get_all_products().
+        :return:
+        """
+        active = self.active
+        return [ProductRow(self, row) for row in range(len(self.names)) if active[row]]
+
+    def to_products(self) -> list:
+        """
+        Turns every row of the table into a regular Product object.
+        :return:
+        """
+        return [row.to_product() for row in self]
+
+
+class ProductRow:
+    """
+    A view on one row of a ProductTable, with the API of the Product classes.
+    """
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __eq__(self, other):
+        return isinstance(other, ProductRow) and self.table is other.table and self.row == other.row
+
+    def __hash__(self):
+        return hash((id(self.table), self.row))
+
+    @property
+    def kind(self) -> int:
+        return self.table.kinds[self.row]
+
+    @property
+    def name(self) -> str:
+        return self.table.names[self.row]
+
+    @property
+    def price(self):
+        return _number(self.table.prices[self.row])
+
+    @property
+    def quantity(self):
+        return _number(self.table.quantities[self.row])
+
+    @property
+    def maximum(self):
+        if self.kind != LIMITED:
+            raise AttributeError(f"'{KIND_CLASSES[self.kind].__name__}' object has no attribute 'maximum'")
+        return _number(self.table.maximums[self.row])
+
+    @property
+    def promotion(self):
+        return self.table.promotions.get(self.row)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.table.active[self.row])
+
+    @property
+    def lock(self):
+        return self.table.lock
+
+    def get_promotion(self) -> object:
+        return self.promotion
+
+    def set_promotion(self, promotion):
+        if promotion:
+            self.table.promotions[self.row] = promotion
+        else:
+            self.table.promotions.pop(self.row, None)
+
+    def get_price(self) -> float:
+        return self.price
+
+    def set_price(self, new_price):
+        if new_price < 0:
+            raise ValueError("Price cannot be a negative number!")
+        self.table.prices[self.row] = new_price
+
+    def get_quantity(self) -> float:
+        return self.quantity
+
+    def set_quantity(self, new_quantity):
+        if self.kind == NON_STOCKED:
+            return
+        self.table.quantities[self.row] = new_quantity
+        self.table.active[self.row] = 0 if new_quantity == 0 else 1
+
+    def is_active(self) -> bool:
+        return self.active
+
+    def activate(self):
+        self.table.active[self.row] = 1
+
+    def deactivate(self):
+        self.table.active[self.row] = 0
+
+    def check_purchase(self, quantity):
+        """
+        Same checks as the check_purchase() method of the matching Product class.
+        :raises ValueError: if the purchase cannot be made.
+        :param quantity:
+        :return: None
+        """
+        kind = self.kind
+        if kind == NON_STOCKED:
+            return
+        available_qty = self.quantity
+        if kind == LIMITED:
+            maximum = self.maximum
+            if available_qty < quantity <= maximum:
+                raise ValueError(f"There is not enough in stock. Available quantity = {available_qty}")
+            elif quantity > maximum:
+                raise ValueError(f"A maximum of {maximum} units allowed per customer.")
+        elif quantity > available_qty:
+            raise ValueError(f"There is not enough in stock. Available quantity = {available_qty}")
+
+    def buy(self, quantity, cents=False) -> float:
+        with self.table.lock:
+            self.check_purchase(quantity)
+            if self.kind != NON_STOCKED:
+                self.set_quantity(self.table.quantities[self.row] - quantity)
+            return self.quote_cents(quantity) if cents else self.quote(quantity)
+
+    def quote(self, quantity) -> float:
+        promotion = self.promotion
+        if promotion:
+            return promotion.apply_promotion(self, quantity)
+        return self.price * quantity
+
+    def quote_cents(self, quantity) -> int:
+        promotion = self.promotion
+        if promotion:
+            return promotion.apply_promotion_cents(money.to_cents(self.price), quantity)
+        return money.to_cents(self.price) * quantity
+
+    def show(self) -> str:
+        kind = self.kind
+        message = f"{self.name}, Price: {self.price}"
+        if kind != NON_STOCKED:
+            message += f", Quantity: {self.quantity}"
+        if kind == LIMITED:
+            message += f", Maximum: {self.maximum}"
+        if self.promotion:
+            message += f", Promotion: {self.promotion.name}"
+        return message
+
+    def to_product(self):
+        """
+        Returns a regular Product object (of the matching class) with the data of this row.
+        :return:
+        """
+        kind = self.kind
+        if kind == NON_STOCKED:
+            product = products.NonStockedProduct(self.name, self.price)
+        elif kind == LIMITED:
+            product = products.LimitedProduct(self.name, self.price, self.quantity, self.maximum)
+        else:
+            product = products.Product(self.name, self.price, self.quantity)
+        product.set_promotion(self.promotion)
+        if not self.active:
+            product.deactivate()
+        return product
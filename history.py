@@ -0,0 +1,198 @@
+"""
+Order history: an in-process event store of the order lines, for sales analytics.
+
+Attached to a store (OrderHistory.attach()), the history records every line of every order made,
+through a commit hook: only the orders that are committed, after their products are unlocked. The lines are stored in compact columns (arrays of machine numbers),
+partitioned by time: one chunk per partition_seconds (an hour by default). Product and promotion
+names are stored once and referred to by their index.
+
+Aggregations group the lines by product, promotion and/or time bucket, and sum the units, the
+revenue, the list revenue (list price from Product.price * quantity) and the discount
+(list revenue - revenue). Every chunk is scanned as whole columns at a time, and chunks outside
+the requested time range are skipped.
+
+    history = OrderHistory()
+    history.attach(best_buy)
+    history.aggregate(by=("product",))                 revenue by product
+    history.aggregate(by=("promotion",))               discount (uplift cost) by promotion
+    history.aggregate(by=("time",), bucket=3600)       units sold per hour
+"""
+import threading
+import time
+from array import array
+
+import money
+
+GROUP_KEYS = ("product", "promotion", "time")
+
+
+class _Chunk:
+    """
+    The lines of one time partition, one array per column.
+    """
+    __slots__ = ("times", "products", "promotions", "quantities", "revenues", "list_prices")
+
+    def __init__(self):
+        self.times = array("d")
+        self.products = array("l")
+        self.promotions = array("l")
+        self.quantities = array("d")
+        self.revenues = array("d")
+        self.list_prices = array("d")
+
+    def __len__(self):
+        return len(self.times)
+
+
+class OrderHistory:
+
+    def __init__(self, partition_seconds=3600, clock=time.time):
+        """
+        :param partition_seconds: time span of a chunk, in seconds.
+        :param clock: returns the current time, used as the time of the lines recorded.
+        """
+        self.partition_seconds = partition_seconds
+        self.clock = clock
+        self.cents = False
+        self._lock = threading.Lock()
+        # partition number -> _Chunk
+        self._chunks = {}
+        # Product and promotion names, and their indexes; index 0 of the promotions is no promotion
+        self._product_names = []
+        self._product_ids = {}
+        self._promotion_names = [None]
+        self._promotion_ids = {None: 0}
+
+    def attach(self, best_buy):
+        """
+        Records the orders of a store from now on.
+        :param best_buy:
+        :return: None
+        """
+        # In cents mode the line prices are in cents, so the list prices are recorded in cents too
+        self.cents = best_buy.cents
+        best_buy.add_commit_hook(self.record_order)
+
+    def detach(self, best_buy):
+        best_buy.remove_commit_hook(self.record_order)
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._chunks.values())
+
+    def _id(self, name, names, ids):
+        index = ids.get(name)
+        if index is None:
+            index = ids[name] = len(names)
+            names.append(name)
+        return index
+
+    def record_order(self, shopping_list, line_prices):
+        """
+        Commit hook: records the lines of an order, at the current time.
+        :param shopping_list:
+        :param line_prices:
+        :return: None
+        """
+        self.record_lines(self.clock(), shopping_list, line_prices)
+
+    def record_lines(self, timestamp, shopping_list, line_prices):
+        """
+        Records (product, quantity) lines with their prices, at the given time.
+        :param timestamp:
+        :param shopping_list:
+        :param line_prices:
+        :return: None
+        """
+        with self._lock:
+            partition = int(timestamp // self.partition_seconds)
+            chunk = self._chunks.get(partition)
+            if chunk is None:
+                chunk = self._chunks[partition] = _Chunk()
+            for (product, quantity), line_price in zip(shopping_list, line_prices):
+                promotion = product.promotion
+                chunk.times.append(timestamp)
+                chunk.products.append(self._id(product.name, self._product_names, self._product_ids))
+                chunk.promotions.append(self._id(promotion.name if promotion else None,
+                                                 self._promotion_names, self._promotion_ids))
+                chunk.quantities.append(quantity)
+                chunk.revenues.append(line_price)
+                chunk.list_prices.append(money.to_cents(product.price) if self.cents else product.price)
+
+    def _selected_chunks(self, start, end):
+        """
+        Yields (chunk, rows) for the chunks that overlap [start, end): rows is None when the whole
+        chunk is in the range, else the list of the positions of the lines in the range.
+        """
+        with self._lock:
+            chunks = sorted(self._chunks.items())
+        for partition, chunk in chunks:
+            chunk_start = partition * self.partition_seconds
+            chunk_end = chunk_start + self.partition_seconds
+            if (end is not None and chunk_start >= end) or (start is not None and chunk_end <= start):
+                continue
+            if (start is None or chunk_start >= start) and (end is None or chunk_end <= end):
+                yield chunk, None
+            else:
+                low = float("-inf") if start is None else start
+                high = float("inf") if end is None else end
+                yield chunk, [row for row, timestamp in enumerate(chunk.times) if low <= timestamp < high]
+
+    def aggregate(self, by=("product",), start=None, end=None, bucket=3600) -> dict:
+        """
+        Groups the lines recorded between start (included) and end (excluded) and sums them.
+        Returns a dict that maps each group to a dict with the number of lines, the units, the
+        revenue, the list revenue and the discount. A group is a tuple with a value for each key
+        of by, in the same order: the product name, the promotion name (None for no promotion)
+        and/or the start time of the time bucket.
+        :raises ValueError: if a key of by is unknown.
+        :param by: keys among "product", "promotion" and "time".
+        :param start:
+        :param end:
+        :param bucket: size of the time buckets, in seconds.
+        :return:
+        """
+        for key in by:
+            if key not in GROUP_KEYS:
+                raise ValueError(f"Unknown group key: {key}")
+        totals = {}
+        for chunk, rows in self._selected_chunks(start, end):
+            columns = []
+            for key in by:
+                if key == "product":
+                    columns.append(chunk.products)
+                elif key == "promotion":
+                    columns.append(chunk.promotions)
+                else:
+                    columns.append([int(timestamp // bucket) for timestamp in chunk.times])
+            quantities, revenues, list_prices = chunk.quantities, chunk.revenues, chunk.list_prices
+            if rows is not None:
+                columns = [[column[row] for row in rows] for column in columns]
+                quantities = [quantities[row] for row in rows]
+                revenues = [revenues[row] for row in rows]
+                list_prices = [list_prices[row] for row in rows]
+            keys = zip(*columns) if columns else [()] * len(quantities)
+            for group, quantity, revenue, list_price in zip(keys, quantities, revenues, list_prices):
+                total = totals.get(group)
+                if total is None:
+                    total = totals[group] = [0, 0, 0, 0]
+                total[0] += 1
+                total[1] += quantity
+                total[2] += revenue
+                total[3] += list_price * quantity
+
+        results = {}
+        for group, (lines, units, revenue, list_revenue) in totals.items():
+            named = []
+            for key, value in zip(by, group):
+                if key == "product":
+                    named.append(self._product_names[value])
+                elif key == "promotion":
+                    named.append(self._promotion_names[value])
+                else:
+                    named.append(value * bucket)
+            if self.cents:
+                # Sums of whole numbers of cents are exact in the float columns
+                revenue, list_revenue = int(revenue), int(list_revenue)
+            results[tuple(named)] = {"lines": lines, "units": units, "revenue": revenue,
+                                     "list_revenue": list_revenue, "discount": list_revenue - revenue}
+        return results
@@ -0,0 +1,232 @@
+"""
+Streaming ingestion of supplier catalog feeds (CSV or JSONL) into a store.
+
+Every row describes one product with the columns:
+    type      product (default), non_stocked or limited (the class names are accepted too)
+    name      name of the product
+    price     price of the product
+    quantity  quantity in stock (ignored for non_stocked products)
+    maximum   maximum quantity per order (limited products only)
+
+The feed is read in chunks. The chunks are validated across a process pool, with the same rules
+as the Product constructor (see products.validate_product()), and the valid rows are upserted
+into the store one chunk at a time. Rows that fail validation are written to a reject report
+(CSV: line, reason, row) and do not stop the run.
+
+Usage: python ingest.py FEED [--rejects FILE] [--workers N] [--chunk-size N] [--snapshot FILE]
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import products
+import snapshot
+import store
+
+DEFAULT_CHUNK_SIZE = 10000
+
+PRODUCT_TYPES = {
+    "product": products.Product,
+    "non_stocked": products.NonStockedProduct,
+    "limited": products.LimitedProduct,
+    "Product": products.Product,
+    "NonStockedProduct": products.NonStockedProduct,
+    "LimitedProduct": products.LimitedProduct,
+}
+
+
+def read_rows(path, feed_format=None):
+    """
+    Generator over the rows of a feed file, as (line number, dict) tuples.
+    :raises ValueError: if the format of the file is unknown.
+    :param path:
+    :param feed_format: "csv" or "jsonl"; guessed from the file extension if not given.
+    :return:
+    """
+    feed_format = feed_format or os.path.splitext(str(path))[1].lstrip(".").lower()
+    with open(path, newline="", encoding="utf-8") as file:
+        if feed_format == "csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        elif feed_format in ("jsonl", "json", "ndjson"):
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = {"_raw": line.rstrip("\n")}
+                yield line_number, row
+        else:
+            raise ValueError(f"Unknown feed format: {feed_format}")
+
+
+def read_chunks(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _number(value):
+    if isinstance(value, str):
+        value = value.strip()
+        if value == "":
+            return 0
+        try:
+            value = int(value)
+        except ValueError:
+            value = float(value)
+    elif not isinstance(value, (int, float)) or isinstance(value, bool):
+        raise ValueError(f"Not a number: {value!r}")
+    # NaN passes every comparison and infinity cannot be converted to cents
+    if not math.isfinite(value):
+        raise ValueError(f"Not a finite number: {value!r}")
+    return value
+
+
+def validate_row(row) -> tuple:
+    """
+    Validates one row and returns it normalized as (type, name, price, quantity, maximum).
+    :raises ValueError: if the row is not valid.
+    :param row:
+    :return:
+    """
+    if not isinstance(row, dict) or "_raw" in row:
+        raise ValueError("Row cannot be parsed!")
+    product_type = str(row.get("type") or "product").strip()
+    if product_type not in PRODUCT_TYPES:
+        raise ValueError(f"Unknown product type: {product_type}")
+    product_type = PRODUCT_TYPES[product_type].__name__
+    name = str(row.get("name") or "").strip()
+    price = _number(row.get("price", ""))
+    quantity = 0 if product_type == "NonStockedProduct" else _number(row.get("quantity", ""))
+    products.validate_product(name, price, quantity)
+    maximum = 0
+    if product_type == "LimitedProduct":
+        maximum = _number(row.get("maximum", ""))
+        if maximum <= 0:
+            raise ValueError("Maximum must be a positive number!")
+    return product_type, name, price, quantity, maximum
+
+
+def validate_chunk(chunk) -> tuple:
+    """
+    Validates a chunk of rows. Runs in the worker processes.
+    Returns a tuple (valid rows, rejects): valid rows are the output of validate_row(),
+    rejects are (line number, reason, row) tuples.
+    :param chunk:
+    :return:
+    """
+    valid_rows, rejects = [], []
+    for line_number, row in chunk:
+        try:
+            valid_rows.append(validate_row(row))
+        except ValueError as error:
+            rejects.append((line_number, str(error), row))
+    return valid_rows, rejects
+
+
+def build_product(valid_row):
+    """
+    Creates the Product object of a row validated by validate_row().
+    :param valid_row:
+    :return:
+    """
+    product_type, name, price, quantity, maximum = valid_row
+    if product_type == "NonStockedProduct":
+        return products.NonStockedProduct(name, price)
+    elif product_type == "LimitedProduct":
+        return products.LimitedProduct(name, price, quantity, maximum)
+    return products.Product(name, price, quantity)
+
+
+def _validated_chunks(chunks, workers):
+    """
+    Validates the chunks, across a process pool if workers is not 0, and yields the results
+    in the order of the chunks. At most two chunks per worker are in flight, so the feed is
+    never read much further than what has been ingested.
+    """
+    if workers == 0:
+        for chunk in chunks:
+            yield validate_chunk(chunk)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(validate_chunk, chunk))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def ingest(best_buy, path, feed_format=None, reject_path=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Loads a feed file into a store. Returns a dict with the number of rows read, products added,
+    products updated and rows rejected, and the time it took.
+    :param best_buy:
+    :param path:
+    :param feed_format: "csv" or "jsonl"; guessed from the file extension if not given.
+    :param reject_path: CSV file where the rejected rows are written (not written if None).
+    :param workers: number of worker processes (None: one per CPU, 0: validate in this process).
+    :param chunk_size: number of rows per chunk.
+    :return:
+    """
+    report = {"rows": 0, "added": 0, "updated": 0, "rejected": 0}
+    start_time = time.perf_counter()
+    reject_file = open(reject_path, "w", newline="", encoding="utf-8") if reject_path else None
+    try:
+        reject_writer = csv.writer(reject_file) if reject_file else None
+        if reject_writer:
+            reject_writer.writerow(["line", "reason", "row"])
+        chunks = read_chunks(read_rows(path, feed_format), chunk_size)
+        for valid_rows, rejects in _validated_chunks(chunks, workers):
+            added, updated = best_buy.upsert_products(build_product(valid_row) for valid_row in valid_rows)
+            report["rows"] += len(valid_rows) + len(rejects)
+            report["added"] += added
+            report["updated"] += updated
+            report["rejected"] += len(rejects)
+            if reject_writer:
+                reject_writer.writerows((line_number, reason, json.dumps(row))
+                                        for line_number, reason, row in rejects)
+    finally:
+        if reject_file:
+            reject_file.close()
+    report["seconds"] = time.perf_counter() - start_time
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loads a catalog feed (CSV or JSONL) into a store")
+    parser.add_argument("feed")
+    parser.add_argument("--format", choices=["csv", "jsonl"])
+    parser.add_argument("--rejects", help="CSV file for the rejected rows")
+    parser.add_argument("--workers", type=int, help="number of worker processes (0: no pool)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--snapshot", help="save the resulting catalog to this snapshot file")
+    args = parser.parse_args()
+
+    best_buy = store.Store([])
+    report = ingest(best_buy, args.feed, args.format, args.rejects, args.workers, args.chunk_size)
+    print(f"{report['rows']} rows in {report['seconds']:.2f}s: {report['added']} added, "
+          f"{report['updated']} updated, {report['rejected']} rejected")
+    if report["seconds"]:
+        print(f"{report['rows'] / report['seconds']:,.0f} rows/sec")
+    if args.snapshot:
+        snapshot.save_store(best_buy, args.snapshot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Append-only journal of the stock changes of a store, used to recover the stock after a crash.
+Every order is written as one JSON line: {"lines": [[product name, quantity], ...]}, once it is
+committed (see Store.add_commit_hook()), so orders that are rolled back are never written. The
+other changes of the stock (restocks, upserts, ...) are written in the same format, as the number
+of units taken: negative for units added. All entries are differences, so they can be replayed in
+any order. Changes to the catalog itself (new products, prices) need a checkpoint.
+To keep the throughput up, the journal does not fsync every order: it syncs once a group of
+orders has been written, or when the oldest unsynced entry gets too old (group commit), from a
+timer so that the last group is synced even when no order follows. At most one group of orders
+can be lost by a crash of the machine.
+
+Recovery = the last snapshot (see snapshot.py) + the entries of the journal written after it.
+resume() does the replay at startup and keeps recording into the same journal (see the --journal
+option of main.py and service.py). checkpoint() writes a new snapshot and empties the journal.
+
+Replay tool: python journal.py SNAPSHOT JOURNAL
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+import snapshot
+import store
+
+
+class OrderJournal:
+
+    def __init__(self, path, group_size=64, group_interval=0.05):
+        """
+        Opens (or creates) a journal file in append mode.
+        :param path:
+        :param group_size: number of orders written before the journal is synced to disk.
+        :param group_interval: maximum number of seconds an entry waits before the journal is synced.
+        """
+        self.path = path
+        self.group_size = group_size
+        self.group_interval = group_interval
+        # _lock guards the writes, _sync_lock the syncs; _sync_lock is always taken first
+        self._lock = threading.Lock()
+        self._sync_lock = threading.RLock()
+        self._file = open(path, "a", encoding="utf-8")
+        self._pending = 0
+        self._first_pending_time = 0
+        self._timer = None
+        self._products = set()
+
+    def attach(self, best_buy):
+        """
+        Starts recording every order made in the store, and every other change of the stock of
+        its products.
+        :param best_buy:
+        :return: None
+        """
+        best_buy.add_commit_hook(self.record)
+        best_buy.add_catalog_listener(self._on_catalog_change)
+        for product in best_buy.products:
+            self.track(product)
+
+    def detach(self, best_buy):
+        best_buy.remove_commit_hook(self.record)
+        best_buy.remove_catalog_listener(self._on_catalog_change)
+        for product in best_buy.products:
+            self.untrack(product)
+
+    def track(self, product):
+        """
+        Starts recording the changes of the stock of a product that are not made by orders.
+        :param product:
+        :return: None
+        """
+        with self._lock:
+            if product in self._products:
+                return
+            self._products.add(product)
+        product.add_listener(self._on_product_change)
+
+    def untrack(self, product):
+        with self._lock:
+            if product not in self._products:
+                return
+            self._products.discard(product)
+        product.remove_listener(self._on_product_change)
+
+    def _on_catalog_change(self, product, event):
+        if event == "add":
+            self.track(product)
+        elif event == "remove":
+            self.untrack(product)
+
+    def _on_product_change(self, product, field, old_value, new_value):
+        # Called while the product is locked, so the entry is written but never synced from here
+        if field == "quantity" and not store.in_order() and new_value != old_value:
+            entry = json.dumps({"lines": [[product.name, old_value - new_value]]})
+            with self._lock:
+                self._write(entry)
+
+    def record(self, shopping_list, line_prices=None):
+        """
+        Writes one order to the journal. Used as a commit hook of the store.
+        :param shopping_list:
+        :param line_prices:
+        :return: None
+        """
+        entry = json.dumps({"lines": [[product.name, quantity] for product, quantity in shopping_list]})
+        with self._lock:
+            self._write(entry)
+            group_done = self._pending >= self.group_size or \
+                time.monotonic() - self._first_pending_time >= self.group_interval
+        if group_done:
+            self._sync()
+
+    def _write(self, entry):
+        # The caller holds self._lock; the first entry of a group starts the timer that syncs it
+        self._file.write(entry + "\n")
+        if not self._pending:
+            self._first_pending_time = time.monotonic()
+            self._timer = threading.Timer(self.group_interval, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+        self._pending += 1
+
+    def _on_timer(self):
+        if self._pending:
+            self._sync()
+
+    def sync(self):
+        """
+        Forces every entry written so far to disk.
+        :return: None
+        """
+        self._sync()
+
+    def _sync(self):
+        # Only the flush holds self._lock; the fsync runs under self._sync_lock, so that entries
+        # written from product listeners (with the product locked) never wait for the disk
+        with self._sync_lock:
+            with self._lock:
+                if self._file.closed:
+                    return
+                self._file.flush()
+                self._pending = 0
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            os.fsync(self._file.fileno())
+
+    def truncate(self):
+        """
+        Empties the journal. Used once the orders are saved in a snapshot.
+        :return: None
+        """
+        with self._sync_lock:
+            with self._lock:
+                self._file.truncate(0)
+        self._sync()
+
+    def close(self):
+        """
+        Syncs the entries not synced yet and closes the journal.
+        :return: None
+        """
+        with self._sync_lock:
+            self._sync()
+            with self._lock:
+                if not self._file.closed:
+                    self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_journal(path):
+    """
+    Generator that yields the orders of a journal file as lists of (product name, quantity).
+    The last line is ignored if it is incomplete, since that is what a crash in the middle of a
+    write leaves behind.
+    :raises ValueError: if a line other than the last one is corrupt.
+    :param path:
+    :return:
+    """
+    with open(path, encoding="utf-8") as file:
+        previous = None
+        for line in file:
+            if previous is not None:
+                yield _parse_entry(previous)
+            previous = line
+        if previous is not None and previous.endswith("\n"):
+            yield _parse_entry(previous)
+
+
+def _parse_entry(line) -> list:
+    try:
+        return [(name, quantity) for name, quantity in json.loads(line)["lines"]]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(f"Corrupt journal entry: {line.strip()}")
+
+
+def replay(best_buy, path) -> tuple:
+    """
+    Applies the entries of a journal to the stock of a store. The orders were validated when
+    they were made, so they are applied directly without checking or pricing them again.
+    Returns a tuple (orders, lines, seconds).
+    :raises ValueError: if the journal is corrupt or refers to a product that is not in the store.
+    :param best_buy:
+    :param path:
+    :return:
+    """
+    orders = lines = 0
+    start_time = time.perf_counter()
+    get_product = best_buy.get_product
+    for entry in read_journal(path):
+        for name, quantity in entry:
+            product = get_product(name)
+            if product is None:
+                raise ValueError(f"Journal refers to an unknown product: {name}")
+            product.set_quantity(product.get_quantity() - quantity)
+        orders += 1
+        lines += len(entry)
+    return orders, lines, time.perf_counter() - start_time
+
+
+def recover(snapshot_path, journal_path):
+    """
+    Rebuilds a store from its last snapshot and the orders recorded in the journal since then.
+    :param snapshot_path:
+    :param journal_path:
+    :return:
+    """
+    best_buy = snapshot.load_store(snapshot_path)
+    if os.path.exists(journal_path):
+        replay(best_buy, journal_path)
+    return best_buy
+
+
+def resume(best_buy, path, group_size=64, group_interval=0.05):
+    """
+    Replays a journal onto a store, if the journal file exists, then opens the journal and attaches
+    it to the store, so that the changes from now on are added to it. The store must be in the
+    state the journal started from: the last snapshot, or the catalog the program starts with.
+    Returns the OrderJournal, which should be closed when the program ends.
+    :raises ValueError: if the journal is corrupt or refers to a product that is not in the store.
+    :param best_buy:
+    :param path:
+    :param group_size:
+    :param group_interval:
+    :return:
+    """
+    if os.path.exists(path):
+        replay(best_buy, path)
+    order_journal = OrderJournal(path, group_size, group_interval)
+    order_journal.attach(best_buy)
+    return order_journal
+
+
+def checkpoint(best_buy, snapshot_path, journal):
+    """
+    Saves a new snapshot of the store and empties the journal. No order should be made while
+    the checkpoint runs, otherwise it could end up in neither of them.
+    :param best_buy:
+    :param snapshot_path:
+    :param journal:
+    :return: None
+    """
+    snapshot.save_store(best_buy, snapshot_path)
+    journal.truncate()
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("Usage: python journal.py SNAPSHOT JOURNAL")
+        sys.exit(1)
+    start_time = time.perf_counter()
+    best_buy = snapshot.load_store(sys.argv[1])
+    load_time = time.perf_counter() - start_time
+    orders, lines, seconds = replay(best_buy, sys.argv[2])
+    print(f"Snapshot loaded in {load_time:.3f}s ({len(best_buy.products)} products)")
+    print(f"Replayed {orders} orders ({lines} lines) in {seconds:.3f}s")
+    if seconds:
+        print(f"{orders / seconds:,.0f} orders/sec, {lines / seconds:,.0f} lines/sec")
+    print(f"Total of {best_buy.get_total_quantity()} item in store")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,22 @@
-import products
-import promotions
-import store
+"""
+Command line interface of the store.
+
+    python main.py                     interactive menu
+    python main.py list                prints the active products
+    python main.py total               prints the total quantity in store
+    python main.py order FILE          makes an order from a JSON file of [product, quantity] lines,
+                                       where product is a number of the listing or a product name
+    python main.py replay FILE         places the orders of a JSONL file, one order per line, in
+                                       chunks (see replay_orders()) [--results FILE] [--chunk-size N]
+Every command accepts --snapshot FILE, to load the catalog from a snapshot instead of the demo catalog,
+--journal FILE, to recover the stock from a journal of the orders and keep recording them in it, and
+--metrics FILE, to instrument the store (see metrics.py) and write the metrics to FILE on exit.
+
+The modules of the store are imported only when they are first needed, and the interactive menu
+is shown right away while the catalog loads in the background (see LazyStore), so that starting
+the program does not wait for a large catalog.
+"""
+import sys
 
 
 def display_menu():
@@ -50,19 +66,24 @@ def get_user_option(prompt, valid_options) -> int:
         display_menu()
 
 
+def iter_listing(best_buy):
+    """
+    Generator over the lines of the list of all the active products in the current store.
+    The lines are rendered one at a time, so nothing is built for the whole catalog.
+    :return:
+    """
+    yield "------"
+    for number, product in enumerate(best_buy.iter_products(), start=1):
+        yield f"{number}. {product.show()}"
+    yield "------"
+
+
 def list_all_products(best_buy) -> str:
     """
-    Prints the str of all the active products in the current store
+    Returns the str of all the active products in the current store
     :return:
     """
-    message = "------\n"
-    all_products = [product for product in best_buy.get_all_products()]
-    i = 1
-    for product in all_products:
-        message += f"{i}. {product.show()}\n"
-        i += 1
-    message += "------"
-    return message
+    return "\n".join(iter_listing(best_buy))
 
 
 def get_total_qty(best_buy) -> float:
@@ -70,35 +91,23 @@ def get_total_qty(best_buy) -> float:
     Displays the total quantity of all active products combined
     :return:
     """
-    all_products = [product for product in best_buy.get_all_products()]
-    total_qty = 0
-    for product in all_products:
-        total_qty += product.get_quantity()
-    return total_qty
+    return best_buy.get_total_quantity()
 
 
 def update_basket(product, product_quantity, basket) -> object:
     """
     Low-level method to update the basket when a user adds a product to the list of items
-    that they want to purchase.
+    that they want to purchase. If the product is already in the basket, the quantity is
+    added to its line.
     Caller: place_order()
+    :raises ValueError: if the line would hold more than the maximum allowed per customer.
     :param product:
     :param product_quantity:
     :param basket:
     :return:
     """
-    updated_basket = []
-    list_of_products = [item[0] for item in basket]
-    if product in list_of_products:
-        for item in basket:
-            if product == item[0]:
-                updated_basket.append((item[0], item[1] + product_quantity))
-            else:
-                updated_basket.append(item)
-    else:
-        basket.append((product, product_quantity))
-        updated_basket = basket.copy()
-    return updated_basket
+    basket.add(product, product_quantity)
+    return basket
 
 
 def has_enough_qty(basket) -> bool:
@@ -107,18 +116,11 @@ def has_enough_qty(basket) -> bool:
     :param basket:
     :return:
     """
-    for item in basket:
-        product = item[0]
-        quantity = item[1]
-        available_qty = product.get_quantity()
-        if isinstance(product, products.NonStockedProduct):
-            continue
-        elif isinstance(product, products.LimitedProduct):
-            if quantity > available_qty or quantity > product.maximum:
-                return False
-        else:
-            if quantity > available_qty:
-                return False
+    import store
+    try:
+        store.validate_order(basket)
+    except ValueError:
+        return False
     return True
 
 
@@ -127,8 +129,12 @@ def place_order(best_buy):
     Runs in a loop to allow a user to make a purchase.
     :return:
     """
+    import store
     product_list = best_buy.get_all_products()
-    basket = []
+    basket = store.Basket()
+    # Adding a product puts a hold on its stock, if the store keeps reservations
+    reservations = best_buy.reservations
+    cart = reservations.new_cart() if reservations else None
     print(list_all_products(best_buy))
     print("When you want to finish order, enter empty text.")
     while True:
@@ -139,33 +145,42 @@ def place_order(best_buy):
         if product_number or product_quantity:
             try:
                 product_number = int(product_number)
-                product_quantity = float(product_quantity)
+                product_quantity = int(product_quantity)
                 product = product_list[product_number - 1]
             except TypeError:
                 print("Error adding product!\n")
                 continue
+            except ValueError:
+                print("Error adding product!\n")
+                continue
             except IndexError:
                 print("Error adding product!\n")
                 continue
-            else:
-                if basket:
-                    basket = update_basket(product, product_quantity, basket)
-                else:
-                    basket = [(product, product_quantity)]
-                print("Product added to list!\n")
+            try:
+                if reservations:
+                    reservations.hold(cart, product, product_quantity)
+                update_basket(product, product_quantity, basket)
+            except ValueError as error:
+                print(f"Error adding product! {error}\n")
+                continue
+            print("Product added to list!\n")
         else:  # CHECKOUT
             if basket:
-                if has_enough_qty(basket):
-                    total_price = 0
-                    total_price += best_buy.order(basket)
-                    print("********")
-                    print(f"Order made! Total payment: {total_price}")
-                    return
-                else:
+                try:
+                    total_price = best_buy.order(basket, cart=cart)
+                except ValueError:
+                    if reservations:
+                        reservations.release(cart)
                     # Not enough quantity of at least one product in store.
                     # No purchase made. Display error message and return to main menu!
                     print("Error while making order! Quantity larger than what exists")
                     return
+                print("********")
+                if best_buy.cents:
+                    import money
+                    total_price = money.format_cents(total_price)
+                print(f"Order made! Total payment: {total_price}")
+                return
             else:  # Basket is empty. Return to main menu!
                 print("There is no item to checkout!")
                 return
@@ -181,7 +196,8 @@ def start(best_buy, valid_options):
         display_menu()
         option = get_user_option("Please choose a number: ", valid_options)
         if option == 1:  # 1. List all products in store
-            print(list_all_products(best_buy))
+            for line in iter_listing(best_buy):
+                print(line)
         elif option == 2:  # 2. Show total amount in store
             print(f"Total of {get_total_qty(best_buy)} item in store")
         elif option == 3:  # 3. Make an order
@@ -193,7 +209,15 @@ def start(best_buy, valid_options):
             continue
 
 
-def main():
+def build_store():
+    """
+    Creates the store with the initial stock of inventory and the promotion catalog.
+    :return:
+    """
+    import products
+    import promotions
+    import store
+
     # setup initial stock of inventory
     product_list = [products.Product("MacBook Air M2", price=1450, quantity=100),
                     products.Product("Bose QuietComfort Earbuds", price=250, quantity=500),
@@ -212,13 +236,311 @@ def main():
     product_list[0].set_promotion(second_half_price)
     product_list[1].set_promotion(third_one_free)
     product_list[3].set_promotion(thirty_percent)
+    return best_buy
+
+
+class LazyStore:
+    """
+    Stands for a store that is built on first use: every attribute is looked up on the store,
+    which is built by loader() the first time it is needed. With background=True the store is
+    built in a background thread right away, and the first use only waits for it to be ready.
+    An exception raised by the loader is raised again on every use.
+    """
+
+    def __init__(self, loader, background=False):
+        import threading
+        self._loader = loader
+        self._store = None
+        self._error = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        if background:
+            threading.Thread(target=self._load, name="store-loader", daemon=True).start()
+
+    def _load(self):
+        with self._lock:
+            if self._ready.is_set():
+                return
+            try:
+                self._store = self._loader()
+            except Exception as error:
+                self._error = error
+            finally:
+                self._ready.set()
+
+    def is_loaded(self) -> bool:
+        return self._ready.is_set()
+
+    def get_store(self):
+        """
+        Returns the store, building it (or waiting for the background thread to build it) if needed.
+        :return:
+        """
+        if not self._ready.is_set():
+            self._load()
+        if self._error is not None:
+            raise self._error
+        return self._store
+
+    def __getattr__(self, name):
+        return getattr(self.get_store(), name)
+
+
+def open_store(snapshot_path=None, journal_path=None):
+    """
+    Builds the store: from a snapshot file if a path is given, else the demo catalog. With a
+    journal file, the stock changes recorded in it are replayed onto the store, and the changes
+    from now on are recorded in it (see journal.resume()); the journal is closed at exit.
+    :param snapshot_path:
+    :param journal_path:
+    :return:
+    """
+    if snapshot_path:
+        import snapshot
+        best_buy = snapshot.load_store(snapshot_path)
+    else:
+        best_buy = build_store()
+    if journal_path:
+        import atexit
+        import journal
+        atexit.register(journal.resume(best_buy, journal_path).close)
+    return best_buy
+
+
+def _store_loader(snapshot_path=None, journal_path=None):
+    """
+    Returns a function that builds the store with open_store().
+    """
+    return lambda: open_store(snapshot_path, journal_path)
+
 
+def _resolve_lines(best_buy, lines, product_list) -> list:
+    """
+    Turns [product, quantity] lines into (Product, quantity) tuples, where product is a number of
+    product_list (from 1, like the listing) or a product name.
+    :raises ValueError: if a line is not valid or a product does not exist.
+    """
+    import store
+    shopping_list = []
+    for line in lines:
+        if not isinstance(line, (list, tuple)) or len(line) != 2:
+            raise ValueError(f"Not a [product, quantity] line: {line!r}")
+        product_id, quantity = line
+        if not store.is_valid_quantity(quantity):
+            raise ValueError(f"Not a valid quantity: {quantity!r}")
+        # A bool is an int too, but true is not product number 1
+        if type(product_id) is int:
+            if not 1 <= product_id <= len(product_list):
+                raise ValueError(f"Unknown product number: {product_id}")
+            product = product_list[product_id - 1]
+        elif isinstance(product_id, str):
+            product = best_buy.get_product(product_id)
+            if product is None:
+                raise ValueError(f"Unknown product: {product_id}")
+        else:
+            raise ValueError(f"Not a product number or name: {product_id!r}")
+        shopping_list.append((product, quantity))
+    return shopping_list
+
+
+def _read_order(best_buy, path) -> list:
+    """
+    Reads an order file: a JSON list of [product, quantity] lines, where product is a number of
+    the listing (from 1) or a product name.
+    :raises ValueError: if the file is not valid or a product does not exist.
+    """
+    import json
+    if path == "-":
+        lines = json.load(sys.stdin)
+    else:
+        with open(path, encoding="utf-8") as file:
+            lines = json.load(file)
+    return _resolve_lines(best_buy, lines, best_buy.get_all_products())
+
+
+def _parse_replay_line(best_buy, text, product_list) -> tuple:
+    """
+    Parses one order of a replay file. Returns a tuple (order id, shopping list, error).
+    """
+    import json
+    order_id = None
+    try:
+        order = json.loads(text)
+        if isinstance(order, dict):
+            order_id = order.get("id")
+            order = order.get("lines")
+        if not isinstance(order, list) or not order:
+            raise ValueError("An order needs at least one [product, quantity] line!")
+        return order_id, _resolve_lines(best_buy, order, product_list), None
+    except ValueError as error:
+        return order_id, None, str(error)
+
+
+def _replay_chunk(best_buy, chunk, report, results_file):
+    """
+    Places the valid orders of a chunk in one batch, and writes the result of every order.
+    """
+    import json
+    valid = [shopping_list for _, _, shopping_list, error in chunk if error is None]
+    outcomes = iter(best_buy.process_orders(valid))
+    for line_number, order_id, shopping_list, error in chunk:
+        total_price = None
+        if error is None:
+            total_price, error = next(outcomes)
+            report["lines"] += len(shopping_list)
+        report["orders"] += 1
+        report["made" if error is None else "failed"] += 1
+        if results_file:
+            result = {"line": line_number}
+            if order_id is not None:
+                result["id"] = order_id
+            if error is None:
+                result.update(ok=True, total=total_price)
+            else:
+                result.update(ok=False, error=error)
+            results_file.write(json.dumps(result) + "\n")
+
+
+def replay_orders(best_buy, path, results_path=None, chunk_size=1000) -> dict:
+    """
+    Places the orders of a JSONL file, one order per line: either a list of [product, quantity]
+    lines, or an object {"id": ..., "lines": [...]}. Products are numbers of the listing when the
+    replay starts (from 1) or product names. The orders are placed in chunks of chunk_size with
+    Store.process_orders(), so each order gets the same checks as has_enough_qty() and
+    Store.order(), and a failing order does not stop the replay.
+    Returns a dict with the number of orders, of lines (of the orders that could be parsed),
+    of orders made and failed, and the time it took.
+    :param best_buy:
+    :param path:
+    :param results_path: JSONL file where the result of every order is written (not written if None).
+    :param chunk_size:
+    :return:
+    """
+    import time
+    report = {"orders": 0, "lines": 0, "made": 0, "failed": 0}
+    start_time = time.perf_counter()
+    product_list = best_buy.get_all_products()
+    results_file = open(results_path, "w", encoding="utf-8") if results_path else None
+    try:
+        with open(path, encoding="utf-8") as file:
+            chunk = []
+            for line_number, text in enumerate(file, start=1):
+                if not text.strip():
+                    continue
+                chunk.append((line_number, *_parse_replay_line(best_buy, text, product_list)))
+                if len(chunk) >= chunk_size:
+                    _replay_chunk(best_buy, chunk, report, results_file)
+                    chunk = []
+            if chunk:
+                _replay_chunk(best_buy, chunk, report, results_file)
+    finally:
+        if results_file:
+            results_file.close()
+    report["seconds"] = time.perf_counter() - start_time
+    return report
+
+
+def run_command(argv) -> int:
+    """
+    Runs a non-interactive command (see the module documentation) and returns the exit code.
+    :param argv: the command line arguments, without the program name.
+    :return:
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog="main.py", description="Best Buy store")
+    parser.add_argument("--snapshot", help="load the catalog from this snapshot file")
+    parser.add_argument("--journal", help="recover the stock from this journal file, and record the orders in it")
+    parser.add_argument("--metrics", help="record metrics, and write them to this file on exit "
+                                          "(Prometheus text if it ends with .prom, else JSON)")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("menu", help="interactive menu (default)")
+    commands.add_parser("list", help="print the active products")
+    commands.add_parser("total", help="print the total quantity in store")
+    order_parser = commands.add_parser("order", help="make an order from a JSON file ('-' for stdin)")
+    order_parser.add_argument("file")
+    replay_parser = commands.add_parser("replay", help="place the orders of a JSONL file")
+    replay_parser.add_argument("file")
+    replay_parser.add_argument("--results", help="JSONL file for the result of every order")
+    replay_parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+    if not args.metrics:
+        return _run(args)
+
+    import metrics
+    # The running module, which is __main__ and not "main" when started with python main.py
+    metrics.enable(sys.modules[__name__])
+    try:
+        return _run(args)
+    finally:
+        metrics.disable()
+        with open(args.metrics, "w", encoding="utf-8") as file:
+            file.write(metrics.to_prometheus() if args.metrics.endswith(".prom") else metrics.to_json())
+
+
+def _run(args) -> int:
+    if args.command in (None, "menu"):
+        return run_menu(args.snapshot, args.journal)
+    best_buy = open_store(args.snapshot, args.journal)
+    if args.command == "list":
+        for line in iter_listing(best_buy):
+            print(line)
+    elif args.command == "total":
+        print(f"Total of {get_total_qty(best_buy)} item in store")
+    elif args.command == "order":
+        try:
+            total_price = best_buy.order(_read_order(best_buy, args.file))
+        except (OSError, ValueError, TypeError) as error:
+            print(f"Error while making order! {error}")
+            return 1
+        if best_buy.cents:
+            import money
+            total_price = money.format_cents(total_price)
+        print(f"Order made! Total payment: {total_price}")
+    elif args.command == "replay":
+        try:
+            report = replay_orders(best_buy, args.file, args.results, args.chunk_size)
+        except OSError as error:
+            print(f"Error while replaying orders! {error}")
+            return 1
+        print(f"{report['orders']} orders ({report['lines']} lines) in {report['seconds']:.2f}s: "
+              f"{report['made']} made, {report['failed']} failed")
+        if report["seconds"]:
+            print(f"{report['orders'] / report['seconds']:,.0f} orders/sec, "
+                  f"{report['lines'] / report['seconds']:,.0f} lines/sec")
+    return 0
+
+
+def run_menu(snapshot_path=None, journal_path=None) -> int:
+    """
+    Runs the interactive menu. The menu is shown right away; the catalog loads in the background.
+    :param snapshot_path:
+    :param journal_path:
+    :return:
+    """
+    load = _store_loader(snapshot_path, journal_path)
+
+    def load_with_reservations():
+        import reservations
+        best_buy = load()
+        best_buy.set_reservations(reservations.ReservationManager())
+        return best_buy
+
+    best_buy = LazyStore(load_with_reservations, background=True)
     valid_options = [1, 2, 3, 4]
     try:
         start(best_buy, valid_options)
     except KeyboardInterrupt:
         goodbye()
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # The interactive menu does not need the argument parser
+    if not argv:
+        return run_menu()
+    return run_command(argv)
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,205 @@
+"""
+Optional instrumentation of the hot paths of the store.
+
+metrics.enable() wraps Store.order, Store.get_all_products, the buy() methods of the products,
+the apply_promotion() methods of the promotions and the actions of the main menu, so that they
+record their call counts and latencies. The ValueError raised when an order or a purchase is
+refused (not enough stock, maximum per customer, ...) is counted as a stock-out rejection, and
+every purchase records whether a promotion applied to it.
+metrics.disable() puts the original methods back: when the instrumentation is disabled there is
+no overhead at all.
+
+The data can be exported as a Prometheus text snapshot (to_prometheus()) or as JSON (to_json()).
+"""
+import bisect
+import functools
+import inspect
+import json
+import threading
+import sys
+import time
+
+import products
+import promotions
+import store
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2, 5e-2, 0.1, 0.5, 1.0, 5.0)
+
+_lock = threading.Lock()
+_originals = []
+_calls = {}
+_rejections = {}
+_latencies = {}
+_promotion_hits = {}
+_purchases = [0, 0]  # [purchases, purchases with a promotion]
+
+
+def _record(operation, elapsed, rejected=False):
+    with _lock:
+        _calls[operation] = _calls.get(operation, 0) + 1
+        if rejected:
+            _rejections[operation] = _rejections.get(operation, 0) + 1
+        histogram = _latencies.get(operation)
+        if histogram is None:
+            # One count per bucket, plus the +Inf bucket, and the sum of all latencies
+            histogram = _latencies[operation] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+        histogram[0][bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        histogram[1] += elapsed
+
+
+def _record_purchase(product):
+    promotion = product.promotion
+    with _lock:
+        _purchases[0] += 1
+        if promotion:
+            _purchases[1] += 1
+            _promotion_hits[promotion.name] = _promotion_hits.get(promotion.name, 0) + 1
+
+
+def _timed(operation, function, purchase=False):
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def timed_generator(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                yield from function(*args, **kwargs)
+            finally:
+                _record(operation, time.perf_counter() - start_time)
+        return timed_generator
+
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except ValueError:
+            _record(operation, time.perf_counter() - start_time, rejected=True)
+            raise
+        _record(operation, time.perf_counter() - start_time)
+        if purchase:
+            _record_purchase(args[0])
+        return result
+    return timed
+
+
+def _patch(owner, attribute, operation, purchase=False):
+    original = owner.__dict__[attribute]
+    _originals.append((owner, attribute, original))
+    setattr(owner, attribute, _timed(operation, original, purchase))
+
+
+def _promotion_classes(cls=promotions.Promotion):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _promotion_classes(subclass)
+
+
+def enable(cli=None):
+    """
+    Starts recording. Promotion classes are instrumented if they are defined when this is called.
+    :param cli: the module of the main menu whose actions are instrumented. It must be the module
+    that runs them: with "python main.py" that is __main__, not the main module an import would give.
+    By default the running __main__ if it is main.py, else main.
+    :return: None
+    """
+    if _originals:
+        return
+    if cli is None:
+        cli = sys.modules.get("__main__")
+        if not hasattr(cli, "place_order"):
+            import main as cli
+    _patch(store.Store, "order", "Store.order")
+    _patch(store.Store, "get_all_products", "Store.get_all_products")
+    for product_class in (products.Product, products.NonStockedProduct, products.LimitedProduct):
+        if "buy" in product_class.__dict__:
+            _patch(product_class, "buy", f"{product_class.__name__}.buy", purchase=True)
+    for promotion_class in _promotion_classes():
+        if "apply_promotion" in promotion_class.__dict__:
+            _patch(promotion_class, "apply_promotion", f"{promotion_class.__name__}.apply_promotion")
+    for action in ("iter_listing", "list_all_products", "get_total_qty", "place_order"):
+        _patch(cli, action, f"main.{action}")
+
+
+def disable():
+    """
+    Stops recording and restores the original methods. The data recorded so far is kept.
+    :return: None
+    """
+    while _originals:
+        owner, attribute, original = _originals.pop()
+        setattr(owner, attribute, original)
+
+
+def is_enabled() -> bool:
+    return bool(_originals)
+
+
+def reset():
+    """
+    Forgets all the data recorded so far.
+    :return: None
+    """
+    with _lock:
+        _calls.clear()
+        _rejections.clear()
+        _latencies.clear()
+        _promotion_hits.clear()
+        _purchases[:] = [0, 0]
+
+
+def snapshot() -> dict:
+    """
+    Returns a copy of all the data recorded so far, as JSON friendly dicts.
+    :return:
+    """
+    with _lock:
+        purchases, promoted = _purchases
+        return {
+            "calls": dict(_calls),
+            "stock_out_rejections": dict(_rejections),
+            "latency": {operation: {"buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"],
+                                                        counts)),
+                                    "sum": total, "count": sum(counts)}
+                        for operation, (counts, total) in _latencies.items()},
+            "promotions": {"purchases": purchases, "with_promotion": promoted,
+                           "hit_rate": promoted / purchases if purchases else 0.0,
+                           "hits": dict(_promotion_hits)},
+        }
+
+
+def to_json() -> str:
+    return json.dumps(snapshot(), indent=2)
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(prefix="bestbuy") -> str:
+    """
+    Returns the data recorded so far in the Prometheus text exposition format.
+    :param prefix:
+    :return:
+    """
+    data = snapshot()
+    lines = [f"# TYPE {prefix}_calls_total counter"]
+    lines += [f'{prefix}_calls_total{{operation="{_label(operation)}"}} {count}'
+              for operation, count in data["calls"].items()]
+    lines.append(f"# TYPE {prefix}_stock_out_rejections_total counter")
+    lines += [f'{prefix}_stock_out_rejections_total{{operation="{_label(operation)}"}} {count}'
+              for operation, count in data["stock_out_rejections"].items()]
+    lines.append(f"# TYPE {prefix}_latency_seconds histogram")
+    for operation, histogram in data["latency"].items():
+        cumulative = 0
+        for bound, count in histogram["buckets"].items():
+            cumulative += count
+            lines.append(f'{prefix}_latency_seconds_bucket{{operation="{_label(operation)}",le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_latency_seconds_sum{{operation="{_label(operation)}"}} {histogram["sum"]}')
+        lines.append(f'{prefix}_latency_seconds_count{{operation="{_label(operation)}"}} {histogram["count"]}')
+    lines.append(f"# TYPE {prefix}_promotion_hits_total counter")
+    lines += [f'{prefix}_promotion_hits_total{{promotion="{_label(name)}"}} {count}'
+              for name, count in data["promotions"]["hits"].items()]
+    lines.append(f"# TYPE {prefix}_promotion_hit_ratio gauge")
+    lines.append(f'{prefix}_promotion_hit_ratio {data["promotions"]["hit_rate"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,48 @@
+"""
+Exact money amounts as integer cents.
+
+Prices are stored as floats on the products (e.g. 99.99), which is fine to display but drifts when
+many prices are added up. In cents mode (see Store(products, cents=True)) every price is converted
+once to an int number of cents, the promotions price the lines with integer arithmetic
+(Promotion.apply_promotion_cents()), and the totals are sums of ints, which are exact.
+Amounts are rounded to the nearest cent, half up.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+CENT = Decimal("0.01")
+
+
+def to_cents(amount) -> int:
+    """
+    Converts an amount (int, float, Decimal or str) to an int number of cents.
+    :param amount:
+    :return:
+    """
+    if isinstance(amount, int):
+        return amount * 100
+    if isinstance(amount, float):
+        # Exact for every float that stands for an amount with at most 2 decimals
+        return round(amount * 100)
+    return int(Decimal(amount).quantize(CENT, ROUND_HALF_UP) * 100)
+
+
+def to_decimal(cents) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+
+def format_cents(cents) -> str:
+    sign = "-" if cents < 0 else ""
+    units, cents = divmod(abs(cents), 100)
+    return f"{sign}{units}.{cents:02d}"
+
+
+def divide(numerator, denominator) -> int:
+    """
+    Integer division rounded to the nearest int, half up (away from zero for negative numbers).
+    :param numerator:
+    :param denominator: a positive int.
+    :return:
+    """
+    if numerator < 0:
+        return -divide(-numerator, denominator)
+    return (2 * numerator + denominator) // (2 * denominator)
@@ -3,10 +3,41 @@ Product class is the parent class which is extended by two classes:
 a) NonStockedProduct - non-physical products such as (digital license) Microsoft Windows license
                          should always have their quantity set to 0 but active.
 b) LimitedProduct - this can only be purchased once e.g. delivery charge, etc.
+
+Every product has its own lock, so that several checkout workers can share the same products.
+The classes use __slots__ to keep the memory footprint of a large catalog small. For even larger
+catalogs, see columnar.ProductTable.
 """
+import math
+import threading
+
+import money
+
+# Maximum number of quantities for which a product keeps its quoted price
+QUOTE_CACHE_SIZE = 64
+
+
+def validate_product(name, price, quantity):
+    """
+    Checks the arguments of a new product. Used by the Product constructor, and by anything that
+    needs to validate product data before creating the products (e.g. the catalog ingestion).
+    :raises ValueError: if an argument is blank, or if price or quantity is a negative or non-finite number.
+    :param name:
+    :param price:
+    :param quantity:
+    :return: None
+    """
+    if not name or not price or (not quantity and quantity < 0):
+        raise ValueError("Required parameter: Argument cannot be blank!")
+    elif not math.isfinite(price) or not math.isfinite(quantity):
+        raise ValueError("Price and/or quantity must be a finite number!")
+    elif price < 0 or quantity < 0:
+        raise ValueError("Price and/or quantity cannot be a negative number!")
 
 
 class Product:
+    __slots__ = ("lock", "listeners", "name", "price", "quantity", "promotion", "active", "_quote_cache",
+                 "_show_cache")
 
     def __init__(self, name, price, quantity, promotion=None):
         """
@@ -17,23 +48,102 @@ class Product:
         :param price:
         :param quantity:
         """
-        if not name or not price or (not quantity and quantity < 0):
-            raise ValueError("Required parameter: Argument cannot be blank!")
-        elif price < 0 or quantity < 0:
-            raise ValueError("Price and/or quantity cannot be a negative number!")
-        else:
-            self.name = name
-            self.price = price
-            self.quantity = quantity
-            self.promotion = promotion
-            self.active = True
-            # self.active = True if quantity > 0 else False
+        validate_product(name, price, quantity)
+        self.lock = threading.RLock()
+        self.listeners = ()
+        self.name = name
+        self.price = price
+        self.quantity = quantity
+        self.promotion = promotion
+        self.active = True
+        self._quote_cache = None
+        self._show_cache = None
+        # self.active = True if quantity > 0 else False
+
+    def __getstate__(self):
+        """
+        Products can be pickled (e.g. to be sent to another process). The lock, the listeners and
+        the caches are not part of the state: the copy gets a new lock and no listeners.
+        :return:
+        """
+        return {"name": self.name, "price": self.price, "quantity": self.quantity,
+                "promotion": self.promotion, "active": self.active,
+                "maximum": getattr(self, "maximum", None)}
+
+    def __setstate__(self, state):
+        self.lock = threading.RLock()
+        self.listeners = ()
+        self._quote_cache = None
+        self._show_cache = None
+        for field, value in state.items():
+            if field != "maximum" or isinstance(self, LimitedProduct):
+                setattr(self, field, value)
+
+    def add_listener(self, listener):
+        """
+        Registers a callable that gets notified every time the state of this product changes.
+        The listener is called as listener(product, field, old_value, new_value). Every purchase
+        is also notified, as the field "sale" with the quantity bought as the new value.
+        Listeners are kept in a tuple which is replaced (never changed in place), so that a product
+        without listeners stays small and notify() can run while a listener is added.
+        :param listener:
+        :return: None
+        """
+        self.listeners = self.listeners + (listener,)
+
+    def remove_listener(self, listener):
+        """
+        Unregisters a listener previously added with add_listener().
+        :raises ValueError: if the listener was never registered.
+        :param listener:
+        :return: None
+        """
+        listeners = list(self.listeners)
+        listeners.remove(listener)
+        self.listeners = tuple(listeners)
+
+    def notify(self, field, old_value, new_value):
+        """
+        Low-level method to let every registered listener know that a field has changed.
+        :param field:
+        :param old_value:
+        :param new_value:
+        :return: None
+        """
+        for listener in self.listeners:
+            listener(self, field, old_value, new_value)
 
     def get_promotion(self) -> object:
         return self.promotion
 
     def set_promotion(self, promotion):
-        self.promotion = promotion
+        with self.lock:
+            old_promotion = self.promotion
+            self.promotion = promotion
+            self._quote_cache = None
+            self._show_cache = None
+            if self.listeners:
+                self.notify("promotion", old_promotion, promotion)
+
+    def get_price(self) -> float:
+        return self.price
+
+    def set_price(self, new_price):
+        """
+        Setter method to change the price of the product.
+        :raises ValueError: if the new price is a negative number.
+        :param new_price:
+        :return: None
+        """
+        if new_price < 0:
+            raise ValueError("Price cannot be a negative number!")
+        with self.lock:
+            old_price = self.price
+            self.price = new_price
+            self._quote_cache = None
+            self._show_cache = None
+            if self.listeners:
+                self.notify("price", old_price, new_price)
 
     def get_quantity(self) -> float:
         return self.quantity
@@ -45,41 +155,125 @@ class Product:
         :param new_quantity:
         :return: None
         """
-        self.quantity = new_quantity
-        if self.quantity == 0:
-            self.deactivate()
-        else:  # if we decide to add a feature to re-stock in the future
-            self.activate()
+        with self.lock:
+            old_quantity = self.quantity
+            self.quantity = new_quantity
+            self._show_cache = None
+            if self.listeners:
+                self.notify("quantity", old_quantity, new_quantity)
+            if self.quantity == 0:
+                self.deactivate()
+            else:  # if we decide to add a feature to re-stock in the future
+                self.activate()
 
     def is_active(self) -> bool:
         return self.active
 
     def activate(self):
-        self.active = True
+        if not self.active:
+            self.active = True
+            if self.listeners:
+                self.notify("active", False, True)
 
     def deactivate(self):
-        self.active = False
+        if self.active:
+            self.active = False
+            if self.listeners:
+                self.notify("active", True, False)
 
-    def buy(self, quantity) -> float:
+    def check_purchase(self, quantity):
+        """
+        Checks that a purchase can be made, without making it. Nothing is changed by this method.
+        :raises ValueError: if available quantity less than quantity the buyer wants to purchase.
+        :param quantity:
+        :return: None
+        """
+        if quantity > self.quantity:
+            raise ValueError(f"There is not enough in stock. Available quantity = {self.quantity}")
+
+    def buy(self, quantity, cents=False) -> float:
         """
         Method to make a purchase. The product quantity updates once a purchase is made. The total
         price is returned by this method and raises ValueError if a buyer tries to purchase more
-        than the quantity in stock.
+        than the quantity in stock. The check, the update and the pricing are made while holding the
+        lock of the product, so two buyers can never both get the last unit, and the price charged is
+        the one in force when the stock was taken.
         :raises ValueError: if available quantity less than quantity the buyer wants to purchase.
         :param quantity:
+        :param cents: return the total price in integer cents (see quote_cents()).
         :return:
         """
-        if quantity > self.quantity:
-            raise ValueError(f"There is not enough in stock. Available quantity = {self.quantity}")
-        else:
+        with self.lock:
+            self.check_purchase(quantity)
             self.set_quantity(self.quantity - quantity)
-            if self.promotion:
-                total_price = self.promotion.apply_promotion(self, quantity)
-            else:
-                total_price = self.price * quantity
+            if self.listeners:
+                self.notify("sale", 0, quantity)
+            return self.quote_cents(quantity) if cents else self.quote(quantity)
+
+    def quote(self, quantity) -> float:
+        """
+        Returns the total price of the given quantity, with the promotion applied, without buying
+        anything. The stock is neither checked nor changed. Quotes are cached per quantity, so
+        the cache is effectively keyed by (product, promotion, quantity); it is dropped every time
+        set_price() or set_promotion() is called. Prices of promotions that are not cacheable
+        (see Promotion.cacheable) are never cached.
+        :param quantity:
+        :return:
+        """
+        promotion = self.promotion
+        if promotion and not getattr(promotion, "cacheable", True):
+            return promotion.apply_promotion(self, quantity)
+        cache = self._quote_cache
+        if cache is None:
+            cache = self._quote_cache = {}
+        elif quantity in cache:
+            return cache[quantity]
+        if promotion:
+            total_price = promotion.apply_promotion(self, quantity)
+        else:
+            total_price = self.price * quantity
+        if len(cache) >= QUOTE_CACHE_SIZE:
+            cache.clear()
+        cache[quantity] = total_price
         return total_price
 
+    def quote_cents(self, quantity) -> int:
+        """
+        Same as quote(), but the price is exact: it is computed in integer cents (see money) and
+        returned as an int number of cents. Shares the cache of quote().
+        :param quantity:
+        :return:
+        """
+        promotion = self.promotion
+        if promotion and not getattr(promotion, "cacheable", True):
+            return promotion.apply_promotion_cents(money.to_cents(self.price), quantity)
+        key = ("cents", quantity)
+        cache = self._quote_cache
+        if cache is None:
+            cache = self._quote_cache = {}
+        elif key in cache:
+            return cache[key]
+        if promotion:
+            total_cents = promotion.apply_promotion_cents(money.to_cents(self.price), quantity)
+        else:
+            total_cents = money.to_cents(self.price) * quantity
+        if len(cache) >= QUOTE_CACHE_SIZE:
+            cache.clear()
+        cache[key] = total_cents
+        return total_cents
+
     def show(self) -> str:
+        """
+        Returns the description of the product. The text is cached until the price, the quantity
+        or the promotion of the product changes.
+        :return:
+        """
+        text = self._show_cache
+        if text is None:
+            text = self._show_cache = self.render()
+        return text
+
+    def render(self) -> str:
         if self.promotion:
             return f"{self.name}, Price: {self.price}, Quantity: {self.quantity}, " \
                    f"Promotion: {self.promotion.name}"
@@ -93,6 +287,7 @@ class NonStockedProduct(Product):
     For example - a Microsoft Windows license. On these products, the quantity should be set to
     zero and always stay that way.
     """
+    __slots__ = ()
 
     def __init__(self, name, price):
         super().__init__(name, price, 0)
@@ -109,19 +304,27 @@ class NonStockedProduct(Product):
         # Chose option B
         self.quantity = 0
 
-    def buy(self, quantity) -> float:
+    def check_purchase(self, quantity):
+        """
+        :Override: This class allows unlimited purchases, so any quantity can be bought.
+        :param quantity:
+        :return: None
+        """
+        pass
+
+    def buy(self, quantity, cents=False) -> float:
         """
         :Override: This class should allow unlimited purchases even when the quantity is always 0
         :param quantity:
+        :param cents:
         :return:
         """
-        if self.promotion:
-            total_price = self.promotion.apply_promotion(self, quantity)
-        else:
-            total_price = self.price * quantity
-        return total_price
+        with self.lock:
+            if self.listeners:
+                self.notify("sale", 0, quantity)
+            return self.quote_cents(quantity) if cents else self.quote(quantity)
 
-    def show(self) -> str:
+    def render(self) -> str:
         if self.promotion:
             return f"{self.name}, Price: {self.price}, Promotion: {self.promotion.name}"
         else:
@@ -133,34 +336,26 @@ class LimitedProduct(Product):
     Some products can only be purchased X times in an order. For example - a shipping fee can only be added once.
     If an order is attempted with quantity larger than the maximum one, it should be refused with an exception.
     """
+    __slots__ = ("maximum",)
 
     def __init__(self, name, price, quantity, maximum):
         super().__init__(name, price, quantity)
         self.maximum = maximum
 
-    def buy(self, purchase_qty) -> float:
+    def check_purchase(self, purchase_qty):
         """
-        Method to make a purchase. The product quantity updates once a purchase is made. The total
-        price is returned by this method and raises ValueError if a buyer tries to purchase more
-        than the quantity in stock.
+        :Override: Also checks the maximum quantity allowed per customer.
         :raises ValueError: if available quantity less than quantity the buyer wants to purchase
         OR, if a buyer wants to purchase more than the maximum allowed per customer.
         :param purchase_qty:
-        :return:
+        :return: None
         """
         if self.quantity < purchase_qty <= self.maximum:
             raise ValueError(f"There is not enough in stock. Available quantity = {self.quantity}")
         elif purchase_qty > self.maximum:
             raise ValueError(f"A maximum of {self.maximum} units allowed per customer.")
-        else:
-            self.set_quantity(self.quantity - purchase_qty)
-            if self.promotion:
-                total_price = self.promotion.apply_promotion(self, purchase_qty)
-            else:
-                total_price = self.price * purchase_qty
-        return total_price
 
-    def show(self) -> str:
+    def render(self) -> str:
         if self.promotion:
             return f"{self.name}, Price: {self.price}, Quantity: {self.quantity}, " \
                    f"Maximum: {self.maximum}, Promotion: {self.promotion.name}"
@@ -176,12 +371,6 @@ class LimitedProduct(Product):
     def set_name(self, new_name):
         self.name = new_name
 
-    def get_price(self):
-        return self.price
-
-    def set_price(self, new_price):
-        self.price = new_price
-
     def sell(self, amount):
         self.quantity -= amount
 """
\ No newline at end of file
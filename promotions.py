@@ -1,10 +1,16 @@
 from abc import ABC, abstractmethod
+from types import SimpleNamespace
+
+import money
 
 
 class Promotion(ABC):
     """
     Promotion is an abstract class from which all other promotions will be derived.
+    A promotion whose price can change over time (e.g. during a flash sale) sets cacheable to
+    False, so that products do not cache the prices it returns.
     """
+    cacheable = True
 
     @abstractmethod
     def __init__(self, name):
@@ -22,6 +28,29 @@ class Promotion(ABC):
             """
         pass
 
+    def apply_promotion_bulk(self, prices, quantities) -> list:
+        """
+        Prices many (price, quantity) lines in one call and returns the list of discounted prices.
+        The results are identical to calling apply_promotion() on each line.
+        Child classes override this method with a tight loop over the formula of the promotion.
+        :param prices:
+        :param quantities:
+        :return:
+        """
+        return [self.apply_promotion(SimpleNamespace(price=price), quantity)
+                for price, quantity in zip(prices, quantities)]
+
+    def apply_promotion_cents(self, price_cents, quantity) -> int:
+        """
+        Same as apply_promotion(), with the unit price and the result in integer cents (see money).
+        This default prices the line with apply_promotion() and rounds the result to the cent;
+        child classes override it with exact integer arithmetic.
+        :param price_cents:
+        :param quantity:
+        :return:
+        """
+        return money.to_cents(self.apply_promotion(SimpleNamespace(price=price_cents / 100), quantity))
+
 
 class PercentDiscount(Promotion):
     """
@@ -31,6 +60,8 @@ class PercentDiscount(Promotion):
     def __init__(self, name, percent):
         self.name = name
         self.percent = percent
+        # Share of the price that is paid, in hundredths of a percent, for apply_promotion_cents()
+        self._kept = 10000 - round(percent * 100)
 
     def apply_promotion(self, product, quantity) -> float:
         """
@@ -41,6 +72,15 @@ class PercentDiscount(Promotion):
         """
         return round((product.price * (1 - (self.percent / 100))) * quantity)
 
+    def apply_promotion_bulk(self, prices, quantities) -> list:
+        factor = 1 - (self.percent / 100)
+        return [round((price * factor) * quantity) for price, quantity in zip(prices, quantities)]
+
+    def apply_promotion_cents(self, price_cents, quantity) -> int:
+        # Exact for percents with up to 2 decimals, rounded to the cent (not to whole units).
+        # Same rounding as money.divide(), inlined: prices and quantities are never negative
+        return (2 * price_cents * quantity * self._kept + 10000) // 20000
+
 
 class SecondHalfPrice(Promotion):
     """
@@ -65,6 +105,15 @@ class SecondHalfPrice(Promotion):
         """
         return (product.price * 0.5 * valid_qty) + (product.price * (quantity - valid_qty))
 
+    def apply_promotion_bulk(self, prices, quantities) -> list:
+        return [(price * 0.5 * (quantity // 2)) + (price * (quantity - quantity // 2))
+                for price, quantity in zip(prices, quantities)]
+
+    def apply_promotion_cents(self, price_cents, quantity) -> int:
+        # Half of the discounted items is taken off, rounded down: the line is rounded half up
+        # like money.divide()
+        return price_cents * quantity - price_cents * (quantity // 2) // 2
+
 
 class ThirdOneFree(Promotion):
     """
@@ -83,3 +132,26 @@ class ThirdOneFree(Promotion):
         """
         valid_qty = quantity // 3  # The promotion only applies to every third item
         return product.price * (quantity - valid_qty)
+
+    def apply_promotion_bulk(self, prices, quantities) -> list:
+        return [price * (quantity - quantity // 3) for price, quantity in zip(prices, quantities)]
+
+    def apply_promotion_cents(self, price_cents, quantity) -> int:
+        return price_cents * (quantity - quantity // 3)
+
+
+def apply_promotions_bulk(groups) -> dict:
+    """
+    Prices many basket lines at once. The lines are grouped by promotion: groups maps each
+    promotion (or None for no promotion) to a tuple (prices, quantities). Returns a dict that
+    maps the same keys to the list of prices of their lines.
+    :param groups:
+    :return:
+    """
+    totals = {}
+    for promotion, (prices, quantities) in groups.items():
+        if promotion:
+            totals[promotion] = promotion.apply_promotion_bulk(prices, quantities)
+        else:
+            totals[promotion] = [price * quantity for price, quantity in zip(prices, quantities)]
+    return totals
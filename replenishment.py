@@ -0,0 +1,320 @@
+"""
+Replenishment of the stock, driven by the sales velocity of every product.
+
+The ReplenishmentEngine listens to the purchases of the products it tracks (the "sale" event of
+Product.buy(), and the orders of the store once they are committed, so that an order that is
+rolled back is not counted) and keeps the units sold per product over a rolling window, in a ring of time
+buckets: recording a sale takes constant time. From the velocity (units sold per second) it
+derives, for every product:
+    reorder point  = velocity * lead time + safety stock
+    order-up-to    = velocity * (lead time + review period) + safety stock
+When the stock of a product falls to its reorder point, a reorder of (order-up-to - stock) units
+is raised. restock() applies the deliveries in bulk; a sold-out product that gets stock again is
+reactivated, and shows up again in Store.get_all_products().
+
+simulate() runs the same policy on a synthetic demand stream, without Product objects, to size
+the lead time and the safety stock over millions of orders.
+
+Usage: python replenishment.py [--skus N] [--orders N] [--lead-time SECONDS] [--safety-stock N]
+"""
+import argparse
+import heapq
+import itertools
+import math
+import random
+import threading
+import time
+
+import products
+import store
+
+DAY = 24 * 60 * 60
+
+
+class RollingCounter:
+    """
+    Sum of the amounts added over the last `window` seconds, kept in a ring of `buckets` time
+    buckets and a running total. The buckets that fall out of the window are subtracted from the
+    total as time moves forward, so adding and reading take constant (amortized) time.
+    Time must not go backwards.
+    """
+    __slots__ = ("window", "start", "bucket_seconds", "counts", "head", "total")
+
+    def __init__(self, window, buckets, start=0.0):
+        """
+        :param window: seconds.
+        :param buckets:
+        :param start: time when counting started, so that the rate is not underestimated
+        before a whole window has passed.
+        """
+        self.window = window
+        self.start = start
+        self.bucket_seconds = window / buckets
+        self.counts = [0] * buckets
+        self.head = int(start // self.bucket_seconds)
+        self.total = 0
+
+    def _advance(self, bucket):
+        counts = self.counts
+        size = len(counts)
+        if bucket - self.head >= size:
+            counts[:] = [0] * size
+            self.total = 0
+        else:
+            for expired in range(self.head + 1, bucket + 1):
+                index = expired % size
+                self.total -= counts[index]
+                counts[index] = 0
+        self.head = bucket
+
+    def add(self, now, amount):
+        bucket = int(now // self.bucket_seconds)
+        if bucket > self.head:
+            self._advance(bucket)
+        self.counts[bucket % len(self.counts)] += amount
+        self.total += amount
+
+    def get_total(self, now) -> float:
+        bucket = int(now // self.bucket_seconds)
+        if bucket > self.head:
+            self._advance(bucket)
+        return self.total
+
+    def get_rate(self, now) -> float:
+        """
+        Returns the amount per second over the window (or since the start, if it is more recent).
+        :param now:
+        :return:
+        """
+        return self.get_total(now) / max(min(now - self.start, self.window), self.bucket_seconds)
+
+
+class ReplenishmentEngine:
+
+    def __init__(self, lead_time=3 * DAY, review_period=DAY, safety_stock=0, window=7 * DAY, buckets=168,
+                 clock=time.time, on_reorder=None):
+        """
+        :param lead_time: seconds between a reorder and its delivery.
+        :param review_period: seconds of sales that a reorder should cover, on top of the lead time.
+        :param safety_stock: units kept on top of the expected demand.
+        :param window: seconds of sales used to compute the velocity.
+        :param buckets: number of time buckets of the window.
+        :param clock: returns the current time, in seconds.
+        :param on_reorder: called as on_reorder(product, quantity) when a reorder is raised.
+        """
+        self.lead_time = lead_time
+        self.review_period = review_period
+        self.safety_stock = safety_stock
+        self.window = window
+        self.buckets = buckets
+        self.clock = clock
+        self.on_reorder = on_reorder
+        self._lock = threading.Lock()
+        self._counters = {}
+        # product -> quantity of the pending reorder
+        self._reorders = {}
+
+    def track(self, product):
+        """
+        Starts tracking the sales of a product. Products that are not stocked are ignored.
+        :param product:
+        :return: None
+        """
+        if isinstance(product, products.NonStockedProduct) or product in self._counters:
+            return
+        self._counters[product] = RollingCounter(self.window, self.buckets, self.clock())
+        product.add_listener(self._on_product_change)
+
+    def untrack(self, product):
+        if self._counters.pop(product, None) is not None:
+            product.remove_listener(self._on_product_change)
+        self._reorders.pop(product, None)
+
+    def attach(self, best_buy):
+        """
+        Tracks every product of the catalog of a store, active or not, and the orders of the store.
+        :param best_buy:
+        :return: None
+        """
+        best_buy.add_commit_hook(self._on_order)
+        for product in best_buy.products:
+            self.track(product)
+
+    def detach(self, best_buy):
+        best_buy.remove_commit_hook(self._on_order)
+        for product in best_buy.products:
+            self.untrack(product)
+
+    def velocity(self, product) -> float:
+        """
+        Returns the units of the product sold per second over the window.
+        :param product:
+        :return:
+        """
+        counter = self._counters.get(product)
+        return counter.get_rate(self.clock()) if counter else 0.0
+
+    def reorder_point(self, product) -> float:
+        return self.velocity(product) * self.lead_time + self.safety_stock
+
+    def order_up_to(self, product) -> float:
+        return self.velocity(product) * (self.lead_time + self.review_period) + self.safety_stock
+
+    def get_reorders(self) -> dict:
+        """
+        Returns the pending reorders: product -> quantity to order.
+        :return:
+        """
+        with self._lock:
+            return dict(self._reorders)
+
+    def restock(self, deliveries=None) -> int:
+        """
+        Adds the delivered quantities to the stock of the products, and clears their pending
+        reorders. Sold-out products get reactivated.
+        :param deliveries: (product, quantity) tuples; all the pending reorders if None.
+        :return: the number of products restocked.
+        """
+        if deliveries is None:
+            deliveries = self.get_reorders().items()
+        restocked = 0
+        for product, quantity in deliveries:
+            with product.lock:
+                product.set_quantity(product.get_quantity() + quantity)
+            with self._lock:
+                self._reorders.pop(product, None)
+            restocked += 1
+        return restocked
+
+    def _on_product_change(self, product, field, old_value, new_value):
+        # The sales of an order are counted by _on_order(), once the order is committed
+        if field == "sale" and not store.in_order():
+            self._record_sale(product, new_value)
+
+    def _on_order(self, shopping_list, line_prices):
+        for product, quantity in shopping_list:
+            self._record_sale(product, quantity)
+
+    def _record_sale(self, product, quantity):
+        now = self.clock()
+        counter = self._counters.get(product)
+        if counter is None:
+            return
+        with self._lock:
+            counter.add(now, quantity)
+            if product in self._reorders:
+                return
+            velocity = counter.get_rate(now)
+            stock = product.quantity
+            if stock > velocity * self.lead_time + self.safety_stock:
+                return
+            quantity = math.ceil(velocity * (self.lead_time + self.review_period) + self.safety_stock - stock)
+            if quantity <= 0:
+                return
+            self._reorders[product] = quantity
+        if self.on_reorder:
+            self.on_reorder(product, quantity)
+
+
+def synthetic_demand(sku_count, order_count, orders_per_day=100000, max_quantity=3, seed=0, batch_size=65536):
+    """
+    Generator over a synthetic demand stream of (time, sku, quantity) tuples. The orders are
+    evenly spread over time, and the popularity of the SKUs follows a Zipf-like law.
+    :param sku_count:
+    :param order_count:
+    :param orders_per_day:
+    :param max_quantity:
+    :param seed:
+    :param batch_size:
+    :return:
+    """
+    generator = random.Random(seed)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(sku_count)))
+    interval = DAY / orders_per_day
+    quantities = range(1, max_quantity + 1)
+    position = 0
+    while position < order_count:
+        size = min(batch_size, order_count - position)
+        skus = generator.choices(range(sku_count), cum_weights=cum_weights, k=size)
+        sizes = generator.choices(quantities, k=size)
+        for offset in range(size):
+            yield (position + offset) * interval, skus[offset], sizes[offset]
+        position += size
+
+
+def simulate(demand, sku_count, initial_stock=100, lead_time=3 * DAY, review_period=DAY, safety_stock=0,
+             window=7 * DAY, buckets=168) -> dict:
+    """
+    Replays a demand stream against the replenishment policy of ReplenishmentEngine, on plain
+    lists rather than Product objects. Reorders are delivered after the lead time.
+    Returns a dict with the units sold and lost (not enough stock), the number of stock-outs and
+    of reorders, and the time it took.
+    :param demand: iterable of (time, sku, quantity) tuples, in time order.
+    :param sku_count:
+    :param initial_stock:
+    :param lead_time:
+    :param review_period:
+    :param safety_stock:
+    :param window:
+    :param buckets:
+    :return:
+    """
+    start_time = time.perf_counter()
+    stock = [initial_stock] * sku_count
+    pending = [False] * sku_count
+    counters = [RollingCounter(window, buckets) for _ in range(sku_count)]
+    deliveries = []
+    orders = units_sold = units_lost = stock_outs = reorders = 0
+    cover = lead_time + review_period
+    for now, sku, quantity in demand:
+        orders += 1
+        while deliveries and deliveries[0][0] <= now:
+            _, delivered_sku, delivered = heapq.heappop(deliveries)
+            stock[delivered_sku] += delivered
+            pending[delivered_sku] = False
+        available = stock[sku]
+        if quantity > available:
+            units_lost += quantity
+            if available == 0:
+                stock_outs += 1
+            continue
+        available -= quantity
+        stock[sku] = available
+        units_sold += quantity
+        counter = counters[sku]
+        counter.add(now, quantity)
+        if pending[sku]:
+            continue
+        velocity = counter.get_rate(now)
+        if available <= velocity * lead_time + safety_stock:
+            reorder = math.ceil(velocity * cover + safety_stock - available)
+            if reorder > 0:
+                pending[sku] = True
+                reorders += 1
+                heapq.heappush(deliveries, (now + lead_time, sku, reorder))
+    return {"orders": orders, "units_sold": units_sold, "units_lost": units_lost, "stock_outs": stock_outs,
+            "reorders": reorders, "seconds": time.perf_counter() - start_time}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulates the replenishment policy on a synthetic demand stream")
+    parser.add_argument("--skus", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--orders-per-day", type=int, default=100000)
+    parser.add_argument("--initial-stock", type=int, default=100)
+    parser.add_argument("--lead-time", type=float, default=3 * DAY, help="seconds")
+    parser.add_argument("--safety-stock", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    demand = synthetic_demand(args.skus, args.orders, args.orders_per_day, seed=args.seed)
+    report = simulate(demand, args.skus, args.initial_stock, args.lead_time, safety_stock=args.safety_stock)
+    fill_rate = report["units_sold"] / ((report["units_sold"] + report["units_lost"]) or 1)
+    print(f"{report['orders']} orders in {report['seconds']:.2f}s "
+          f"({report['orders'] / (report['seconds'] or 1):,.0f} orders/sec)")
+    print(f"Units sold: {report['units_sold']}, lost: {report['units_lost']} (fill rate {fill_rate:.1%}), "
+          f"stock-outs: {report['stock_outs']}, reorders: {report['reorders']}")
+
+
+if __name__ == "__main__":
+    main()
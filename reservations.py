@@ -0,0 +1,178 @@
+"""
+Soft reservations of stock for the carts in progress.
+
+A cart puts a hold on a quantity of a product when the product is added to its basket. The hold
+does not change Product.quantity: it is only subtracted from what the other carts can hold or buy,
+so the quantity available to sell is the quantity on hand minus the quantity held by the other
+carts. A hold expires after its time-to-live, unless the cart checks out first (see Store.order()
+with cart=...), which releases the holds of the cart.
+
+Expired holds are swept through a heap ordered by expiry time: sweeping only pops the holds that
+have expired, it never scans the products. A hold that is extended or released stays in the heap
+and is skipped when it is popped (lazy deletion).
+"""
+import heapq
+import itertools
+import threading
+import time
+
+import products
+
+DEFAULT_TTL = 15 * 60
+
+
+class ReservationManager:
+
+    def __init__(self, ttl=DEFAULT_TTL, clock=time.monotonic):
+        """
+        :param ttl: time-to-live of a hold, in seconds.
+        :param clock: returns the current time, in seconds.
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        # product -> {cart: [quantity, expiry time, sequence number of its heap entry]}
+        self._holds = {}
+        # product -> total quantity held by all the carts
+        self._held = {}
+        # cart -> set of the products it holds
+        self._carts = {}
+        # (expiry time, sequence number, cart, product); stale entries are skipped
+        self._expiries = []
+        self._sequence = itertools.count()
+        self._cart_ids = itertools.count(1)
+
+    def new_cart(self) -> int:
+        """
+        Returns a new cart id. Any hashable value can be used as a cart id.
+        :return:
+        """
+        return next(self._cart_ids)
+
+    def hold(self, cart, product, quantity, ttl=None):
+        """
+        Adds quantity to the hold of the cart on the product, and restarts its time-to-live.
+        The product is checked for the whole quantity held by the cart, like Product.check_purchase()
+        does, and against the quantity available to the cart.
+        :raises ValueError: if the cart cannot hold that quantity of the product.
+        :param cart:
+        :param product:
+        :param quantity:
+        :param ttl: time-to-live of this hold, in seconds (default: the ttl of the manager).
+        :return: None
+        """
+        if quantity <= 0:
+            raise ValueError("Quantity must be a positive number!")
+        # Same lock order as Store.order(): the product first, then the manager
+        with product.lock, self._lock:
+            now = self.clock()
+            self._sweep(now)
+            cart_holds = self._holds.get(product, {})
+            own = cart_holds[cart][0] if cart in cart_holds else 0
+            product.check_purchase(own + quantity)
+            self._check(product, own + quantity, self._held.get(product, 0) - own)
+            sequence = next(self._sequence)
+            expiry = now + (self.ttl if ttl is None else ttl)
+            self._holds.setdefault(product, {})[cart] = [own + quantity, expiry, sequence]
+            self._held[product] = self._held.get(product, 0) + quantity
+            self._carts.setdefault(cart, set()).add(product)
+            heapq.heappush(self._expiries, (expiry, sequence, cart, product))
+
+    def release(self, cart, product=None):
+        """
+        Releases the holds of a cart: on a single product, or on all its products if product is None.
+        Releasing a hold that does not exist does nothing.
+        :param cart:
+        :param product:
+        :return: None
+        """
+        with self._lock:
+            held_products = self._carts.get(cart, ())
+            for held_product in ([product] if product is not None else list(held_products)):
+                if held_product in held_products:
+                    self._remove(cart, held_product)
+
+    def held(self, product, exclude=None) -> float:
+        """
+        Returns the quantity of the product held by all the carts but the excluded one.
+        :param product:
+        :param exclude: cart whose hold is not counted.
+        :return:
+        """
+        with self._lock:
+            self._sweep(self.clock())
+            return self._held_by_others(product, exclude)
+
+    def available(self, product, cart=None) -> float:
+        """
+        Returns the quantity of the product that the cart can still buy: on hand minus held by the other carts.
+        :param product:
+        :param cart:
+        :return:
+        """
+        return product.get_quantity() - self.held(product, exclude=cart)
+
+    def check_order(self, requested, cart=None):
+        """
+        Checks that every line of an order is available to the cart. Called by Store.order()
+        while the products of the order are locked.
+        :raises ValueError: if a line is larger than what is available to the cart.
+        :param requested: (product, quantity) lines, with one line per product.
+        :param cart:
+        :return: None
+        """
+        with self._lock:
+            self._sweep(self.clock())
+            for product, quantity in requested:
+                self._check(product, quantity, self._held_by_others(product, cart))
+
+    def sweep(self) -> int:
+        """
+        Releases the holds that have expired, and returns how many there were.
+        :return:
+        """
+        with self._lock:
+            return self._sweep(self.clock())
+
+    def __len__(self):
+        return sum(len(cart_holds) for cart_holds in self._holds.values())
+
+    def _held_by_others(self, product, cart):
+        cart_holds = self._holds.get(product)
+        if not cart_holds:
+            return 0
+        own = cart_holds[cart][0] if cart in cart_holds else 0
+        return self._held[product] - own
+
+    @staticmethod
+    def _check(product, quantity, held_by_others):
+        # Products that are not stocked can always be sold
+        if held_by_others and not isinstance(product, products.NonStockedProduct):
+            available = product.quantity - held_by_others
+            if quantity > available:
+                raise ValueError(f"There is not enough in stock. Available quantity = {available}")
+
+    def _remove(self, cart, product):
+        cart_holds = self._holds[product]
+        quantity = cart_holds.pop(cart)[0]
+        if cart_holds:
+            self._held[product] -= quantity
+        else:
+            del self._holds[product]
+            del self._held[product]
+        cart_products = self._carts[cart]
+        cart_products.discard(product)
+        if not cart_products:
+            del self._carts[cart]
+
+    def _sweep(self, now):
+        expired = 0
+        expiries = self._expiries
+        while expiries and expiries[0][0] <= now:
+            _, sequence, cart, product = heapq.heappop(expiries)
+            hold = self._holds.get(product, {}).get(cart)
+            # Skip the entries of holds that were extended or released since
+            if hold is not None and hold[2] == sequence:
+                self._remove(cart, product)
+                expired += 1
+        return expired
@@ -0,0 +1,322 @@
+"""
+Declarative promotion rules. Rules are plain dicts (e.g. loaded from JSON) which are compiled once
+into small pricing functions, so that pricing a line is a couple of arithmetic operations.
+
+Line rules price a quantity of one product, given its unit price:
+    {"type": "percent_discount", "percent": 30}              same as promotions.PercentDiscount
+    {"type": "second_half_price"}                            same as promotions.SecondHalfPrice
+    {"type": "third_one_free"}                               same as promotions.ThirdOneFree
+    {"type": "buy_x_get_y", "buy": 3, "get": 1}              for every 3 bought, 1 more is free
+    {"type": "tiered_percent", "tiers": [[10, 5], [50, 10]]} 5% off from 10 units, 10% off from 50
+Basket rules change the total of a whole order:
+    {"type": "basket_threshold", "minimum": 1000, "percent": 5}   5% off orders of 1000 or more
+    {"type": "basket_threshold", "minimum": 500, "amount": 25}    25 off orders of 500 or more
+Any rule can be limited to a time window with "start" and/or "end" (Unix timestamps).
+
+Line rules stack: compile_promotion() turns a list of line rules into one Promotion. The first
+rule prices the line from the list price, and every next rule prices it again from the discounted
+unit price (line total / quantity). A promotion made of a single built-in rule gives exactly the
+same results as the built-in promotion class, in floats and in integer cents (stores in cents
+mode): every rule is also compiled to a function on cents.
+"""
+import time
+from fractions import Fraction
+
+import money
+import promotions
+
+
+def _percent_discount(rule):
+    factor = 1 - (_required(rule, "percent") / 100)
+    return lambda price, quantity: round((price * factor) * quantity)
+
+
+def _second_half_price(rule):
+    return lambda price, quantity: (price * 0.5 * (quantity // 2)) + (price * (quantity - quantity // 2))
+
+
+def _third_one_free(rule):
+    return lambda price, quantity: price * (quantity - quantity // 3)
+
+
+def _buy_x_get_y_group(rule) -> tuple:
+    buy, get = _required(rule, "buy"), _required(rule, "get")
+    if buy < 1 or get < 1:
+        raise ValueError("buy and get must be at least 1!")
+    return buy + get, get
+
+
+def _buy_x_get_y(rule):
+    group, get = _buy_x_get_y_group(rule)
+    return lambda price, quantity: price * (quantity - (quantity // group) * get)
+
+
+def _tiers(rule) -> list:
+    # Highest tier first, so the first tier reached is the one that applies
+    tiers = sorted(((minimum, percent) for minimum, percent in _required(rule, "tiers")), reverse=True)
+    if not tiers:
+        raise ValueError("At least one tier is required!")
+    return tiers
+
+
+def _tiered_percent(rule):
+    tiers = [(minimum, 1 - (percent / 100)) for minimum, percent in _tiers(rule)]
+
+    def price_line(price, quantity):
+        for minimum, factor in tiers:
+            if quantity >= minimum:
+                return round((price * factor) * quantity)
+        return price * quantity
+    return price_line
+
+
+# Line rules in integer cents: the unit price is an int number of cents, or a Fraction of cents
+# for the next rules of a stack, and the line total is rounded to the cent, half up
+
+def _round_cents(amount) -> int:
+    return money.divide(amount.numerator, amount.denominator)
+
+
+def _kept(percent) -> Fraction:
+    # Exact for percents with up to 2 decimals, like PercentDiscount.apply_promotion_cents()
+    return Fraction(10000 - round(percent * 100), 10000)
+
+
+def _percent_discount_cents(rule):
+    kept = _kept(_required(rule, "percent"))
+    return lambda price, quantity: _round_cents(price * quantity * kept)
+
+
+def _second_half_price_cents(rule):
+    return lambda price, quantity: _round_cents(price * quantity - Fraction(price * (quantity // 2), 2))
+
+
+def _third_one_free_cents(rule):
+    return lambda price, quantity: _round_cents(price * (quantity - quantity // 3))
+
+
+def _buy_x_get_y_cents(rule):
+    group, get = _buy_x_get_y_group(rule)
+    return lambda price, quantity: _round_cents(price * (quantity - (quantity // group) * get))
+
+
+def _tiered_percent_cents(rule):
+    tiers = [(minimum, _kept(percent)) for minimum, percent in _tiers(rule)]
+
+    def price_line(price, quantity):
+        for minimum, kept in tiers:
+            if quantity >= minimum:
+                return _round_cents(price * quantity * kept)
+        return _round_cents(price * quantity)
+    return price_line
+
+
+def _basket_threshold(rule):
+    minimum = _required(rule, "minimum")
+    if "percent" in rule:
+        factor = 1 - (rule["percent"] / 100)
+        return lambda total: total * factor if total >= minimum else total
+    amount = _required(rule, "amount")
+    return lambda total: max(total - amount, 0) if total >= minimum else total
+
+
+def _basket_threshold_cents(rule):
+    minimum = money.to_cents(_required(rule, "minimum"))
+    if "percent" in rule:
+        # Totals are never negative, so rounding half up is a plain integer floor
+        kept = 10000 - round(rule["percent"] * 100)
+        return lambda total: (2 * total * kept + 10000) // 20000 if total >= minimum else total
+    amount = money.to_cents(_required(rule, "amount"))
+    return lambda total: max(total - amount, 0) if total >= minimum else total
+
+
+LINE_RULES = {
+    "percent_discount": _percent_discount,
+    "second_half_price": _second_half_price,
+    "third_one_free": _third_one_free,
+    "buy_x_get_y": _buy_x_get_y,
+    "tiered_percent": _tiered_percent,
+}
+
+# Same rules, on prices in integer cents (see money)
+LINE_RULES_CENTS = {
+    "percent_discount": _percent_discount_cents,
+    "second_half_price": _second_half_price_cents,
+    "third_one_free": _third_one_free_cents,
+    "buy_x_get_y": _buy_x_get_y_cents,
+    "tiered_percent": _tiered_percent_cents,
+}
+
+BASKET_RULES = {
+    "basket_threshold": _basket_threshold,
+}
+
+# Same rules, on totals in integer cents (see money)
+BASKET_RULES_CENTS = {
+    "basket_threshold": _basket_threshold_cents,
+}
+
+
+def _required(rule, field):
+    if field not in rule:
+        raise ValueError(f"Rule {rule.get('type')} needs a '{field}'!")
+    return rule[field]
+
+
+def _compile(rule, compilers, clock, identity):
+    if rule.get("type") not in compilers:
+        raise ValueError(f"Unknown rule type: {rule.get('type')}")
+    function = compilers[rule["type"]](rule)
+    start, end = rule.get("start"), rule.get("end")
+    if start is None and end is None:
+        return function
+    start = float("-inf") if start is None else start
+    end = float("inf") if end is None else end
+
+    def windowed(*args):
+        if start <= clock() < end:
+            return function(*args)
+        return identity(*args)
+    return windowed
+
+
+def compile_line_rule(rule, clock=time.time, cents=False):
+    """
+    Compiles a line rule into a function price_line(unit_price, quantity) -> line total.
+    :raises ValueError: if the rule is not valid.
+    :param rule:
+    :param clock: returns the current time, for the rules with a time window.
+    :param cents: the function takes the unit price in cents (int or Fraction) and returns an int
+    number of cents.
+    :return:
+    """
+    if cents:
+        return _compile(rule, LINE_RULES_CENTS, clock, lambda price, quantity: _round_cents(price * quantity))
+    return _compile(rule, LINE_RULES, clock, lambda price, quantity: price * quantity)
+
+
+def compile_basket_rule(rule, clock=time.time, cents=False):
+    """
+    Compiles a basket rule into a function price_basket(total) -> new total.
+    :raises ValueError: if the rule is not valid.
+    :param rule:
+    :param clock: returns the current time, for the rules with a time window.
+    :param cents: the function takes and returns totals in integer cents.
+    :return:
+    """
+    return _compile(rule, BASKET_RULES_CENTS if cents else BASKET_RULES, clock, lambda total: total)
+
+
+def rule_from_promotion(promotion) -> dict:
+    """
+    Returns the rule of a built-in promotion object.
+    :raises ValueError: if the promotion is not one of the built-in promotions.
+    :param promotion:
+    :return:
+    """
+    if isinstance(promotion, promotions.PercentDiscount):
+        return {"type": "percent_discount", "percent": promotion.percent}
+    elif isinstance(promotion, promotions.SecondHalfPrice):
+        return {"type": "second_half_price"}
+    elif isinstance(promotion, promotions.ThirdOneFree):
+        return {"type": "third_one_free"}
+    raise ValueError(f"Promotion type {type(promotion).__name__} has no rule!")
+
+
+class CompiledPromotion(promotions.Promotion):
+    """
+    A promotion made of one or more stacked line rules. It can be set on any product with
+    Product.set_promotion(), like the built-in promotions.
+    """
+
+    def __init__(self, name, rules, clock=time.time):
+        self.name = name
+        self.rules = list(rules)
+        self.clock = clock
+        if not self.rules:
+            raise ValueError("A promotion needs at least one rule!")
+        # Rules with a time window give different prices over time, so their prices must not be cached
+        self.cacheable = not any("start" in rule or "end" in rule for rule in self.rules)
+        self._price_line = self._stack([compile_line_rule(rule, clock) for rule in self.rules],
+                                       lambda total, quantity: total / quantity)
+        self._price_line_cents = self._stack([compile_line_rule(rule, clock, cents=True) for rule in self.rules],
+                                             Fraction)
+
+    @staticmethod
+    def _stack(functions, unit_price):
+        first, rest = functions[0], functions[1:]
+        if not rest:
+            return first
+
+        def price_line(price, quantity):
+            total = first(price, quantity)
+            if quantity:
+                for function in rest:
+                    total = function(unit_price(total, quantity), quantity)
+            return total
+        return price_line
+
+    def __reduce__(self):
+        # The compiled functions cannot be pickled: the copy compiles the rules again
+        return type(self), (self.name, self.rules, self.clock)
+
+    def apply_promotion(self, product, quantity) -> float:
+        return self._price_line(product.price, quantity)
+
+    def apply_promotion_bulk(self, prices, quantities) -> list:
+        price_line = self._price_line
+        return [price_line(price, quantity) for price, quantity in zip(prices, quantities)]
+
+    def apply_promotion_cents(self, price_cents, quantity) -> int:
+        return self._price_line_cents(price_cents, quantity)
+
+
+class BasketPromotion:
+    """
+    One or more stacked basket rules, applied to the total of an order (see Store.set_basket_promotion()).
+    """
+
+    def __init__(self, name, rules, clock=time.time):
+        self.name = name
+        self.rules = list(rules)
+        self._functions = [compile_basket_rule(rule, clock) for rule in self.rules]
+        self._cents_functions = [compile_basket_rule(rule, clock, cents=True) for rule in self.rules]
+
+    def apply_basket(self, total_price) -> float:
+        for function in self._functions:
+            total_price = function(total_price)
+        return total_price
+
+    def apply_basket_cents(self, total_cents) -> int:
+        """
+        Same as apply_basket(), with the total in integer cents. Used by the stores in cents mode.
+        :param total_cents:
+        :return:
+        """
+        for function in self._cents_functions:
+            total_cents = function(total_cents)
+        return total_cents
+
+
+def compile_promotion(name, rules, clock=time.time):
+    """
+    Compiles a list of line rules into a promotion that can be set on products.
+    :raises ValueError: if a rule is not valid.
+    :param name:
+    :param rules:
+    :param clock:
+    :return:
+    """
+    return CompiledPromotion(name, rules, clock)
+
+
+def compile_basket_promotion(name, rules, clock=time.time):
+    """
+    Compiles a list of basket rules into a promotion that can be set on a store.
+    :raises ValueError: if a rule is not valid.
+    :param name:
+    :param rules:
+    :param clock:
+    :return:
+    """
+    return BasketPromotion(name, rules, clock)
@@ -0,0 +1,257 @@
+"""
+Search index over the active products of a store, for typeahead and filtered browsing.
+
+The index keeps:
+    - a sorted list of the words of the product names, for prefix queries (bisect)
+    - the trigrams of the product names, for fuzzy queries (typos)
+    - a sorted list of the prices, for price range queries (bisect)
+    - the products per class and per promotion, for filters
+It is updated incrementally: it listens to the catalog of the store (products added and
+removed) and to the products themselves (activated, deactivated, price or promotion changed).
+Like Store.get_all_products(), searches only return active products.
+
+    index = search.SearchIndex()
+    index.attach(best_buy)
+    index.search("mac air", max_price=1500, promotion=True)
+"""
+import bisect
+import heapq
+import re
+import threading
+from collections import Counter
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(name) -> set:
+    return set(_WORD.findall(name.lower()))
+
+
+def _trigrams(text) -> set:
+    text = f"  {text.lower()} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _discard(sorted_list, item):
+    index = bisect.bisect_left(sorted_list, item)
+    if index < len(sorted_list) and sorted_list[index] == item:
+        del sorted_list[index]
+
+
+class SearchIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Every product listened to: name -> product; only the active ones are indexed
+        self._tracked = {}
+        self._indexed = {}
+        self._words = []       # sorted (word, name)
+        self._prices = []      # sorted (price, name)
+        self._trigrams = {}    # trigram -> set of names
+        self._classes = {}     # class -> set of names
+        self._promotions = {}  # promotion name -> set of names (None: no promotion)
+        # Indexed values of every indexed product: name -> (price, promotion name, number of trigrams)
+        self._values = {}
+
+    def attach(self, best_buy):
+        """
+        Indexes the active products of a store, and keeps the index up to date with the store.
+        :param best_buy:
+        :return: None
+        """
+        best_buy.add_catalog_listener(self._on_catalog_change)
+        with self._lock:
+            # Bulk load: the sorted lists are sorted once at the end, rather than kept sorted
+            for product in best_buy.products:
+                self.track(product, keep_sorted=False)
+            self._words.sort()
+            self._prices.sort()
+
+    def detach(self, best_buy):
+        best_buy.remove_catalog_listener(self._on_catalog_change)
+        for product in best_buy.products:
+            self.untrack(product)
+
+    def track(self, product, keep_sorted=True):
+        """
+        Starts listening to a product, and indexes it while it is active.
+        :param product:
+        :param keep_sorted: False to only append to the sorted lists, which must then be sorted by the caller.
+        :return: None
+        """
+        with self._lock:
+            if product.name in self._tracked:
+                return
+            self._tracked[product.name] = product
+            product.add_listener(self._on_product_change)
+            if product.is_active():
+                self._add(product, keep_sorted)
+
+    def untrack(self, product):
+        with self._lock:
+            if self._tracked.get(product.name) is not product:
+                return
+            del self._tracked[product.name]
+            product.remove_listener(self._on_product_change)
+            self._remove(product)
+
+    def __len__(self):
+        return len(self._indexed)
+
+    def _on_catalog_change(self, product, event):
+        if event == "add":
+            self.track(product)
+        elif event == "remove":
+            self.untrack(product)
+
+    def _on_product_change(self, product, field, old_value, new_value):
+        if field == "active":
+            with self._lock:
+                if new_value:
+                    self._add(product)
+                else:
+                    self._remove(product)
+        elif field in ("price", "promotion"):
+            with self._lock:
+                if product.name in self._indexed:
+                    self._remove(product)
+                    self._add(product)
+
+    def _add(self, product, keep_sorted=True):
+        name = product.name
+        if name in self._indexed:
+            return
+        self._indexed[name] = product
+        insert = bisect.insort if keep_sorted else list.append
+        for word in _words(name):
+            insert(self._words, (word, name))
+        trigrams = _trigrams(name)
+        for trigram in trigrams:
+            self._trigrams.setdefault(trigram, set()).add(name)
+        promotion_name = product.promotion.name if product.promotion else None
+        self._values[name] = (product.price, promotion_name, len(trigrams))
+        insert(self._prices, (product.price, name))
+        self._classes.setdefault(type(product), set()).add(name)
+        self._promotions.setdefault(promotion_name, set()).add(name)
+
+    def _remove(self, product):
+        name = product.name
+        if self._indexed.get(name) is not product:
+            return
+        del self._indexed[name]
+        for word in _words(name):
+            _discard(self._words, (word, name))
+        for trigram in _trigrams(name):
+            names = self._trigrams[trigram]
+            names.discard(name)
+            if not names:
+                del self._trigrams[trigram]
+        price, promotion_name, _ = self._values.pop(name)
+        _discard(self._prices, (price, name))
+        for groups, key in ((self._classes, type(product)), (self._promotions, promotion_name)):
+            names = groups[key]
+            names.discard(name)
+            if not names:
+                del groups[key]
+
+    def prefix(self, text) -> set:
+        """
+        Returns the names of the products that have, for every word of the text, a word that
+        starts with it. E.g. "mac ai" finds "MacBook Air M2".
+        :param text:
+        :return:
+        """
+        with self._lock:
+            names = None
+            for word in _WORD.findall(text.lower()):
+                start = bisect.bisect_left(self._words, (word,))
+                end = bisect.bisect_left(self._words, (word + "\U0010ffff",))
+                matches = {name for _, name in self._words[start:end]}
+                names = matches if names is None else names & matches
+                if not names:
+                    break
+            return set(self._indexed) if names is None else names
+
+    def fuzzy(self, text, limit=10, min_score=0.3) -> list:
+        """
+        Returns the names of the products that look like the text, best match first, even with
+        typos (e.g. "macbok" finds "MacBook Air M2"). The score is the share of trigrams in common.
+        :param text:
+        :param limit:
+        :param min_score: between 0 and 1.
+        :return:
+        """
+        query = _trigrams(text)
+        with self._lock:
+            shared = Counter()
+            for trigram in query:
+                shared.update(self._trigrams.get(trigram, ()))
+            values = self._values
+            scored = []
+            for name, count in shared.items():
+                score = count / (len(query) + values[name][2] - count)
+                if score >= min_score:
+                    scored.append((-score, name))
+        scored.sort()
+        return [name for _, name in scored[:limit]]
+
+    def price_range(self, min_price=None, max_price=None) -> list:
+        """
+        Returns the names of the products priced between min_price and max_price (both included),
+        cheapest first.
+        :param min_price:
+        :param max_price:
+        :return:
+        """
+        with self._lock:
+            start = 0 if min_price is None else bisect.bisect_left(self._prices, (min_price,))
+            end = len(self._prices) if max_price is None else \
+                bisect.bisect_right(self._prices, (max_price, "\U0010ffff"))
+            return [name for _, name in self._prices[start:end]]
+
+    def search(self, text=None, min_price=None, max_price=None, product_class=None, promotion=None,
+               fuzzy=False, limit=None) -> list:
+        """
+        Returns the active products that match all the given criteria. The results are sorted
+        by relevance for fuzzy searches, by price for price range searches, and else by name.
+        :param text: words the names start with (see prefix()), or the text to look like if fuzzy.
+        :param min_price:
+        :param max_price:
+        :param product_class: only products of this class (subclasses included).
+        :param promotion: a promotion name; True for any promotion, False for no promotion.
+        :param fuzzy:
+        :param limit: maximum number of products returned.
+        :return:
+        """
+        with self._lock:
+            ordered = None
+            names = None
+            if text:
+                if fuzzy:
+                    ordered = self.fuzzy(text, limit=len(self._indexed))
+                else:
+                    names = self.prefix(text)
+            if min_price is not None or max_price is not None:
+                in_range = self.price_range(min_price, max_price)
+                if ordered is None:
+                    ordered = in_range
+                else:
+                    names = set(in_range) if names is None else names & set(in_range)
+            if product_class is not None:
+                matches = set().union(*(group for cls, group in self._classes.items()
+                                        if issubclass(cls, product_class)))
+                names = matches if names is None else names & matches
+            if promotion is not None:
+                if promotion is True:
+                    matches = self._indexed.keys() - self._promotions.get(None, set())
+                else:
+                    matches = self._promotions.get(None if promotion is False else promotion, set())
+                names = matches if names is None else names & matches
+            if ordered is None:
+                names = self._indexed if names is None else names
+                ordered = sorted(names) if limit is None else heapq.nsmallest(limit, names)
+            elif names is not None:
+                ordered = [name for name in ordered if name in names]
+            if limit is not None:
+                ordered = ordered[:limit]
+            return [self._indexed[name] for name in ordered]
@@ -0,0 +1,152 @@
+"""
+Asyncio checkout service for a Store. Clients connect over a local socket (TCP or Unix) and
+send one JSON request per line; the service answers with one JSON line per request, in order.
+
+Requests:
+    {"id": 1, "op": "list"}                                   -> {"id": 1, "ok": true, "products": [...]}
+    {"id": 2, "op": "total"}                                  -> {"id": 2, "ok": true, "quantity": 1100}
+    {"id": 3, "op": "quote", "lines": [["Shipping", 1]]}      -> {"id": 3, "ok": true, "lines": [10], "total": 10}
+    {"id": 4, "op": "order", "lines": [["Shipping", 1]]}      -> {"id": 4, "ok": true, "total": 10}
+Errors are answered with {"id": ..., "ok": false, "error": "..."}.
+
+The store is only ever used from the event loop thread, and its methods never await, so every
+request runs to completion before the next one starts: the access to the store is serialized.
+Backpressure: a connection is served one request at a time and its answer must be drained
+before the next request is read. At most max_connections connections are served at once;
+the other ones wait (and their requests stay in the socket buffers) until a slot is free.
+
+Usage: python service.py [--host HOST] [--port PORT] [--unix PATH] [--snapshot FILE] [--journal FILE]
+"""
+import argparse
+import asyncio
+import json
+
+import main as cli
+import store
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Longest request line accepted, in bytes
+MAX_LINE = 1 << 20
+
+
+class OrderService:
+
+    def __init__(self, best_buy, max_connections=1024):
+        self.best_buy = best_buy
+        self.max_connections = max_connections
+        self._slots = None
+        self.handlers = {
+            "list": self._list,
+            "total": self._total,
+            "quote": self._quote,
+            "order": self._order,
+        }
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        """
+        Starts listening and returns the asyncio server. Use port=0 to pick a free port.
+        :param host:
+        :param port:
+        :param unix_path: if given, listens on this Unix socket instead of TCP.
+        :return:
+        """
+        self._slots = asyncio.Semaphore(self.max_connections)
+        if unix_path:
+            return await asyncio.start_unix_server(self.handle_connection, unix_path, limit=MAX_LINE)
+        return await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            async with self._slots:
+                while True:
+                    try:
+                        line = await reader.readline()
+                    except ValueError:  # Line longer than MAX_LINE
+                        writer.write(_encode({"id": None, "ok": False, "error": "Request too long!"}))
+                        break
+                    if not line:
+                        break
+                    writer.write(_encode(self.handle_request(line)))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def handle_request(self, line) -> dict:
+        """
+        Runs one request and returns the response. This method never raises.
+        :param line:
+        :return:
+        """
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            handler = self.handlers.get(request.get("op"))
+            if handler is None:
+                raise ValueError(f"Unknown operation: {request.get('op')}")
+            response = handler(request)
+        except (ValueError, TypeError, AttributeError) as error:
+            return {"id": request_id, "ok": False, "error": str(error)}
+        response["id"] = request_id
+        response["ok"] = True
+        return response
+
+    def _shopping_list(self, request) -> list:
+        shopping_list = []
+        for name, quantity in request.get("lines") or []:
+            product = self.best_buy.get_product(name)
+            if product is None or not product.is_active():
+                raise ValueError(f"Unknown product: {name}")
+            if not store.is_valid_quantity(quantity):
+                raise ValueError(f"Invalid quantity for {name}")
+            shopping_list.append((product, quantity))
+        if not shopping_list:
+            raise ValueError("There is no item to checkout!")
+        return shopping_list
+
+    def _list(self, request) -> dict:
+        return {"products": [{"name": product.name, "show": product.show()}
+                             for product in self.best_buy.get_all_products()]}
+
+    def _total(self, request) -> dict:
+        return {"quantity": cli.get_total_qty(self.best_buy)}
+
+    def _quote(self, request) -> dict:
+        line_prices, total_price = self.best_buy.quote(self._shopping_list(request))
+        return {"lines": line_prices, "total": total_price}
+
+    def _order(self, request) -> dict:
+        return {"total": self.best_buy.order(self._shopping_list(request))}
+
+
+def _encode(response) -> bytes:
+    return (json.dumps(response) + "\n").encode("utf-8")
+
+
+async def serve(best_buy, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+    server = await OrderService(best_buy).start(host, port, unix_path)
+    print(f"Serving on {unix_path or f'{host}:{port}'}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asyncio checkout service for the store")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--snapshot", help="load the catalog from this snapshot file")
+    parser.add_argument("--journal", help="recover the stock from this journal file, and record the orders in it")
+    args = parser.parse_args()
+    best_buy = cli.open_store(args.snapshot, args.journal)
+    try:
+        asyncio.run(serve(best_buy, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
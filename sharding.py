@@ -0,0 +1,302 @@
+"""
+Sharded store: the catalog is partitioned across N Store shards, each running in a worker
+process of its own. A product belongs to the shard given by the CRC32 of its name.
+
+Orders are routed line by line to the shards that own the products. An order that touches a
+single shard is made there in one step. An order that touches several shards runs a two-phase
+reserve/commit: every shard involved first reserves its lines (the stock is taken, all or
+nothing, with Store.order), then either all the shards commit, or the shards that reserved give
+the stock back if one of them failed.
+
+The listing and the totals are aggregated across the shards.
+"""
+import multiprocessing
+import threading
+import zlib
+
+import store
+
+_RESERVE, _COMMIT, _ABORT, _ORDER, _BATCH, _PRODUCTS, _TOTAL, _ADD, _STOP = range(9)
+
+
+def shard_index(name, shard_count) -> int:
+    """
+    Returns the index of the shard that owns the product with the given name.
+    :param name:
+    :param shard_count:
+    :return:
+    """
+    return zlib.crc32(name.encode("utf-8")) % shard_count
+
+
+def _order_lines(best_buy, lines):
+    basket = store.Basket()
+    for name, quantity in lines:
+        product = best_buy.get_product(name)
+        if product is None:
+            raise ValueError(f"Unknown product: {name}")
+        basket.add(product, quantity)
+    return basket, best_buy.order(basket)
+
+
+def _shard_main(connection, product_list):
+    """
+    Main loop of a shard worker process: runs the commands sent by the ShardedStore.
+    Every command gets exactly one answer: (True, result) or (False, error message).
+    """
+    best_buy = store.Store(product_list)
+    reservations = {}
+    while True:
+        command, argument = connection.recv()
+        try:
+            if command == _RESERVE:
+                order_id, lines = argument
+                basket, total_price = _order_lines(best_buy, lines)
+                reservations[order_id] = basket
+                result = total_price
+            elif command == _COMMIT:
+                del reservations[argument]
+                result = None
+            elif command == _ABORT:
+                for product, quantity in reservations.pop(argument):
+                    product.set_quantity(product.get_quantity() + quantity)
+                result = None
+            elif command == _ORDER:
+                result = _order_lines(best_buy, argument)[1]
+            elif command == _BATCH:
+                result = []
+                for lines in argument:
+                    try:
+                        result.append((_order_lines(best_buy, lines)[1], None))
+                    except Exception as error:
+                        result.append((None, str(error)))
+            elif command == _PRODUCTS:
+                result = best_buy.get_all_products()
+            elif command == _TOTAL:
+                result = best_buy.get_total_quantity()
+            elif command == _ADD:
+                best_buy.add_product(argument)
+                result = None
+            elif command == _STOP:
+                connection.send((True, None))
+                return
+            else:
+                raise ValueError(f"Unknown command: {command}")
+        except Exception as error:
+            # Any failure is answered, so that one bad command cannot take the shard down
+            connection.send((False, str(error)))
+        else:
+            connection.send((True, result))
+
+
+class _Shard:
+
+    def __init__(self, product_list, context):
+        self.connection, worker_connection = context.Pipe()
+        self.process = context.Process(target=_shard_main, args=(worker_connection, product_list), daemon=True)
+        self.process.start()
+        worker_connection.close()
+        # A shard answers its commands in order, so a command and its answer must not be interleaved
+        self.lock = threading.Lock()
+
+    def send(self, command, argument=None):
+        self.connection.send((command, argument))
+
+    def receive(self):
+        return self.connection.recv()
+
+    def call(self, command, argument=None):
+        """
+        Sends a command and waits for its answer.
+        :raises ValueError: if the command failed in the shard.
+        """
+        with self.lock:
+            self.send(command, argument)
+            ok, result = self.receive()
+        if not ok:
+            raise ValueError(result)
+        return result
+
+
+class ShardedStore:
+
+    def __init__(self, product_list, shard_count=4, context=None):
+        """
+        Starts the shard processes, each with its part of the catalog.
+        :param product_list:
+        :param shard_count:
+        :param context: multiprocessing context (default: the default start method).
+        """
+        context = context or multiprocessing.get_context()
+        self.shard_count = shard_count
+        partitions = [[] for _ in range(shard_count)]
+        for product in product_list:
+            partitions[shard_index(product.name, shard_count)].append(product)
+        self.shards = [_Shard(partition, context) for partition in partitions]
+        self._order_ids = iter(range(1, 1 << 62))
+        self._order_id_lock = threading.Lock()
+
+    def add_product(self, product):
+        """
+        Adds a product to the shard that owns it.
+        :raises ValueError: if a product with the same name already exists.
+        :param product:
+        :return:
+        """
+        self.shards[shard_index(product.name, self.shard_count)].call(_ADD, product)
+
+    def _route(self, shopping_list) -> dict:
+        """
+        Splits an order into its lines per shard: shard index -> list of (product name, quantity).
+        The products may be given as Product objects or as names.
+        :raises ValueError: if a quantity is not a positive int.
+        """
+        routes = {}
+        for product, quantity in shopping_list:
+            name = product if isinstance(product, str) else product.name
+            if not store.is_valid_quantity(quantity):
+                raise ValueError(f"Invalid quantity for {name}")
+            routes.setdefault(shard_index(name, self.shard_count), []).append((name, quantity))
+        return routes
+
+    def order(self, shopping_list) -> float:
+        """
+        Makes an order across the shards and returns its total price. All or nothing: if a line
+        cannot be bought, no stock is taken in any shard.
+        :raises ValueError: if at least one line of the order cannot be bought.
+        :param shopping_list: list of (product or product name, quantity) tuples.
+        :return:
+        """
+        routes = self._route(shopping_list)
+        if not routes:
+            return 0
+        if len(routes) == 1:
+            (index, lines), = routes.items()
+            return self.shards[index].call(_ORDER, lines)
+
+        with self._order_id_lock:
+            order_id = next(self._order_ids)
+        involved = [self.shards[index] for index in sorted(routes)]
+        # Shard locks are always taken in shard order, so concurrent orders cannot deadlock
+        for shard in involved:
+            shard.lock.acquire()
+        try:
+            # Phase 1: every shard reserves its lines, in parallel
+            for index in sorted(routes):
+                self.shards[index].send(_RESERVE, (order_id, routes[index]))
+            answers = []
+            for shard in involved:
+                try:
+                    answers.append(shard.receive())
+                except (EOFError, OSError) as error:
+                    answers.append((False, f"Shard unavailable: {error!r}"))
+            errors = [result for ok, result in answers if not ok]
+            # Phase 2: commit everywhere, or give the stock back where it was reserved
+            decision = _ABORT if errors else _COMMIT
+            reserved = [shard for shard, (ok, _) in zip(involved, answers) if ok]
+            for shard in reserved:
+                shard.send(decision, order_id)
+            for shard in reserved:
+                shard.receive()
+        finally:
+            for shard in reversed(involved):
+                shard.lock.release()
+        if errors:
+            raise ValueError(errors[0])
+        return sum(result for _, result in answers)
+
+    def process_orders(self, orders) -> list:
+        """
+        Places a batch of orders, like Store.process_orders(): the orders are made in the input
+        order, and every order gets (total, None) or (None, error message). The runs of orders that
+        touch a single shard are sent to their shards in one batch per shard, and the shards run
+        them in parallel; this keeps the input order, since the batches of different shards touch
+        different products. The orders that touch several shards go through the two-phase order(),
+        after the batches before them.
+        :param orders:
+        :return:
+        """
+        results = [None] * len(orders)
+        batches = {}
+        for position, shopping_list in enumerate(orders):
+            try:
+                routes = self._route(shopping_list)
+            except ValueError as error:
+                results[position] = (None, str(error))
+                continue
+            if len(routes) == 1:
+                (index, lines), = routes.items()
+                batch_positions, batch_orders = batches.setdefault(index, ([], []))
+                batch_positions.append(position)
+                batch_orders.append(lines)
+            elif not routes:
+                results[position] = (0, None)
+            else:
+                self._run_batches(batches, results)
+                batches = {}
+                try:
+                    results[position] = (self.order(shopping_list), None)
+                except ValueError as error:
+                    results[position] = (None, str(error))
+        self._run_batches(batches, results)
+        return results
+
+    def _run_batches(self, batches, results):
+        """
+        Runs batches of single-shard orders (shard index -> (positions, orders)) in parallel, and
+        stores their results at their positions.
+        """
+        indexes = sorted(batches)
+        for index in indexes:
+            self.shards[index].lock.acquire()
+        try:
+            for index in indexes:
+                self.shards[index].send(_BATCH, batches[index][1])
+            for index in indexes:
+                ok, batch_results = self.shards[index].receive()
+                if not ok:
+                    # The whole batch failed in the shard: batch_results is the error message
+                    batch_results = [(None, batch_results)] * len(batches[index][0])
+                for position, result in zip(batches[index][0], batch_results):
+                    results[position] = result
+        finally:
+            for index in reversed(indexes):
+                self.shards[index].lock.release()
+
+    def _gather(self, command) -> list:
+        for shard in self.shards:
+            shard.lock.acquire()
+        try:
+            for shard in self.shards:
+                shard.send(command)
+            return [shard.receive()[1] for shard in self.shards]
+        finally:
+            for shard in reversed(self.shards):
+                shard.lock.release()
+
+    def get_all_products(self) -> list:
+        """
+        Returns copies of the active products of all the shards, shard after shard.
+        :return:
+        """
+        return [product for shard_products in self._gather(_PRODUCTS) for product in shard_products]
+
+    def get_total_quantity(self) -> float:
+        return sum(self._gather(_TOTAL))
+
+    def close(self):
+        """
+        Stops the shard processes.
+        :return: None
+        """
+        for shard in self.shards:
+            if shard.process.is_alive():
+                shard.call(_STOP)
+            shard.process.join()
+            shard.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
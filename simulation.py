@@ -0,0 +1,174 @@
+"""
+What-if simulation of promotions: replays a basket dataset against candidate promotion
+assignments, before any promotion is set with Product.set_promotion().
+
+A scenario maps product names to the promotion they would get (None for no promotion); the
+products not in the scenario keep their current promotion. Every scenario is compared with the
+baseline (the current promotions) and gets its revenue, units, promoted units (units sold under
+a promotion) and discount, with the deltas against the baseline. The baskets are replayed as
+they are: promotions change what is paid, not what is bought.
+
+A line is priced from its product and quantity only, so the baskets are first reduced to the
+number of lines per (product, quantity), and a scenario prices each distinct pair once, with
+Promotion.apply_promotion_bulk(). The scenarios are fanned out across a process pool. The catalog
+and the reduced baskets are sent once to every worker, by the pool initializer, and kept in
+module globals: a task only carries its scenario.
+
+Usage: python simulation.py [--baskets N] [--workers N]
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Read-only data of the worker processes, set by _init_worker()
+_names = None
+_prices = None
+_promotions = None
+_lines = None
+
+
+def _init_worker(names, prices, promotion_list, lines):
+    global _names, _prices, _promotions, _lines
+    _names, _prices, _promotions, _lines = names, prices, promotion_list, lines
+
+
+def reduce_baskets(product_list, baskets) -> dict:
+    """
+    Counts the lines of the baskets per product and quantity. Returns a dict that maps the index
+    of a product in product_list to a tuple (quantities, line counts).
+    :raises ValueError: if a basket has a product that is not in product_list.
+    :param product_list:
+    :param baskets: iterable of shopping lists of (product or product name, quantity) tuples.
+    :return:
+    """
+    indexes = {product.name: index for index, product in enumerate(product_list)}
+    counts = {}
+    for basket in baskets:
+        for product, quantity in basket:
+            name = product if isinstance(product, str) else product.name
+            if name not in indexes:
+                raise ValueError(f"Unknown product: {name}")
+            key = (indexes[name], quantity)
+            counts[key] = counts.get(key, 0) + 1
+    lines = {}
+    for (index, quantity), count in counts.items():
+        quantities, line_counts = lines.setdefault(index, ([], []))
+        quantities.append(quantity)
+        line_counts.append(count)
+    return lines
+
+
+def _evaluate(scenario) -> tuple:
+    """
+    Prices the reduced baskets under the promotions of a scenario. Runs in the worker processes.
+    """
+    name, assignments = scenario
+    revenue = units = promoted_units = list_revenue = 0
+    for index, (quantities, counts) in _lines.items():
+        product_name = _names[index]
+        promotion = assignments[product_name] if product_name in assignments else _promotions[index]
+        price = _prices[index]
+        line_units = sum(quantity * count for quantity, count in zip(quantities, counts))
+        units += line_units
+        list_revenue += price * line_units
+        if promotion:
+            totals = promotion.apply_promotion_bulk([price] * len(quantities), quantities)
+            revenue += sum(total * count for total, count in zip(totals, counts))
+            promoted_units += line_units
+        else:
+            revenue += price * line_units
+    return name, {"revenue": revenue, "units": units, "promoted_units": promoted_units,
+                  "discount": list_revenue - revenue}
+
+
+def simulate(product_list, baskets, scenarios, workers=None) -> dict:
+    """
+    Runs every scenario against the baskets. Returns a dict that maps "baseline" and the name of
+    every scenario to its results; the scenarios also get revenue_delta, units_delta and
+    promoted_units_delta against the baseline.
+    :param product_list: the catalog.
+    :param baskets: iterable of shopping lists of (product or product name, quantity) tuples.
+    :param scenarios: dict that maps the name of a scenario to its {product name: promotion} assignments.
+    :param workers: number of worker processes (None: one per CPU, 0: run in this process).
+    :return:
+    """
+    if "baseline" in scenarios:
+        raise ValueError("'baseline' is reserved for the current promotions!")
+    data = ([product.name for product in product_list], [product.price for product in product_list],
+            [product.promotion for product in product_list], reduce_baskets(product_list, baskets))
+    tasks = [("baseline", {})] + list(scenarios.items())
+    if workers == 0:
+        _init_worker(*data)
+        try:
+            results = dict(map(_evaluate, tasks))
+        finally:
+            _init_worker(None, None, None, None)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=data) as executor:
+            results = dict(executor.map(_evaluate, tasks))
+
+    baseline = results["baseline"]
+    for name in scenarios:
+        result = results[name]
+        for key in ("revenue", "units", "promoted_units"):
+            result[f"{key}_delta"] = result[key] - baseline[key]
+    return results
+
+
+def assign_all(product_list, promotion) -> dict:
+    """
+    Returns the assignments of a scenario where every product gets the same promotion.
+    :param product_list:
+    :param promotion:
+    :return:
+    """
+    return {product.name: promotion for product in product_list}
+
+
+def synthetic_baskets(product_list, basket_count, max_lines=3, max_quantity=4, seed=0):
+    """
+    Generator over random baskets of (product name, quantity) lines.
+    :param product_list:
+    :param basket_count:
+    :param max_lines:
+    :param max_quantity:
+    :param seed:
+    :return:
+    """
+    generator = random.Random(seed)
+    names = [product.name for product in product_list]
+    for _ in range(basket_count):
+        yield [(generator.choice(names), generator.randint(1, max_quantity))
+               for _ in range(generator.randint(1, max_lines))]
+
+
+def main():
+    import main as cli
+    import promotions
+
+    parser = argparse.ArgumentParser(description="Simulates the revenue impact of promotions on the demo catalog")
+    parser.add_argument("--baskets", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, help="number of worker processes (0: no pool)")
+    args = parser.parse_args()
+
+    product_list = cli.build_store().products
+    scenarios = {
+        "no promotions": assign_all(product_list, None),
+        "all 30% off": assign_all(product_list, promotions.PercentDiscount("30% off!", percent=30)),
+        "all second half price": assign_all(product_list, promotions.SecondHalfPrice("Second Half price!")),
+        "all third one free": assign_all(product_list, promotions.ThirdOneFree("Third One Free!")),
+    }
+    start_time = time.perf_counter()
+    results = simulate(product_list, synthetic_baskets(product_list, args.baskets), scenarios, args.workers)
+    seconds = time.perf_counter() - start_time
+    for name, result in results.items():
+        line = f"{name:24} revenue {result['revenue']:16,.2f}  promoted units {result['promoted_units']:10,}"
+        if name != "baseline":
+            line += f"  revenue delta {result['revenue_delta']:+16,.2f}"
+        print(line)
+    print(f"{args.baskets:,} baskets, {len(scenarios)} scenarios in {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Saves the catalog of a store to a compact binary columnar file, and opens it again.
+The file is opened through mmap: open_snapshot() only reads the header, and the columns are
+paged in by the operating system when rows are accessed. This way even a catalog of millions
+of products opens in milliseconds.
+
+File layout (little-endian):
+    header:      magic (8 bytes), product count (Q), names size (Q), promotions size (Q)
+    prices:      count x float64
+    quantities:  count x float64
+    maximums:    count x float64
+    promotions:  count x int32 (index in the promotions table, -1 for no promotion)
+    kinds:       count x int8 (see columnar.PRODUCT, NON_STOCKED and LIMITED)
+    active:      count x uint8
+    padding to a multiple of 8 bytes
+    name ends:   count x uint64 (end offset of every name in the names blob)
+    names:       utf-8 blob
+    promotions:  utf-8 JSON list of the promotions used by the catalog
+The columns are mapped as they are, so snapshots can only be opened on little-endian machines.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import columnar
+import promotions
+import rules
+import store
+
+MAGIC = b"BBSNAP01"
+HEADER = struct.Struct("<8sQQQ")
+
+# Promotion classes that can be saved, with the attributes needed to create them again
+PROMOTION_TYPES = {
+    "PercentDiscount": (promotions.PercentDiscount, ("name", "percent")),
+    "SecondHalfPrice": (promotions.SecondHalfPrice, ("name",)),
+    "ThirdOneFree": (promotions.ThirdOneFree, ("name",)),
+    # Saved as their rules, and compiled again when loaded
+    "CompiledPromotion": (rules.CompiledPromotion, ("name", "rules")),
+}
+
+
+def promotion_to_dict(promotion) -> dict:
+    """
+    Returns a JSON friendly description of a promotion.
+    :raises ValueError: if the promotion type cannot be saved.
+    :param promotion:
+    :return:
+    """
+    type_name = type(promotion).__name__
+    if type_name not in PROMOTION_TYPES:
+        raise ValueError(f"Promotion type {type_name} cannot be saved!")
+    fields = PROMOTION_TYPES[type_name][1]
+    description = {"type": type_name}
+    description.update((field, getattr(promotion, field)) for field in fields)
+    return description
+
+
+def promotion_from_dict(description):
+    """
+    Creates a promotion from the output of promotion_to_dict().
+    :raises ValueError: if the promotion type is unknown.
+    :param description:
+    :return:
+    """
+    if description["type"] not in PROMOTION_TYPES:
+        raise ValueError(f"Unknown promotion type {description['type']}!")
+    promotion_class, fields = PROMOTION_TYPES[description["type"]]
+    return promotion_class(*(description[field] for field in fields))
+
+
+def save_snapshot(product_list, path):
+    """
+    Saves the products (Product objects or table rows) to a snapshot file. The file is written
+    next to its final location first and then moved over it, so a crash never leaves half a snapshot.
+    :param product_list:
+    :param path:
+    :return: None
+    """
+    prices, quantities, maximums = array("d"), array("d"), array("d")
+    promotion_ids, kinds, active = array("i"), array("b"), bytearray()
+    name_ends, names = array("Q"), bytearray()
+    promotion_table, promotion_ids_by_object = [], {}
+    for product in product_list:
+        kind = product.kind if isinstance(product, columnar.ProductRow) else columnar.kind_of(product)
+        prices.append(product.price)
+        quantities.append(product.quantity)
+        maximums.append(product.maximum if kind == columnar.LIMITED else 0)
+        kinds.append(kind)
+        active.append(1 if product.is_active() else 0)
+        promotion = product.promotion
+        if promotion:
+            if id(promotion) not in promotion_ids_by_object:
+                promotion_ids_by_object[id(promotion)] = len(promotion_table)
+                promotion_table.append(promotion_to_dict(promotion))
+            promotion_ids.append(promotion_ids_by_object[id(promotion)])
+        else:
+            promotion_ids.append(-1)
+        names += product.name.encode("utf-8")
+        name_ends.append(len(names))
+
+    if sys.byteorder == "big":
+        for column in (prices, quantities, maximums, promotion_ids, name_ends):
+            column.byteswap()
+    promotions_blob = json.dumps(promotion_table).encode("utf-8")
+    count = len(kinds)
+    fixed_size = HEADER.size + count * (8 * 3 + 4 + 1 + 1)
+    padding = b"\0" * (-fixed_size % 8)
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, count, len(names), len(promotions_blob)))
+        for column in (prices, quantities, maximums, promotion_ids, kinds):
+            file.write(column.tobytes())
+        file.write(active)
+        file.write(padding)
+        file.write(name_ends.tobytes())
+        file.write(names)
+        file.write(promotions_blob)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+def save_store(best_buy, path):
+    """
+    Saves the whole catalog of a store (active and inactive products) to a snapshot file.
+    :param best_buy:
+    :param path:
+    :return: None
+    """
+    save_snapshot(best_buy.products, path)
+
+
+def open_snapshot(path):
+    """
+    Opens a snapshot file through mmap and returns it as a table of products.
+    :raises ValueError: if the file is not a snapshot.
+    :param path:
+    :return:
+    """
+    return MappedProductTable(path)
+
+
+def load_store(path):
+    """
+    Reads a snapshot file and returns a Store with all of its products.
+    :param path:
+    :return:
+    """
+    table = open_snapshot(path)
+    try:
+        return store.Store(table.to_products())
+    finally:
+        table.close()
+
+
+class _NameColumn:
+    """
+    Lazy list of the product names: a name is decoded only when it is accessed.
+    """
+
+    def __init__(self, ends, blob):
+        self._ends = ends
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._ends)
+
+    def __getitem__(self, row):
+        start = self._ends[row - 1] if row > 0 else 0
+        return str(self._blob[start:self._ends[row]], "utf-8")
+
+    def __iter__(self):
+        for row in range(len(self._ends)):
+            yield self[row]
+
+
+class _PromotionColumn:
+    """
+    Maps a row number to its promotion, like the promotions dict of a ProductTable, on top
+    of the promotion id column of the file.
+    """
+
+    def __init__(self, ids, table):
+        self._ids = ids
+        self._table = table
+        self._changed = {}
+
+    def get(self, row, default=None):
+        if row in self._changed:
+            return self._changed[row]
+        promotion_id = self._ids[row]
+        return default if promotion_id < 0 else self._table[promotion_id]
+
+    def __setitem__(self, row, promotion):
+        self._changed[row] = promotion
+
+    def pop(self, row, default=None):
+        promotion = self.get(row, default)
+        self._changed[row] = None
+        return promotion
+
+
+class MappedProductTable(columnar.ProductTable):
+    """
+    A ProductTable whose columns are read straight from a memory-mapped snapshot file.
+    Changes made to the rows (e.g. buy()) stay in memory and are never written back to the file;
+    use save_snapshot() to save them. Rows cannot be added to a mapped table.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        buffer = memoryview(self._mmap)
+        if len(buffer) >= HEADER.size:
+            magic, count, names_size, promotions_size = HEADER.unpack_from(buffer)
+        else:
+            magic = None
+        if magic != MAGIC:
+            buffer.release()
+            self._mmap.close()
+            raise ValueError(f"{path} is not a snapshot file!")
+
+        def column(offset, size, type_code):
+            return buffer[offset:offset + size].cast(type_code)
+
+        offset = HEADER.size
+        self.prices = column(offset, count * 8, "d")
+        self.quantities = column(offset + count * 8, count * 8, "d")
+        self.maximums = column(offset + count * 16, count * 8, "d")
+        offset += count * 24
+        promotion_ids = column(offset, count * 4, "i")
+        offset += count * 4
+        self.kinds = column(offset, count, "b")
+        self.active = column(offset + count, count, "B")
+        offset += count * 2
+        offset += -offset % 8
+        name_ends = column(offset, count * 8, "Q")
+        offset += count * 8
+        self.names = _NameColumn(name_ends, buffer[offset:offset + names_size])
+        offset += names_size
+        promotion_table = [promotion_from_dict(description) for description in
+                           json.loads(str(buffer[offset:offset + promotions_size], "utf-8"))]
+        self.promotions = _PromotionColumn(promotion_ids, promotion_table)
+        self._buffers = [buffer, self.prices, self.quantities, self.maximums, promotion_ids,
+                         self.kinds, self.active, name_ends, self.names._blob]
+        self._index = None
+
+    def add_row(self, name, kind, price, quantity, maximum=0, promotion=None, active=True) -> int:
+        raise ValueError("Rows cannot be added to a snapshot table!")
+
+    def get(self, name):
+        # The name index is only built the first time a product is looked up by name
+        if self._index is None:
+            self._index = {product_name: row for row, product_name in enumerate(self.names)}
+        return super().get(name)
+
+    def close(self):
+        """
+        Unmaps the file. The table and its rows cannot be used anymore after this call.
+        :return: None
+        """
+        for buffer in reversed(self._buffers):
+            buffer.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
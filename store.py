@@ -1,63 +1,573 @@
+import itertools
+import threading
+
+import money
+
+
 class Store:
+    """
+    The store keeps an indexed catalog of its products. Products are looked up by their name,
+    which acts as the stable product id, so adding and removing a product takes constant time.
+    The store also keeps a view of the active products which is updated by the products
+    themselves (through set_quantity(), activate() and deactivate()), so that listing the
+    active products never has to rescan the whole catalog.
+    The store can be shared by several threads: orders lock only the products they buy (see order()),
+    and the indexes and running totals are protected by a lock of their own.
+    In cents mode, the prices of orders and quotes are exact int numbers of cents (see money).
+    """
+
+    def __init__(self, products, cents=False):
+        self._lock = threading.RLock()
+        self._catalog = {}
+        self._active = {}
+        self._order_hooks = ()
+        self._commit_hooks = ()
+        self._catalog_listeners = ()
+        self.basket_promotion = None
+        self.reservations = None
+        self.cents = cents
+        # Running totals over the active products, kept up to date by _on_product_change()
+        # The value is kept in int cents: a float running sum drifts over many orders
+        self._total_quantity = 0
+        self._total_value_cents = 0
+        for product in products:
+            self.add_product(product)
 
-    def __init__(self, products):
-        self.products = products
+    @property
+    def products(self) -> list:
+        """
+        Returns every product in the catalog, active or not, in the order they were added.
+        :return:
+        """
+        return list(self._catalog.values())
 
     def add_product(self, product):
         """
-        Method to add a product to the list of available products
+        Method to add a product to the catalog of available products. If a product with the same
+        name already exists, then a ValueError exception is raised - this need to be handled by the caller.
+        :raises ValueError: if a product with the same name is already in the store.
         :param product:
         :return:
         """
-        self.products.append(product)
+        with self._lock:
+            if product.name in self._catalog:
+                raise ValueError("A product with the same name already exists!")
+            # Activated first: if its value cannot be computed, the store is left untouched
+            if product.is_active():
+                self._activate(product)
+            self._catalog[product.name] = product
+            product.add_listener(self._on_product_change)
+            for listener in self._catalog_listeners:
+                listener(product, "add")
 
     def remove_product(self, product):
         """
-        This method is used to remove a product from the list. If the product passed as the argument is not
-        on the list, then a ValueError exception is raised - this need to be handled by the caller.
+        This method is used to remove a product from the catalog. If the product passed as the argument is not
+        in the catalog, then a ValueError exception is raised - this need to be handled by the caller.
         :raises ValueError: if product to remove does not exist to begin with.
         :param product:
         :return:
         """
-        if product in self.products:
-            self.products.remove(product)
-        else:
-            raise ValueError("A non-existent product cannot be removed!")
+        with self._lock:
+            if self._catalog.get(product.name) is product:
+                del self._catalog[product.name]
+                if product.name in self._active:
+                    self._deactivate(product)
+                product.remove_listener(self._on_product_change)
+                for listener in self._catalog_listeners:
+                    listener(product, "remove")
+            else:
+                raise ValueError("A non-existent product cannot be removed!")
+
+    def upsert_products(self, product_list) -> tuple:
+        """
+        Adds many products at once. A product whose name is already in the store updates the
+        existing product in place (price, quantity and maximum), so that references to it stay
+        valid; if the existing product is of another class, it is replaced.
+        Note: the store lock is not held across the whole batch, since updating a product
+        takes its lock, and a product lock must never be taken while holding the store lock.
+        Returns a tuple (added, updated) with the number of products added and updated.
+        :param product_list:
+        :return:
+        """
+        added = updated = 0
+        for product in product_list:
+            existing = self._catalog.get(product.name)
+            if existing is None:
+                self.add_product(product)
+                added += 1
+            elif type(existing) is type(product):
+                with existing.lock:
+                    existing.set_price(product.price)
+                    if hasattr(product, "maximum"):
+                        existing.maximum = product.maximum
+                    existing.set_quantity(product.quantity)
+                updated += 1
+            else:
+                self.remove_product(existing)
+                self.add_product(product)
+                updated += 1
+        return added, updated
+
+    def get_product(self, name):
+        """
+        Returns the product with the given name, or None if there is no such product in the store.
+        :param name:
+        :return:
+        """
+        return self._catalog.get(name)
+
+    def _on_product_change(self, product, field, old_value, new_value):
+        """
+        Listener registered on every product of the catalog. Keeps the indexes of the store
+        up to date when the state of a product changes.
+        :param product:
+        :param field:
+        :param old_value:
+        :param new_value:
+        :return: None
+        """
+        with self._lock:
+            if field == "quantity":
+                if product.is_active():
+                    self._total_quantity += new_value - old_value
+                    self._total_value_cents += (new_value - old_value) * money.to_cents(product.price)
+            elif field == "price":
+                if product.is_active():
+                    self._total_value_cents += (money.to_cents(new_value) - money.to_cents(old_value)) * \
+                        product.quantity
+            elif field == "active":
+                if new_value:
+                    self._activate(product)
+                else:
+                    self._deactivate(product)
+
+    def _activate(self, product):
+        # The value is computed before any index is changed, since to_cents() can fail
+        value_cents = product.quantity * money.to_cents(product.price)
+        self._active[product.name] = product
+        self._total_quantity += product.quantity
+        self._total_value_cents += value_cents
+
+    def _deactivate(self, product):
+        value_cents = product.quantity * money.to_cents(product.price)
+        del self._active[product.name]
+        self._total_quantity -= product.quantity
+        self._total_value_cents -= value_cents
+
+    def get_total_quantity(self) -> float:
+        """
+        Returns how many units of the active products are in the store in total.
+        :return:
+        """
+        return self._total_quantity
+
+    def get_inventory_value(self) -> float:
+        """
+        Returns the total value (price * quantity) of the active products in the store, to the cent.
+        :return:
+        """
+        return self._total_value_cents / 100
 
-    def get_total_quantity(self) -> int:
+    def get_active_count(self) -> int:
         """
-        Returns how many items are in the store in total.
+        Returns how many products in the store are active.
         :return:
         """
-        return len(self.products)
+        return len(self._active)
+
+    def verify_totals(self, repair=False) -> dict:
+        """
+        Recomputes the store-wide totals from scratch and compares them with the running totals.
+        Returns a dict with an entry (tracked, actual) for every total that has drifted, so an
+        empty dict means that everything is consistent. If repair is True, the running totals
+        are reset to the recomputed values.
+        :param repair:
+        :return:
+        """
+        with self._lock:
+            active_products = [product for product in self._catalog.values() if product.is_active()]
+            actual = {
+                "quantity": sum(product.quantity for product in active_products),
+                "value": sum(product.quantity * money.to_cents(product.price) for product in active_products),
+                "active": len(active_products),
+            }
+            tracked = {
+                "quantity": self._total_quantity,
+                "value": self._total_value_cents,
+                "active": len(self._active),
+            }
+            drift = {key: (tracked[key], actual[key]) for key in actual if tracked[key] != actual[key]}
+            if repair and drift:
+                self._active = {product.name: product for product in active_products}
+                self._total_quantity = actual["quantity"]
+                self._total_value_cents = actual["value"]
+        if "value" in drift:
+            drift["value"] = tuple(cents / 100 for cents in drift["value"])
+        return drift
 
     def get_all_products(self) -> list:
         """
-        Returns all products in the store that are active.
+        Returns all products in the store that are active. Note that a product which is
+        re-activated (e.g. after a re-stock) moves to the end of the list.
         :return:
         """
-        active_products = [product for product in self.products if product.is_active()]
-        return active_products
+        with self._lock:
+            return list(self._active.values())
 
-    @staticmethod
-    def order(shopping_list) -> float:
+    def order(self, shopping_list, cart=None) -> float:
         """
         Gets a list of tuples, where each tuple has 2 items:
         Product (Product class) and quantity (int).
-        Buys the products and returns the total price of the order.
+        Buys the products and returns the total price of the order. The order is all-or-nothing:
+        the whole basket is validated first, and if any line cannot be bought then nothing is bought.
+        This method is thread-safe: the locks of all the products in the basket are held while the
+        order is validated and bought. They are always acquired in the same global order, so two
+        orders sharing some products can never deadlock.
+        If the store has a reservation manager (see set_reservations()), the quantities held by the
+        other carts cannot be bought, and the holds of the cart are released once the order is made.
         Note: The ValueError exception is intentionally overlooked since we want the caller to handle
         this exception.
         :raises ValueError: if available quantity less than quantity the buyer wants to purchase.
         :param shopping_list:
+        :param cart: id of the cart of the order, whose own holds can be bought.
         :return:
         """
-        total_price = 0
-        for item in shopping_list:
-            product = item[0]
-            quantity = item[1]
-            try:
-                total_price += product.buy(quantity)
-            except ValueError:
-                # Catch the Exception but pass it on to the caller
-                raise
+        shopping_list = list(shopping_list)
+        requested = _merge_lines(shopping_list)
+        locked_products = sorted(requested.products(), key=id)
+        for product in locked_products:
+            product.lock.acquire()
+        try:
+            _check_lines(requested)
+            reservations = self.reservations
+            if reservations:
+                reservations.check_order(requested, cart)
+            line_prices = self._commit(shopping_list, requested)
+            if reservations and cart is not None:
+                reservations.release(cart)
+        finally:
+            for product in reversed(locked_products):
+                product.lock.release()
+        for hook in self._commit_hooks:
+            hook(shopping_list, line_prices)
+        return self._total(line_prices)
+
+    def add_order_hook(self, hook):
+        """
+        Registers a callable that is called for every order made, while the products of the
+        order are still locked. It is called as hook(shopping_list, line_prices). If the hook
+        raises an exception, the order is rolled back.
+        :param hook:
+        :return: None
+        """
+        with self._lock:
+            self._order_hooks = self._order_hooks + (hook,)
+
+    def remove_order_hook(self, hook):
+        """
+        Unregisters a hook previously added with add_order_hook().
+        :raises ValueError: if the hook was never registered.
+        :param hook:
+        :return: None
+        """
+        with self._lock:
+            hooks = list(self._order_hooks)
+            hooks.remove(hook)
+            self._order_hooks = tuple(hooks)
+
+    def add_commit_hook(self, hook):
+        """
+        Registers a callable that is called for every order made, once it is committed and its
+        products are unlocked, so the hook sees only orders that happened and can be slow without
+        blocking the products. It is called as hook(shopping_list, line_prices), and cannot roll
+        the order back: an exception is passed on to the caller of order(), but the order is made.
+        :param hook:
+        :return: None
+        """
+        with self._lock:
+            self._commit_hooks = self._commit_hooks + (hook,)
+
+    def remove_commit_hook(self, hook):
+        """
+        Unregisters a hook previously added with add_commit_hook().
+        :raises ValueError: if the hook was never registered.
+        :param hook:
+        :return: None
+        """
+        with self._lock:
+            hooks = list(self._commit_hooks)
+            hooks.remove(hook)
+            self._commit_hooks = tuple(hooks)
+
+    def add_catalog_listener(self, listener):
+        """
+        Registers a callable that is called every time a product is added to or removed from the
+        catalog, as listener(product, "add") or listener(product, "remove"). It is called while
+        the store lock is held, so it must not take the lock of a product.
+        :param listener:
+        :return: None
+        """
+        with self._lock:
+            self._catalog_listeners = self._catalog_listeners + (listener,)
+
+    def remove_catalog_listener(self, listener):
+        """
+        Unregisters a listener previously added with add_catalog_listener().
+        :raises ValueError: if the listener was never registered.
+        :param listener:
+        :return: None
+        """
+        with self._lock:
+            listeners = list(self._catalog_listeners)
+            listeners.remove(listener)
+            self._catalog_listeners = tuple(listeners)
+
+    def get_page(self, page=1, page_size=20) -> list:
+        """
+        Returns one page of the active products, in the same order as get_all_products().
+        Pages are numbered from 1; a page past the end is empty.
+        :raises ValueError: if page or page_size is lower than 1.
+        :param page:
+        :param page_size:
+        :return:
+        """
+        if page < 1 or page_size < 1:
+            raise ValueError("Page and page size must be at least 1!")
+        start = (page - 1) * page_size
+        with self._lock:
+            return list(itertools.islice(self._active.values(), start, start + page_size))
+
+    def get_page_count(self, page_size=20) -> int:
+        """
+        Returns how many pages of page_size products get_page() has; 0 if no product is active.
+        :raises ValueError: if page_size is lower than 1, like get_page().
+        :param page_size:
+        :return:
+        """
+        if page_size < 1:
+            raise ValueError("Page and page size must be at least 1!")
+        return -(-len(self._active) // page_size)
+
+    def iter_products(self):
+        """
+        Generator over the active products, in the same order as get_all_products(), that does not
+        build the list of products. Products deactivated or removed during the iteration are
+        skipped; products activated during the iteration are not included.
+        :return:
+        """
+        with self._lock:
+            names = list(self._active)
+        active = self._active
+        for name in names:
+            product = active.get(name)
+            if product is not None:
+                yield product
+
+    def quote(self, shopping_list) -> tuple:
+        """
+        Gets a list of (product, quantity) tuples like order() does, but only prices the basket.
+        Nothing is bought and the stock is not checked. Returns a tuple (line_prices, total_price)
+        where line_prices has the price of every line of the basket, in the same order, and
+        total_price includes the basket promotion of the store, if any.
+        :param shopping_list:
+        :return:
+        """
+        if self.cents:
+            line_prices = [product.quote_cents(quantity) for product, quantity in shopping_list]
+        else:
+            line_prices = [product.quote(quantity) for product, quantity in shopping_list]
+        return line_prices, self._total(line_prices)
+
+    def set_basket_promotion(self, basket_promotion):
+        """
+        Sets a promotion that applies to the total of every order (e.g. a rules.BasketPromotion),
+        or None to remove it.
+        :param basket_promotion:
+        :return: None
+        """
+        self.basket_promotion = basket_promotion
+
+    def set_reservations(self, reservations):
+        """
+        Sets the reservation manager of the carts in progress (a reservations.ReservationManager),
+        or None to remove it.
+        :param reservations:
+        :return: None
+        """
+        self.reservations = reservations
+
+    def _total(self, line_prices) -> float:
+        total_price = sum(line_prices)
+        if self.basket_promotion:
+            if self.cents:
+                apply_basket_cents = getattr(self.basket_promotion, "apply_basket_cents", None)
+                if apply_basket_cents:
+                    return apply_basket_cents(total_price)
+                return money.to_cents(self.basket_promotion.apply_basket(total_price / 100))
+            total_price = self.basket_promotion.apply_basket(total_price)
         return total_price
+
+    def process_orders(self, orders) -> list:
+        """
+        Places a batch of orders, one after the other. A failing order does not stop the batch,
+        whatever the exception (e.g. the TypeError of a malformed line).
+        Returns a list with one (total_price, error) tuple per order: error is None if the
+        order was made, otherwise total_price is None and error is the reason of the failure.
+        :param orders:
+        :return:
+        """
+        results = []
+        for shopping_list in orders:
+            try:
+                results.append((self.order(shopping_list), None))
+            except Exception as error:
+                results.append((None, str(error)))
+        return results
+
+    def _commit(self, shopping_list, requested) -> list:
+        """
+        Buys every line of an already validated order, then passes the order to the order hooks.
+        If a line still fails, or a hook fails, the quantities of all products of the order are
+        rolled back before the exception is passed on to the caller.
+        Returns the list of the prices of the lines.
+        :param shopping_list:
+        :param requested:
+        :return:
+        """
+        snapshot = [(product, product.get_quantity()) for product in requested.products()]
+        _ordering.depth = getattr(_ordering, "depth", 0) + 1
+        try:
+            cents = self.cents
+            line_prices = [product.buy(quantity, cents) for product, quantity in shopping_list]
+            for hook in self._order_hooks:
+                hook(shopping_list, line_prices)
+        except Exception:
+            for product, quantity in snapshot:
+                if product.get_quantity() != quantity:
+                    product.set_quantity(quantity)
+            raise
+        finally:
+            _ordering.depth -= 1
+        return line_prices
+
+
+# Number of orders being committed by the current thread, see in_order()
+_ordering = threading.local()
+
+
+def in_order() -> bool:
+    """
+    Returns True while the current thread is committing an order: buying its lines, running the
+    order hooks or rolling it back. Lets product listeners tell the stock changes of orders from
+    the other ones (restocks, upserts, ...).
+    :return:
+    """
+    return getattr(_ordering, "depth", 0) > 0
+
+
+def is_valid_quantity(quantity) -> bool:
+    """
+    Checks a quantity that comes from outside the program (a request, an order file): it must be
+    a positive int. Floats are refused, NaN and fractions included, and so are booleans.
+    :param quantity:
+    :return:
+    """
+    return type(quantity) is int and quantity > 0
+
+
+def validate_order(shopping_list):
+    """
+    Checks in a single pass that every line of an order can be bought, without buying anything.
+    Lines for the same product are added up first, so that the product is checked against the
+    total quantity requested. Returns a Basket with the total quantity requested per product.
+    :raises ValueError: if at least one product of the order cannot be bought.
+    :param shopping_list:
+    :return:
+    """
+    requested = _merge_lines(shopping_list)
+    _check_lines(requested)
+    return requested
+
+
+def _merge_lines(shopping_list):
+    if isinstance(shopping_list, Basket):
+        return shopping_list
+    return Basket(shopping_list)
+
+
+def _check_lines(requested):
+    for product, quantity in requested:
+        product.check_purchase(quantity)
+
+
+class Basket:
+    """
+    The list of products that a customer wants to buy, with one line per product.
+    Lines are kept in a dict, so adding a product (or more of it) takes constant time, and the
+    lines keep the order in which the products were first added. A basket can be passed
+    anywhere a list of (product, quantity) tuples is expected: iterating over it yields them.
+    A line can never hold more than the maximum quantity allowed for a LimitedProduct.
+    """
+
+    def __init__(self, lines=()):
+        self._lines = {}
+        for product, quantity in lines:
+            self.add(product, quantity)
+
+    def add(self, product, quantity):
+        """
+        Adds a quantity of a product to the basket. If the product is already in the basket,
+        the quantity is added to its line.
+        :raises ValueError: if the line would hold more than the maximum allowed per customer.
+        :param product:
+        :param quantity:
+        :return: None
+        """
+        new_quantity = self._lines.get(product, 0) + quantity
+        maximum = getattr(product, "maximum", None)
+        if maximum is not None and new_quantity > maximum:
+            raise ValueError(f"A maximum of {maximum} units allowed per customer.")
+        self._lines[product] = new_quantity
+
+    def remove(self, product):
+        """
+        Removes the line of a product from the basket.
+        :raises ValueError: if the product is not in the basket.
+        :param product:
+        :return: None
+        """
+        if self._lines.pop(product, None) is None:
+            raise ValueError("A non-existent product cannot be removed!")
+
+    def get_quantity(self, product):
+        """
+        Returns the quantity of a product in the basket (0 if the product is not in the basket).
+        :param product:
+        :return:
+        """
+        return self._lines.get(product, 0)
+
+    def products(self):
+        return self._lines.keys()
+
+    def clear(self):
+        self._lines.clear()
+
+    def __iter__(self):
+        return iter(self._lines.items())
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __contains__(self, product):
+        return product in self._lines
+
+    def __eq__(self, other):
+        if not isinstance(other, Basket):
+            return NotImplemented
+        return list(self._lines.items()) == list(other._lines.items())
+
+    def __repr__(self):
+        lines = ", ".join(f"({product.name!r}, {quantity!r})" for product, quantity in self)
+        return f"Basket([{lines}])"
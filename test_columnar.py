@@ -0,0 +1,61 @@
+import pytest
+import columnar
+import products
+import promotions
+
+
+def make_table():
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100)
+    windows_license = products.NonStockedProduct("Windows License", price=125)
+    shipping_fee = products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)
+    macbook_air_m2.set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    product_list = [macbook_air_m2, windows_license, shipping_fee]
+    return product_list, columnar.ProductTable.from_products(product_list)
+
+
+def test_products_are_slotted():
+    shipping_fee = products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)
+    with pytest.raises(AttributeError):
+        shipping_fee.colour = "red"
+
+
+def test_rows_present_the_product_api():
+    product_list, table = make_table()
+    assert len(table) == 3
+    for product, row in zip(product_list, table):
+        assert row.name == product.name
+        assert row.price == product.price
+        assert row.quantity == product.quantity
+        assert row.get_promotion() is product.get_promotion()
+        assert row.show() == product.show()
+        assert row.quote(3) == product.quote(3)
+    assert table.get("Shipping").maximum == 1
+    with pytest.raises(AttributeError):
+        table.get("Windows License").maximum
+
+
+def test_row_buy():
+    product_list, table = make_table()
+    macbook_air_m2 = table.get("MacBook Air M2")
+    assert macbook_air_m2.buy(2) == 2175
+    assert macbook_air_m2.quantity == 98
+    with pytest.raises(ValueError, match="There is not enough in stock. Available quantity = 98"):
+        macbook_air_m2.buy(99)
+    assert table.get("Windows License").buy(1000) == 125000
+
+    shipping_fee = table.get("Shipping")
+    with pytest.raises(ValueError, match="A maximum of 1 units allowed per customer."):
+        shipping_fee.buy(2)
+    shipping_fee.set_quantity(1)
+    shipping_fee.buy(1)
+    assert shipping_fee.is_active() is False
+    assert [row.name for row in table.get_all_products()] == ["MacBook Air M2", "Windows License"]
+
+
+def test_to_products():
+    product_list, table = make_table()
+    table.get("Shipping").set_quantity(0)
+    copies = table.to_products()
+    assert [type(product) for product in copies] == [type(product) for product in product_list]
+    assert [product.show() for product in copies[:2]] == [product.show() for product in product_list[:2]]
+    assert copies[2].quantity == 0 and copies[2].is_active() is False
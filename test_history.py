@@ -0,0 +1,64 @@
+import pytest
+import history
+import products
+import promotions
+import store
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_aggregations():
+    clock = Clock()
+    order_history = history.OrderHistory(partition_seconds=3600, clock=clock)
+    mac = products.Product("MacBook Air M2", price=1450, quantity=100)
+    mac.set_promotion(promotions.PercentDiscount("30% off!", percent=30))
+    shipping = products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)
+    best_buy = store.Store([mac, shipping])
+    order_history.attach(best_buy)
+
+    best_buy.order([(mac, 2), (shipping, 1)])
+    clock.now = 5400
+    best_buy.order([(mac, 1)])
+    clock.now = 7300
+    best_buy.order([(shipping, 1)])
+    assert len(order_history) == 4
+    # An order that an order hook rolls back is not recorded, whatever the order of the hooks
+    def failing_hook(shopping_list, line_prices):
+        raise ValueError("Payment declined")
+    best_buy.add_order_hook(failing_hook)
+    with pytest.raises(ValueError, match="Payment declined"):
+        best_buy.order([(mac, 5)])
+    best_buy.remove_order_hook(failing_hook)
+    assert len(order_history) == 4
+
+    by_product = order_history.aggregate(by=("product",))
+    assert by_product[("MacBook Air M2",)] == {"lines": 2, "units": 3, "revenue": 2030 + 1015,
+                                               "list_revenue": 4350, "discount": 4350 - 3045}
+    assert by_product[("Shipping",)]["revenue"] == 20
+    by_promotion = order_history.aggregate(by=("promotion",))
+    assert by_promotion[(None,)]["discount"] == 0 and by_promotion[("30% off!",)]["discount"] == 1305
+    per_hour = order_history.aggregate(by=("time",), bucket=3600)
+    assert {group: total["units"] for group, total in per_hour.items()} == {(0,): 3, (3600,): 1, (7200,): 1}
+    # Partial chunks are filtered line by line
+    assert order_history.aggregate(by=(), start=1, end=7300) == {
+        (): {"lines": 1, "units": 1, "revenue": 1015, "list_revenue": 1450, "discount": 435}}
+    with pytest.raises(ValueError):
+        order_history.aggregate(by=("customer",))
+
+
+def test_cents_mode():
+    pen = products.Product("Pen", price=0.99, quantity=100)
+    pen.set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    best_buy = store.Store([pen], cents=True)
+    order_history = history.OrderHistory()
+    order_history.attach(best_buy)
+    best_buy.order([(pen, 2)])
+    assert order_history.aggregate(by=("promotion",)) == {
+        ("Second Half price!",): {"lines": 1, "units": 2, "revenue": 149, "list_revenue": 198, "discount": 49}}
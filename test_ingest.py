@@ -0,0 +1,83 @@
+import csv
+import ingest
+import products
+import store
+
+
+def write_feed(path, text):
+    path.write_text(text)
+    return path
+
+
+def test_ingest_csv(tmp_path):
+    feed = write_feed(tmp_path / "feed.csv",
+                      "type,name,price,quantity,maximum\n"
+                      "product,MacBook Air M2,1450,100,\n"
+                      "non_stocked,Windows License,125,,\n"
+                      "limited,Shipping,10,250,1\n"
+                      "product,,500,10,\n"
+                      "product,Google Pixel 7,-500,10,\n"
+                      "product,Nothing Phone (1),abc,10,\n"
+                      "limited,Gift Wrap,5,100,0\n"
+                      "tablet,iPad,700,10,\n")
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1500, quantity=3)
+    best_buy = store.Store([macbook_air_m2])
+    report = ingest.ingest(best_buy, feed, reject_path=tmp_path / "rejects.csv", workers=2, chunk_size=3)
+
+    assert (report["rows"], report["added"], report["updated"], report["rejected"]) == (8, 2, 1, 5)
+    # Existing products are updated in place
+    assert best_buy.get_product("MacBook Air M2") is macbook_air_m2
+    assert macbook_air_m2.show() == "MacBook Air M2, Price: 1450, Quantity: 100"
+    assert isinstance(best_buy.get_product("Windows License"), products.NonStockedProduct)
+    assert best_buy.get_product("Shipping").maximum == 1
+    assert best_buy.get_total_quantity() == 350
+
+    with open(tmp_path / "rejects.csv", newline="") as file:
+        rejects = list(csv.reader(file))
+    assert rejects[0] == ["line", "reason", "row"]
+    assert [(line, reason) for line, reason, row in rejects[1:]] == [
+        ("5", "Required parameter: Argument cannot be blank!"),
+        ("6", "Price and/or quantity cannot be a negative number!"),
+        ("7", "could not convert string to float: 'abc'"),
+        ("8", "Maximum must be a positive number!"),
+        ("9", "Unknown product type: tablet"),
+    ]
+
+
+def test_ingest_jsonl(tmp_path):
+    feed = write_feed(tmp_path / "feed.jsonl",
+                      '{"type": "product", "name": "Google Pixel 7", "price": 500, "quantity": 250}\n'
+                      '{"type": "limited", "name": "Google Pixel 7", "price": 500, "quantity": 5, "maximum": 2}\n'
+                      '{"name": "Bose QuietComfort Earbuds", "price": 250, "quantity": 500}\n'
+                      '{"name": "broken\n')
+    best_buy = store.Store([])
+    report = ingest.ingest(best_buy, feed, workers=0)
+    assert (report["rows"], report["added"], report["updated"], report["rejected"]) == (4, 2, 1, 1)
+    # A row of another type replaces the product
+    assert isinstance(best_buy.get_product("Google Pixel 7"), products.LimitedProduct)
+    assert best_buy.get_total_quantity() == 505
+
+
+def test_ingest_rejects_non_finite_numbers(tmp_path):
+    feed = write_feed(tmp_path / "feed.csv",
+                      "type,name,price,quantity,maximum\n"
+                      "product,MacBook Air M2,nan,100,\n"
+                      "product,Google Pixel 7,500,inf,\n"
+                      "product,Bose QuietComfort Earbuds,1e400,10,\n"
+                      "limited,Shipping,10,250,NaN\n"
+                      "product,Nothing Phone (1),600,10,\n")
+    best_buy = store.Store([])
+    report = ingest.ingest(best_buy, feed, reject_path=tmp_path / "rejects.csv", workers=0)
+    assert (report["rows"], report["added"], report["rejected"]) == (5, 1, 4)
+    assert [product.name for product in best_buy.products] == ["Nothing Phone (1)"]
+    with open(tmp_path / "rejects.csv", newline="") as file:
+        reasons = [reason for line, reason, row in list(csv.reader(file))[1:]]
+    assert reasons == ["Not a finite number: nan", "Not a finite number: inf", "Not a finite number: inf",
+                       "Not a finite number: nan"]
+
+    jsonl_feed = write_feed(tmp_path / "feed.jsonl",
+                            '{"name": "Google Pixel 7", "price": NaN, "quantity": 250}\n'
+                            '{"name": "Google Pixel 7", "price": 500, "quantity": Infinity}\n'
+                            '{"name": "Google Pixel 7", "price": 500, "quantity": 250}\n')
+    report = ingest.ingest(best_buy, jsonl_feed, workers=0)
+    assert (report["rows"], report["added"], report["rejected"]) == (3, 1, 2)
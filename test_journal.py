@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+import journal
+import products
+import promotions
+import snapshot
+import store
+
+
+def make_store():
+    product_list = [products.Product("MacBook Air M2", price=1450, quantity=100),
+                    products.NonStockedProduct("Windows License", price=125),
+                    products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)]
+    product_list[0].set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    return store.Store(product_list)
+
+
+def test_recover_from_snapshot_and_journal(tmp_path):
+    snapshot_path, journal_path = tmp_path / "catalog.snap", tmp_path / "orders.journal"
+    best_buy = make_store()
+    macbook_air_m2 = best_buy.get_product("MacBook Air M2")
+    shipping_fee = best_buy.get_product("Shipping")
+    snapshot.save_store(best_buy, snapshot_path)
+
+    order_journal = journal.OrderJournal(journal_path, group_size=2)
+    order_journal.attach(best_buy)
+    best_buy.order([(macbook_air_m2, 10), (shipping_fee, 1)])
+    best_buy.order([(best_buy.get_product("Windows License"), 5)])
+    with pytest.raises(ValueError):
+        best_buy.order([(macbook_air_m2, 91)])  # Failed orders are not recorded
+    best_buy.order([(macbook_air_m2, 90), (shipping_fee, 1)])
+    order_journal.sync()
+
+    # "Crash": a new store is rebuilt from the files only
+    recovered = journal.recover(snapshot_path, journal_path)
+    assert [product.show() for product in recovered.products] == [product.show() for product in best_buy.products]
+    assert recovered.get_all_products()[0].name == "Windows License"
+
+    # After a checkpoint, the journal is empty and the snapshot holds everything
+    journal.checkpoint(best_buy, snapshot_path, order_journal)
+    assert list(journal.read_journal(journal_path)) == []
+    best_buy.order([(shipping_fee, 1)])
+    order_journal.close()
+    assert journal.recover(snapshot_path, journal_path).get_product("Shipping").quantity == 247
+
+
+def test_torn_and_corrupt_entries(tmp_path):
+    journal_path = tmp_path / "orders.journal"
+    journal_path.write_text('{"lines": [["Shipping", 1]]}\n{"lines": [["Shipp')
+    assert list(journal.read_journal(journal_path)) == [[("Shipping", 1)]]
+
+    journal_path.write_text('{"lines": [["Shipp\n{"lines": [["Shipping", 1]]}\n')
+    with pytest.raises(ValueError, match="Corrupt journal entry"):
+        list(journal.read_journal(journal_path))
+
+    journal_path.write_text('{"lines": [["Nothing Phone (1)", 1]]}\n')
+    with pytest.raises(ValueError, match="Journal refers to an unknown product: Nothing Phone"):
+        journal.replay(make_store(), journal_path)
+
+
+def test_journal_follows_every_stock_change(tmp_path):
+    snapshot_path, journal_path = tmp_path / "catalog.snap", tmp_path / "orders.journal"
+    best_buy = make_store()
+    macbook_air_m2 = best_buy.get_product("MacBook Air M2")
+    shipping_fee = best_buy.get_product("Shipping")
+    snapshot.save_store(best_buy, snapshot_path)
+
+    order_journal = journal.OrderJournal(journal_path, group_size=1000, group_interval=0.01)
+    order_journal.attach(best_buy)
+
+    # An order that a later order hook rolls back is not recorded
+    def failing_hook(shopping_list, line_prices):
+        raise ValueError("Payment declined")
+    best_buy.add_order_hook(failing_hook)
+    with pytest.raises(ValueError, match="Payment declined"):
+        best_buy.order([(macbook_air_m2, 10)])
+    best_buy.remove_order_hook(failing_hook)
+
+    # Restocks and upserts are recorded, so the orders after them can be replayed
+    best_buy.order([(macbook_air_m2, 100)])
+    macbook_air_m2.set_quantity(50)
+    best_buy.upsert_products([products.LimitedProduct("Shipping", price=10, quantity=500, maximum=1)])
+    best_buy.order([(macbook_air_m2, 20), (shipping_fee, 1)])
+
+    # The last group is synced by the timer, without any sync() or further order
+    time.sleep(0.1)
+    assert [product.show() for product in journal.recover(snapshot_path, journal_path).products] == \
+        [product.show() for product in best_buy.products]
+
+    # close() syncs what is left
+    order_journal.group_interval = 60
+    best_buy.order([(shipping_fee, 1)])
+    order_journal.close()
+    assert journal.recover(snapshot_path, journal_path).get_product("Shipping").quantity == 498
+
+
+def test_stock_changes_do_not_wait_for_fsync(tmp_path, monkeypatch):
+    best_buy = make_store()
+    macbook_air_m2 = best_buy.get_product("MacBook Air M2")
+    order_journal = journal.resume(best_buy, tmp_path / "orders.journal")
+    syncing, release = threading.Event(), threading.Event()
+    real_fsync = journal.os.fsync
+
+    def slow_fsync(fd):
+        syncing.set()
+        release.wait(5)
+        real_fsync(fd)
+    monkeypatch.setattr(journal.os, "fsync", slow_fsync)
+    best_buy.order([(macbook_air_m2, 1)])
+    sync = threading.Thread(target=order_journal.sync)
+    sync.start()
+    assert syncing.wait(5)
+    # The disk sync is in progress: a restock still goes through right away
+    restock = threading.Thread(target=macbook_air_m2.set_quantity, args=(150,))
+    restock.start()
+    restock.join(1)
+    assert not restock.is_alive()
+    release.set()
+    sync.join()
+    order_journal.close()
+    assert list(journal.read_journal(tmp_path / "orders.journal")) == [[("MacBook Air M2", 1)],
+                                                                       [("MacBook Air M2", -51)]]
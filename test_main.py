@@ -1,6 +1,12 @@
+import json
+import os
+import subprocess
+import sys
+import time
 import main
 import pytest
 import products
+import store
 # import promotions
 
 
@@ -10,10 +16,13 @@ def test_has_enough_qty():
     windows_license = products.NonStockedProduct("Windows License", price=125)
     google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
 
-    basket = ((macbook_air_m2, 101), (windows_license, 1), (google_pixel, 10))
+    basket = store.Basket(((macbook_air_m2, 101), (windows_license, 1), (google_pixel, 10)))
     assert main.has_enough_qty(basket) is False
-    basket = ((macbook_air_m2, 100), (windows_license, 1000), (google_pixel, 10))
+    basket = store.Basket(((macbook_air_m2, 100), (windows_license, 1000), (google_pixel, 10)))
     assert main.has_enough_qty(basket) is True
+    # Quantities of the same product are added up
+    basket.add(macbook_air_m2, 1)
+    assert main.has_enough_qty(basket) is False
 
 
 def test_update_basket():
@@ -22,12 +31,126 @@ def test_update_basket():
     windows_license = products.NonStockedProduct("Windows License", price=125)
     google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
 
-    basket = [(macbook_air_m2, 10), (windows_license, 1), (google_pixel, 10)]
+    basket = store.Basket([(macbook_air_m2, 10), (windows_license, 1), (google_pixel, 10)])
     updated_basket = [(macbook_air_m2, 15), (windows_license, 1), (google_pixel, 10)]
-    assert main.update_basket(macbook_air_m2, 5, basket) == updated_basket
-    basket = [(macbook_air_m2, 10), (windows_license, 1), (google_pixel, 10)]
+    assert list(main.update_basket(macbook_air_m2, 5, basket)) == updated_basket
+    basket = store.Basket([(macbook_air_m2, 10), (windows_license, 1), (google_pixel, 10)])
     updated_basket = [(macbook_air_m2, 10), (windows_license, 22), (google_pixel, 10)]
-    assert main.update_basket(windows_license, 21, basket) == updated_basket
+    assert list(main.update_basket(windows_license, 21, basket)) == updated_basket
+    # A product that is not in the basket yet gets a new line at the end
+    shipping_fee = products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)
+    main.update_basket(shipping_fee, 1, basket)
+    assert list(basket)[-1] == (shipping_fee, 1)
+    with pytest.raises(ValueError, match="A maximum of 1 units allowed per customer."):
+        main.update_basket(shipping_fee, 1, basket)
+    assert basket.get_quantity(shipping_fee) == 1
+
+
+def test_list_all_products():
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100)
+    windows_license = products.NonStockedProduct("Windows License", price=125)
+    best_buy = store.Store([macbook_air_m2, windows_license])
+    assert main.list_all_products(best_buy) == "------\n" \
+                                               "1. MacBook Air M2, Price: 1450, Quantity: 100\n" \
+                                               "2. Windows License, Price: 125\n" \
+                                               "------"
+    # The cached text follows the changes of the product
+    macbook_air_m2.buy(10)
+    assert macbook_air_m2.show() == "MacBook Air M2, Price: 1450, Quantity: 90"
+    macbook_air_m2.set_price(1200)
+    assert macbook_air_m2.show() == "MacBook Air M2, Price: 1200, Quantity: 90"
+
+
+def test_lazy_store():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return main.build_store()
+
+    lazy_store = main.LazyStore(loader)
+    assert not lazy_store.is_loaded() and calls == []
+    assert lazy_store.get_total_quantity() == 1100
+    assert lazy_store.get_active_count() == 5 and calls == [1]
+    background_store = main.LazyStore(main.build_store, background=True)
+    assert len(background_store.get_all_products()) == 5 and background_store.is_loaded()
+    with pytest.raises(ZeroDivisionError):
+        main.LazyStore(lambda: 1 / 0).get_store()
+
+
+def test_commands(tmp_path, capsys):
+    assert main.main(["total"]) == 0
+    assert capsys.readouterr().out == "Total of 1100 item in store\n"
+    assert main.main(["list"]) == 0
+    assert "5. Shipping, Price: 10" in capsys.readouterr().out
+    order_file = tmp_path / "order.json"
+    order_file.write_text('[[3, 2], ["Shipping", 1]]')
+    assert main.main(["order", str(order_file)]) == 0
+    assert capsys.readouterr().out == "Order made! Total payment: 1010\n"
+    order_file.write_text('[["Shipping", 2]]')
+    assert main.main(["order", str(order_file)]) == 1
+    assert "A maximum of 1 units allowed per customer." in capsys.readouterr().out
+    # With a journal, the orders of one run are recovered by the next one
+    journal_file = tmp_path / "orders.journal"
+    order_file.write_text('[["Google Pixel 7", 5]]')
+    assert main.main(["--journal", str(journal_file), "order", str(order_file)]) == 0
+    time.sleep(0.2)  # The journal syncs the last group from a timer
+    capsys.readouterr()
+    assert main.main(["--journal", str(journal_file), "total"]) == 0
+    assert capsys.readouterr().out == "Total of 1095 item in store\n"
+    # Only positive ints are quantities
+    for quantity in ("NaN", "2.5", "true"):
+        order_file.write_text(f'[["Google Pixel 7", {quantity}]]')
+        assert main.main(["order", str(order_file)]) == 1
+        assert "Not a valid quantity" in capsys.readouterr().out
+
+
+
+def test_metrics_option(tmp_path):
+    # Run as a script, so that the menu actions run in __main__ and not in the main module
+    metrics_file, prometheus_file = tmp_path / "metrics.json", tmp_path / "metrics.prom"
+    subprocess.run([sys.executable, "main.py", "--metrics", str(metrics_file), "list"], check=True,
+                   cwd=os.path.dirname(main.__file__), capture_output=True)
+    assert json.loads(metrics_file.read_text())["calls"]["main.iter_listing"] == 1
+    subprocess.run([sys.executable, "main.py", "--metrics", str(prometheus_file), "total"], check=True,
+                   cwd=os.path.dirname(main.__file__), capture_output=True)
+    assert 'bestbuy_calls_total{operation="main.get_total_qty"} 1' in prometheus_file.read_text()
+
+
+def test_replay_orders(tmp_path, capsys):
+    best_buy = main.build_store()
+    orders_file = tmp_path / "orders.jsonl"
+    results_file = tmp_path / "results.jsonl"
+    orders_file.write_text('[[3, 2], ["Shipping", 1]]\n'
+                           '\n'
+                           '{"id": "A-2", "lines": [["Google Pixel 7", 300]]}\n'
+                           '{"id": "A-3", "lines": [[9, 1]]}\n'
+                           '[["Windows License", "two"]]\n'
+                           'not json\n'
+                           '{"lines": [["Shipping", 1], [1, 1]]}\n'
+                           '[["Google Pixel 7", NaN]]\n'
+                           '{"id": "A-9", "lines": [["Google Pixel 7", 2.5]]}\n'
+                           '[["Nothing Phone (1)", 1]]\n'
+                           '[[["x"], 1]]\n'
+                           '[[true, 1]]\n')
+    report = main.replay_orders(best_buy, orders_file, results_file, chunk_size=2)
+    assert {key: report[key] for key in ("orders", "lines", "made", "failed")} == \
+           {"orders": 11, "lines": 5, "made": 2, "failed": 9}
+    results = [json.loads(line) for line in results_file.read_text().splitlines()]
+    assert results[0] == {"line": 1, "ok": True, "total": 1010}
+    assert results[1] == {"line": 3, "id": "A-2", "ok": False,
+                          "error": "There is not enough in stock. Available quantity = 248"}
+    assert results[2]["error"] == "Unknown product number: 9"
+    assert [result["ok"] for result in results[3:]] == [False, False, True] + [False] * 5
+    assert results[6] == {"line": 8, "ok": False, "error": "Not a valid quantity: nan"}
+    assert results[7] == {"line": 9, "id": "A-9", "ok": False, "error": "Not a valid quantity: 2.5"}
+    assert results[8] == {"line": 10, "ok": False, "error": "Unknown product: Nothing Phone (1)"}
+    assert results[9] == {"line": 11, "ok": False, "error": "Not a product number or name: ['x']"}
+    assert results[10] == {"line": 12, "ok": False, "error": "Not a product number or name: True"}
+    assert best_buy.get_product("Shipping").get_quantity() == 248
+
+    assert main.main(["replay", str(orders_file)]) == 0
+    assert "11 orders (5 lines)" in capsys.readouterr().out
 
 
 pytest.main()
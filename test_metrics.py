@@ -0,0 +1,46 @@
+import pytest
+import main
+import metrics
+import products
+import promotions
+import store
+
+
+def test_enable_records_and_disable_restores():
+    original_order, original_buy = store.Store.order, products.Product.buy
+    metrics.reset()
+    metrics.enable()
+    try:
+        iphone = products.Product("MacBook Air M2", price=1450, quantity=100)
+        iphone.set_promotion(promotions.PercentDiscount("30% off!", percent=30))
+        best_buy = store.Store([iphone, products.NonStockedProduct("Windows License", price=125),
+                                products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)])
+        best_buy.order([(iphone, 2)])
+        with pytest.raises(ValueError):
+            best_buy.order([(iphone, 1000)])
+        with pytest.raises(ValueError):
+            iphone.buy(1000)
+        best_buy.get_all_products()
+        main.list_all_products(best_buy)
+    finally:
+        metrics.disable()
+    assert store.Store.order is original_order and products.Product.buy is original_buy
+
+    data = metrics.snapshot()
+    assert data["calls"]["Store.order"] == 2
+    assert data["stock_out_rejections"] == {"Store.order": 1, "Product.buy": 1}
+    assert data["calls"]["PercentDiscount.apply_promotion"] == 1
+    assert data["calls"]["main.list_all_products"] == 1
+    assert data["latency"]["Store.order"]["count"] == 2
+    assert data["promotions"]["hits"] == {"30% off!": 1}
+    assert data["promotions"]["hit_rate"] == 1.0
+
+    text = metrics.to_prometheus()
+    assert 'bestbuy_calls_total{operation="Store.order"} 2' in text
+    assert 'bestbuy_latency_seconds_bucket{operation="Store.order",le="+Inf"} 2' in text
+    assert '"Store.order": 2' in metrics.to_json()
+
+    # Disabled: nothing more is recorded
+    best_buy.order([(iphone, 1)])
+    assert metrics.snapshot()["calls"]["Store.order"] == 2
+    metrics.reset()
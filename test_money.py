@@ -0,0 +1,50 @@
+import money
+import products
+import promotions
+import rules
+import store
+
+
+def test_conversions():
+    assert money.to_cents(99.99) == 9999 and money.to_cents(1450) == 145000
+    assert money.to_cents("0.015") == 2 and money.to_cents(0.1 + 0.2) == 30
+    assert money.format_cents(9999) == "99.99" and money.format_cents(-5) == "-0.05"
+    assert money.to_decimal(9999) == money.to_decimal(1) * 9999
+    assert money.divide(5, 2) == 3 and money.divide(-5, 2) == -3 and money.divide(4, 3) == 1
+
+
+def test_promotions_in_cents():
+    third_one_free = promotions.ThirdOneFree("Third One Free!")
+    for quantity in range(0, 20):
+        # The default method prices through the float method and rounds to the cent
+        assert third_one_free.apply_promotion_cents(99, quantity) == \
+               promotions.Promotion.apply_promotion_cents(third_one_free, 99, quantity)
+    assert promotions.PercentDiscount("30% off!", percent=30).apply_promotion_cents(99, 3) == 208
+    assert promotions.PercentDiscount("12.5% off!", percent=12.5).apply_promotion_cents(800, 1) == 700
+    # 0.99 * 0.5 + 0.99 is 1.4849999... as a float; the exact price is 1.485, rounded half up
+    assert promotions.SecondHalfPrice("Second Half price!").apply_promotion_cents(99, 2) == 149
+
+
+def test_store_in_cents_mode_is_exact():
+    product = products.Product("Pen", price=0.1, quantity=10 ** 6)
+    product.set_promotion(promotions.ThirdOneFree("Third One Free!"))
+    cents_store = store.Store([product], cents=True)
+    totals = [cents_store.order([(product, 3)]) for _ in range(1000)]
+    assert sum(totals) == 20000 and all(isinstance(total, int) for total in totals)
+    assert cents_store.quote([(product, 3)]) == ([20], 20)
+    assert products.NonStockedProduct("Windows License", price=125.5).buy(2, cents=True) == 25100
+
+
+def test_basket_promotion_in_cents():
+    basket_promotion = rules.compile_basket_promotion("Big baskets", [
+        {"type": "basket_threshold", "minimum": 10.05, "percent": 12.5},
+        {"type": "basket_threshold", "minimum": 5, "amount": 0.1},
+    ])
+    # 12.5% off 10.05 is 8.79375: rounded half up to the cent, then 0.10 off
+    assert basket_promotion.apply_basket_cents(1005) == 869
+    assert basket_promotion.apply_basket_cents(1004) == 994
+    assert basket_promotion.apply_basket_cents(5) == 5
+    product = products.Product("Pen", price=3.35, quantity=100)
+    cents_store = store.Store([product], cents=True)
+    cents_store.set_basket_promotion(basket_promotion)
+    assert cents_store.order([(product, 3)]) == 869
@@ -1,3 +1,5 @@
+import threading
+
 import pytest
 import products
 import promotions
@@ -26,6 +28,9 @@ def test_create_product_bad():
         products.Product("Google Pixel 7", price=-1, quantity=-10)
         products.Product("Google Pixel 7", price=-1, quantity=10)
         products.Product("Google Pixel 7", price=500, quantity=-10)
+    for price, quantity in ((float("nan"), 10), (500, float("inf")), (float("-inf"), 10)):
+        with pytest.raises(ValueError, match="Price and/or quantity must be a finite number!"):
+            products.Product("Google Pixel 7", price=price, quantity=quantity)
 
 
 def test_inactive_when_zero():
@@ -136,4 +141,58 @@ def test_product_with_promotion():
     assert google_pixel.buy(5) == 2000
 
 
+def test_quote_does_not_buy():
+    """
+    Test that quoting a price does not change the stock, and that the cached quote follows
+    price and promotion changes.
+    """
+    google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
+    assert google_pixel.quote(5) == 2500
+    assert google_pixel.quantity == 250
+    # A quote is not limited by the stock
+    assert google_pixel.quote(300) == 150000
+
+    google_pixel.set_promotion(promotions.ThirdOneFree("Buy 2 get 1 free"))
+    assert google_pixel.quote(5) == 2000
+    google_pixel.set_price(400)
+    assert google_pixel.get_price() == 400
+    assert google_pixel.quote(5) == 1600
+    assert google_pixel.buy(5) == 1600
+    with pytest.raises(ValueError, match="Price cannot be a negative number!"):
+        google_pixel.set_price(-1)
+
+
+def test_price_and_promotion_changes_wait_for_the_lock():
+    """
+    Test that a price or promotion change waits for a purchase in progress (the product lock).
+    """
+    google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
+    with google_pixel.lock:
+        changes = [threading.Thread(target=google_pixel.set_price, args=(400,)),
+                   threading.Thread(target=google_pixel.set_promotion,
+                                    args=(promotions.ThirdOneFree("Buy 2 get 1 free"),))]
+        for thread in changes:
+            thread.start()
+            thread.join(0.05)
+        assert google_pixel.price == 500 and google_pixel.promotion is None
+        assert google_pixel.buy(3) == 1500
+    for thread in changes:
+        thread.join()
+    assert google_pixel.quote(3) == 800
+
+    # A purchase is priced before a price change waiting for the lock can run
+    changes = []
+
+    def change_price_during_sale(product, field, old_value, new_value):
+        if field == "sale":
+            change = threading.Thread(target=product.set_price, args=(100,))
+            change.start()
+            change.join(0.05)
+            changes.append(change)
+    google_pixel.add_listener(change_price_during_sale)
+    assert google_pixel.buy(1) == 400
+    changes[0].join()
+    assert google_pixel.price == 100
+
+
 pytest.main()
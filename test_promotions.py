@@ -61,4 +61,23 @@ def test_buy_2_get_1_free():
     assert buy_2_get_1_free.apply_promotion(shipping_fee, 6) == 40
 
 
+def test_bulk_pricing_matches_apply_promotion():
+    # Instantiate the promotions
+    thirty_off = promotions.PercentDiscount("30% off", 30)
+    second_half_price = promotions.SecondHalfPrice("Buy 1 get 1 half price")
+    buy_2_get_1_free = promotions.ThirdOneFree("Buy 2 get 1 free")
+
+    prices = [1450, 125, 10, 99.99, 0.5, 333.33] * 10
+    quantities = list(range(1, len(prices) + 1))
+    groups = {thirty_off: (prices, quantities), second_half_price: (prices, quantities),
+              buy_2_get_1_free: (prices, quantities), None: (prices, quantities)}
+    totals = promotions.apply_promotions_bulk(groups)
+
+    for promotion in (thirty_off, second_half_price, buy_2_get_1_free):
+        expected = [promotion.apply_promotion(products.NonStockedProduct("Test", price), quantity)
+                    for price, quantity in zip(prices, quantities)]
+        assert totals[promotion] == expected
+    assert totals[None] == [price * quantity for price, quantity in zip(prices, quantities)]
+
+
 pytest.main()
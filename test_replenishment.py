@@ -0,0 +1,79 @@
+import pytest
+import products
+import replenishment
+import store
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rolling_counter():
+    counter = replenishment.RollingCounter(window=100, buckets=10)
+    counter.add(5, 3)
+    counter.add(55, 2)
+    assert counter.get_total(99) == 5
+    assert counter.get_total(105) == 2
+    assert counter.get_rate(105) == 2 / 100
+    assert counter.get_total(1000) == 0
+
+
+def test_reorder_and_restock():
+    clock = Clock()
+    raised = []
+    engine = replenishment.ReplenishmentEngine(lead_time=10, review_period=10, window=100, buckets=10,
+                                               clock=clock, on_reorder=lambda product, quantity: raised.append(quantity))
+    iphone = products.Product("iPhone 14", price=1000, quantity=20)
+    windows = products.NonStockedProduct("Windows License", price=125)
+    best_buy = store.Store([iphone, windows])
+    engine.attach(best_buy)
+
+    # 1 unit per second: the reorder point is 10 units, and the order-up-to level 20 units
+    for second in range(1, 11):
+        clock.now = second
+        iphone.buy(1)
+        windows.buy(1)
+    assert engine.velocity(iphone) == 1.0 and engine.velocity(windows) == 0.0
+    assert engine.get_reorders() == {iphone: 10} and raised == [10]
+
+    best_buy.order([(iphone, 10)])
+    assert not iphone.is_active() and best_buy.get_all_products() == [windows]
+    assert len(raised) == 1
+    assert engine.restock() == 1
+    assert iphone.is_active() and iphone.get_quantity() == 10 and engine.get_reorders() == {}
+    assert best_buy.get_all_products() == [windows, iphone]
+
+
+def test_rolled_back_orders_are_not_counted():
+    clock = Clock()
+    engine = replenishment.ReplenishmentEngine(lead_time=10, review_period=10, window=100, buckets=10, clock=clock)
+    iphone = products.Product("iPhone 14", price=1000, quantity=100)
+    best_buy = store.Store([iphone])
+    engine.attach(best_buy)
+
+    def failing_hook(shopping_list, line_prices):
+        raise ValueError("Payment declined")
+    best_buy.add_order_hook(failing_hook)
+    clock.now = 2
+    for _ in range(5):
+        with pytest.raises(ValueError, match="Payment declined"):
+            best_buy.order([(iphone, 19)])
+    assert iphone.get_quantity() == 100
+    assert engine.velocity(iphone) == 0.0 and engine.get_reorders() == {}
+
+    best_buy.remove_order_hook(failing_hook)
+    best_buy.order([(iphone, 19)])
+    assert engine.velocity(iphone) == 19 / 10  # Rates are over one bucket (10 seconds) at least
+
+
+def test_simulation():
+    demand = list(replenishment.synthetic_demand(sku_count=10, order_count=5000, orders_per_day=1000, seed=1))
+    assert len(demand) == 5000 and demand == sorted(demand)
+    report = replenishment.simulate(demand, sku_count=10, initial_stock=50)
+    assert report["orders"] == 5000 and report["reorders"] > 0
+    assert report["units_sold"] + report["units_lost"] == sum(quantity for _, _, quantity in demand)
@@ -0,0 +1,63 @@
+import pytest
+import products
+import reservations
+import store
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_holds_reduce_what_other_carts_can_buy():
+    clock = Clock()
+    manager = reservations.ReservationManager(ttl=60, clock=clock)
+    iphone = products.Product("iPhone 14", price=1000, quantity=5)
+    windows = products.NonStockedProduct("Windows License", price=125)
+    best_buy = store.Store([iphone, windows])
+    best_buy.set_reservations(manager)
+    alice, bob = manager.new_cart(), manager.new_cart()
+
+    manager.hold(alice, iphone, 2)
+    manager.hold(alice, iphone, 1)
+    manager.hold(alice, windows, 100)
+    assert manager.held(iphone) == 3
+    assert manager.available(iphone, bob) == 2 and manager.available(iphone, alice) == 5
+    with pytest.raises(ValueError, match="Available quantity = 2"):
+        manager.hold(bob, iphone, 3)
+    with pytest.raises(ValueError):
+        best_buy.order([(iphone, 3)], cart=bob)
+    manager.hold(bob, windows, 5)
+
+    # Alice checks out: her holds are released, and the stock is taken
+    assert best_buy.order([(iphone, 3)], cart=alice) == 3000
+    assert iphone.get_quantity() == 2 and manager.held(iphone) == 0
+    assert len(manager) == 1
+
+
+def test_expired_holds_are_swept():
+    clock = Clock()
+    manager = reservations.ReservationManager(ttl=60, clock=clock)
+    shipping = products.LimitedProduct("Shipping", price=10, quantity=3, maximum=1)
+    best_buy = store.Store([shipping])
+    best_buy.set_reservations(manager)
+    manager.hold("cart 1", shipping, 1)
+    manager.hold("cart 2", shipping, 1, ttl=10)
+    with pytest.raises(ValueError, match="maximum"):
+        manager.hold("cart 1", shipping, 1)
+
+    clock.now = 30
+    assert manager.sweep() == 1
+    # Extending the hold of cart 1 leaves its first heap entry behind, which must be skipped
+    manager.release("cart 1")
+    manager.hold("cart 1", shipping, 1)
+    assert manager.held(shipping) == 1
+    clock.now = 60
+    assert manager.sweep() == 0
+    clock.now = 90
+    assert manager.sweep() == 1
+    assert len(manager) == 0 and manager.available(shipping) == 3
@@ -0,0 +1,94 @@
+import pytest
+import products
+import promotions
+import rules
+import store
+
+
+def test_built_in_rules_match_promotions():
+    prices = [1450, 125, 10, 99.99, 0.5, 333.33]
+    quantities = range(0, 40)
+    for promotion in (promotions.PercentDiscount("30% off", 30), promotions.PercentDiscount("15% off", 15),
+                      promotions.SecondHalfPrice("Buy 1 get 1 half price"),
+                      promotions.ThirdOneFree("Buy 2 get 1 free")):
+        compiled = rules.compile_promotion(promotion.name, [rules.rule_from_promotion(promotion)])
+        for price in prices:
+            product = products.NonStockedProduct("Test", price)
+            for quantity in quantities:
+                assert compiled.apply_promotion(product, quantity) == promotion.apply_promotion(product, quantity)
+    buy_2_get_1_free = rules.compile_promotion("Buy 2 get 1 free", [{"type": "buy_x_get_y", "buy": 2, "get": 1}])
+    assert buy_2_get_1_free.apply_promotion_bulk(prices, [5] * 6) == \
+           promotions.ThirdOneFree("Buy 2 get 1 free").apply_promotion_bulk(prices, [5] * 6)
+
+
+def test_rules_in_cents():
+    for promotion in (promotions.PercentDiscount("30% off", 30), promotions.PercentDiscount("12.5% off", 12.5),
+                      promotions.SecondHalfPrice("Buy 1 get 1 half price"),
+                      promotions.ThirdOneFree("Buy 2 get 1 free")):
+        compiled = rules.compile_promotion(promotion.name, [rules.rule_from_promotion(promotion)])
+        for price_cents in (145000, 12500, 150, 99, 9999, 1, 0):
+            for quantity in range(0, 40):
+                assert compiled.apply_promotion_cents(price_cents, quantity) == \
+                       promotion.apply_promotion_cents(price_cents, quantity)
+
+    pen = products.Product("Pen", price=1.5, quantity=100)
+    pen.set_promotion(rules.compile_promotion("30% off", [{"type": "percent_discount", "percent": 30}]))
+    assert pen.quote_cents(1) == 105
+    pen.set_price(0.99)
+    pen.set_promotion(rules.compile_promotion("Volume discount", [{"type": "tiered_percent", "tiers": [[3, 10]]}]))
+    assert pen.quote_cents(2) == 198 and pen.quote_cents(3) == 267
+    buy_2_get_1_free = rules.compile_promotion("Buy 2 get 1 free", [{"type": "buy_x_get_y", "buy": 2, "get": 1}])
+    assert buy_2_get_1_free.apply_promotion_cents(99, 5) == 396
+
+    # Stacked rules price the next rule from the exact discounted unit price: 2 * 99 = 198, then 10% off
+    stacked = rules.compile_promotion("Stacked", [{"type": "third_one_free"},
+                                                  {"type": "percent_discount", "percent": 10}])
+    assert stacked.apply_promotion_cents(99, 3) == 178
+    assert stacked.apply_promotion_cents(99, 0) == 0
+    cents_store = store.Store([pen], cents=True)
+    assert cents_store.order([(pen, 3)]) == 267
+
+
+def test_new_and_stacked_rules():
+    google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
+    buy_3_get_1 = rules.compile_promotion("Buy 3 get 1 free", [{"type": "buy_x_get_y", "buy": 3, "get": 1}])
+    assert buy_3_get_1.apply_promotion(google_pixel, 9) == 500 * 7
+
+    tiered = rules.compile_promotion("Volume discount", [{"type": "tiered_percent", "tiers": [[10, 5], [50, 10]]}])
+    assert tiered.apply_promotion(google_pixel, 9) == 4500
+    assert tiered.apply_promotion(google_pixel, 10) == 4750
+    assert tiered.apply_promotion(google_pixel, 50) == 22500
+
+    # Third one free, then 10% off the discounted price
+    stacked = rules.compile_promotion("Stacked", [{"type": "third_one_free"},
+                                                  {"type": "percent_discount", "percent": 10}])
+    google_pixel.set_promotion(stacked)
+    assert google_pixel.buy(3) == 900
+    assert google_pixel.buy(0) == 0
+
+    with pytest.raises(ValueError, match="Unknown rule type: free_lunch"):
+        rules.compile_promotion("Oops", [{"type": "free_lunch"}])
+    with pytest.raises(ValueError, match="Rule percent_discount needs a 'percent'!"):
+        rules.compile_promotion("Oops", [{"type": "percent_discount"}])
+
+
+def test_time_windows_and_basket_rules():
+    now = [100]
+    flash_sale = rules.compile_promotion("Flash sale", [{"type": "percent_discount", "percent": 50,
+                                                         "start": 50, "end": 200}], clock=lambda: now[0])
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1000, quantity=100)
+    shipping_fee = products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)
+    macbook_air_m2.set_promotion(flash_sale)
+    assert macbook_air_m2.quote(1) == 500
+    now[0] = 200
+    assert macbook_air_m2.quote(1) == 1000
+
+    best_buy = store.Store([macbook_air_m2, shipping_fee])
+    best_buy.set_basket_promotion(rules.compile_basket_promotion("Big baskets", [
+        {"type": "basket_threshold", "minimum": 2000, "percent": 10},
+        {"type": "basket_threshold", "minimum": 1000, "amount": 100},
+    ]))
+    assert best_buy.quote([(shipping_fee, 1)]) == ([10], 10)
+    assert best_buy.quote([(macbook_air_m2, 4)]) == ([4000], 3500)
+    now[0] = 150
+    assert best_buy.order(store.Basket([(macbook_air_m2, 2), (shipping_fee, 1)])) == 1010 - 100
@@ -0,0 +1,52 @@
+import products
+import promotions
+import search
+import store
+
+
+def make_store():
+    product_list = [products.Product("MacBook Air M2", price=1450, quantity=100),
+                    products.Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                    products.Product("Google Pixel 7", price=500, quantity=250),
+                    products.NonStockedProduct("Windows License", price=125),
+                    products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)]
+    product_list[1].set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    return store.Store(product_list), product_list
+
+
+def test_queries():
+    best_buy, (mac, bose, pixel, windows, shipping) = make_store()
+    index = search.SearchIndex()
+    index.attach(best_buy)
+    assert len(index) == 5
+    assert index.search("mac ai") == [mac]
+    assert index.search("qui ear") == [bose]
+    assert index.search("macbok air", fuzzy=True)[0] is mac
+    assert index.search(min_price=125, max_price=500) == [windows, bose, pixel]
+    assert index.search(max_price=500, product_class=products.Product, limit=2) == [shipping, windows]
+    assert index.search(product_class=products.LimitedProduct) == [shipping]
+    assert index.search(promotion=True) == [bose]
+    assert index.search(promotion="Second Half price!", min_price=300) == []
+    assert len(index.search(promotion=False)) == 4
+
+
+def test_incremental_updates():
+    best_buy, (mac, bose, pixel, windows, shipping) = make_store()
+    index = search.SearchIndex()
+    index.attach(best_buy)
+    best_buy.order([(pixel, 250)])
+    assert index.search("google") == [] and len(index) == 4
+    pixel.set_quantity(10)
+    assert index.search("google") == [pixel]
+    mac.set_price(999)
+    mac.set_promotion(promotions.PercentDiscount("30% off!", percent=30))
+    assert index.search(max_price=1000, promotion="30% off!") == [mac]
+    best_buy.remove_product(bose)
+    assert index.search("bose") == []
+    iphone = products.Product("Apple iPhone 14", price=1000, quantity=10)
+    best_buy.add_product(iphone)
+    assert index.search("iph") == [iphone]
+    # Same results as a linear scan
+    assert index.search(min_price=100, max_price=1000) == \
+           sorted((product for product in best_buy.get_all_products() if 100 <= product.price <= 1000),
+                  key=lambda product: (product.price, product.name))
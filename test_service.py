@@ -0,0 +1,54 @@
+import asyncio
+import json
+import main
+import service
+
+
+def test_handle_request():
+    best_buy = main.build_store()
+    order_service = service.OrderService(best_buy)
+    response = order_service.handle_request(b'{"id": 1, "op": "quote", "lines": [["MacBook Air M2", 2]]}')
+    assert response == {"id": 1, "ok": True, "lines": [2175], "total": 2175}
+    response = order_service.handle_request(b'{"id": 2, "op": "order", "lines": [["Shipping", 2]]}')
+    assert response == {"id": 2, "ok": False, "error": "A maximum of 1 units allowed per customer."}
+    response = order_service.handle_request(b'{"id": 3, "op": "order", "lines": [["Nothing Phone (1)", 1]]}')
+    assert response == {"id": 3, "ok": False, "error": "Unknown product: Nothing Phone (1)"}
+    response = order_service.handle_request(b'{"id": 4, "op": "sell"}')
+    assert response == {"id": 4, "ok": False, "error": "Unknown operation: sell"}
+    assert order_service.handle_request(b'not json')["ok"] is False
+    # Only positive ints are quantities: NaN, fractions and booleans are refused
+    for quantity in (b"NaN", b"2.5", b"2.0", b"true", b"0"):
+        response = order_service.handle_request(b'{"id": 5, "op": "order", "lines": [["Google Pixel 7", '
+                                                + quantity + b']]}')
+        assert response == {"id": 5, "ok": False, "error": "Invalid quantity for Google Pixel 7"}
+    assert best_buy.get_total_quantity() == 1100
+
+
+def test_concurrent_clients():
+    best_buy = main.build_store()
+
+    async def client(port, requests):
+        reader, writer = await asyncio.open_connection(service.DEFAULT_HOST, port)
+        responses = []
+        for request in requests:
+            writer.write((json.dumps(request) + "\n").encode("utf-8"))
+            await writer.drain()
+            responses.append(json.loads(await reader.readline()))
+        writer.close()
+        return responses
+
+    async def run():
+        server = await service.OrderService(best_buy, max_connections=8).start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            orders = [{"id": i, "op": "order", "lines": [["Google Pixel 7", 1], ["Shipping", 1]]} for i in range(5)]
+            results = await asyncio.gather(*(client(port, orders) for _ in range(50)))
+            total = await client(port, [{"op": "total"}, {"op": "list"}])
+        return results, total
+
+    results, (total, listing) = asyncio.run(run())
+    assert sum(response["ok"] for responses in results for response in responses) == 250
+    assert best_buy.get_product("Google Pixel 7").quantity == 0
+    assert total["quantity"] == 1100 - 500
+    assert [product["name"] for product in listing["products"]] == \
+           ["MacBook Air M2", "Bose QuietComfort Earbuds", "Windows License"]
@@ -0,0 +1,83 @@
+import pytest
+import products
+import promotions
+import sharding
+
+
+def make_products():
+    product_list = [products.Product(f"Product {i}", price=10, quantity=100) for i in range(20)]
+    product_list.append(products.NonStockedProduct("Windows License", price=125))
+    product_list.append(products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1))
+    product_list[0].set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    return product_list
+
+
+def test_sharded_orders():
+    product_list = make_products()
+    names = [product.name for product in product_list]
+    with sharding.ShardedStore(product_list, shard_count=3) as sharded_store:
+        # The catalog really is spread across the shards
+        assert len({sharding.shard_index(name, 3) for name in names}) == 3
+        assert sharded_store.get_total_quantity() == 20 * 100 + 250
+        assert sorted(product.name for product in sharded_store.get_all_products()) == sorted(names)
+
+        # An order across several shards
+        cross_shard = [(name, 2) for name in names[:10]]
+        assert sharded_store.order(cross_shard) == 15 + 9 * 20
+        assert sharded_store.get_total_quantity() == 20 * 100 + 250 - 20
+
+        # A failing line aborts the whole order in every shard
+        with pytest.raises(ValueError, match="A maximum of 1 units allowed per customer."):
+            sharded_store.order(cross_shard + [("Shipping", 2)])
+        with pytest.raises(ValueError, match="Unknown product: Nothing Phone"):
+            sharded_store.order(cross_shard + [("Nothing Phone (1)", 1)])
+        assert sharded_store.get_total_quantity() == 20 * 100 + 250 - 20
+
+        results = sharded_store.process_orders([[("Product 15", 100)], [("Product 15", 1)],
+                                                cross_shard, [("Windows License", 3)]])
+        assert results == [(1000, None), (None, "There is not enough in stock. Available quantity = 0"),
+                           (195, None), (375, None)]
+        assert "Product 15" not in [product.name for product in sharded_store.get_all_products()]
+
+        sharded_store.add_product(products.Product("Google Pixel 7", price=500, quantity=250))
+        with pytest.raises(ValueError, match="A product with the same name already exists!"):
+            sharded_store.add_product(products.Product("Google Pixel 7", price=500, quantity=250))
+        assert sharded_store.order([("Google Pixel 7", 2), ("Shipping", 1)]) == 1010
+
+
+def test_sharded_order_failures():
+    product_list = make_products()
+    names = [product.name for product in product_list[:20]]
+    with sharding.ShardedStore(product_list, shard_count=3) as sharded_store:
+        # Quantities are checked before the lines are routed
+        with pytest.raises(ValueError, match="Invalid quantity for Product 1"):
+            sharded_store.order([("Product 1", "2")])
+        assert sharded_store.process_orders([[("Product 3", -100)], [("Product 3", 2.5)]]) == \
+            [(None, "Invalid quantity for Product 3")] * 2
+        # A malformed command is answered with an error, and the shard keeps working
+        shard = sharded_store.shards[sharding.shard_index("Product 1", 3)]
+        with pytest.raises(ValueError):
+            shard.call(sharding._ORDER, [("Product 1", "2")])
+        results = [None]
+        sharded_store._run_batches({sharding.shard_index("Product 1", 3): ([0], 5)}, results)
+        assert results[0][0] is None and "not iterable" in results[0][1]
+        assert sharded_store.process_orders([[("Product 1", "2")], [("Product 1", 2)]])[1] == (20, None)
+        assert sharded_store.order([("Product 1", 1)]) == 10
+
+        # A line that fails in the last shard gives back the stock reserved in the other shards
+        last_shard = max(sharding.shard_index(name, 3) for name in names)
+        failing = next(name for name in names if sharding.shard_index(name, 3) == last_shard)
+        others = [(name, 5) for name in names if sharding.shard_index(name, 3) < last_shard]
+        total_quantity = sharded_store.get_total_quantity()
+        with pytest.raises(ValueError, match="There is not enough in stock"):
+            sharded_store.order(others + [(failing, 1000)])
+        assert sharded_store.get_total_quantity() == total_quantity
+        sharded_store.order(others + [(failing, 5)])
+        assert sharded_store.get_total_quantity() == total_quantity - 5 * (len(others) + 1)
+
+        # Orders are made in the input order, cross-shard ones included
+        sharded_store.add_product(products.Product("Google Pixel 7", price=500, quantity=10))
+        other = next(name for name in names
+                     if sharding.shard_index(name, 3) != sharding.shard_index("Google Pixel 7", 3))
+        results = sharded_store.process_orders([[("Google Pixel 7", 10), (other, 1)], [("Google Pixel 7", 1)]])
+        assert results[1] == (None, "There is not enough in stock. Available quantity = 0")
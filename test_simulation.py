@@ -0,0 +1,33 @@
+import pickle
+import products
+import promotions
+import rules
+import simulation
+
+
+def test_scenarios():
+    mac = products.Product("MacBook Air M2", price=1450, quantity=100)
+    shipping = products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)
+    mac.set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    baskets = [[("MacBook Air M2", 2), (shipping, 1)], [(mac, 3)], [(mac, 2)]]
+    buy_1_get_1 = rules.compile_promotion("Buy 1 get 1 free", [{"type": "buy_x_get_y", "buy": 1, "get": 1}])
+    scenarios = {"30% off": {"MacBook Air M2": promotions.PercentDiscount("30% off!", percent=30)},
+                 "no promotions": simulation.assign_all([mac, shipping], None),
+                 "buy 1 get 1": simulation.assign_all([mac, shipping], buy_1_get_1)}
+    for workers in (0, 2):
+        results = simulation.simulate([mac, shipping], baskets, scenarios, workers=workers)
+        assert results["baseline"] == {"revenue": 2175 * 2 + 3625 + 10, "units": 8, "promoted_units": 7,
+                                       "discount": 7 * 1450 - 2175 * 2 - 3625}
+        assert results["30% off"]["revenue"] == 2030 * 2 + 3045 + 10
+        assert results["30% off"]["revenue_delta"] == 2030 * 2 + 3045 - 2175 * 2 - 3625
+        assert results["no promotions"]["promoted_units_delta"] == -7
+        assert results["no promotions"]["units_delta"] == 0
+        assert results["buy 1 get 1"]["revenue"] == 1450 * 4 + 10
+    # The original promotions are left untouched
+    assert mac.get_promotion().name == "Second Half price!" and shipping.get_promotion() is None
+
+
+def test_compiled_promotions_can_be_pickled():
+    promotion = rules.compile_promotion("Volume discount", [{"type": "tiered_percent", "tiers": [[10, 5]]}])
+    copy = pickle.loads(pickle.dumps(promotion))
+    assert copy.name == promotion.name and copy.apply_promotion_bulk([100], [10]) == [950]
@@ -0,0 +1,79 @@
+import pytest
+import products
+import promotions
+import rules
+import snapshot
+import store
+
+
+def make_store():
+    product_list = [products.Product("MacBook Air M2", price=1450, quantity=100),
+                    products.Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                    products.Product("Google Pixel 7", price=499.99, quantity=250),
+                    products.NonStockedProduct("Windows License", price=125),
+                    products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1),
+                    products.Product("Nothing Phone (1)", price=400, quantity=3)]
+    product_list[0].set_promotion(promotions.SecondHalfPrice("Second Half price!"))
+    product_list[1].set_promotion(promotions.ThirdOneFree("Third One Free!"))
+    product_list[3].set_promotion(promotions.PercentDiscount("30% off!", percent=30))
+    product_list[4].set_promotion(product_list[3].get_promotion())
+    product_list[2].set_promotion(rules.compile_promotion("Volume discount", [
+        {"type": "tiered_percent", "tiers": [[3, 5], [10, 10]]}, {"type": "third_one_free"}]))
+    product_list[5].buy(3)
+    return store.Store(product_list)
+
+
+def test_round_trip(tmp_path):
+    best_buy = make_store()
+    path = tmp_path / "catalog.snap"
+    snapshot.save_store(best_buy, path)
+    loaded = snapshot.load_store(path)
+
+    assert [product.show() for product in loaded.products] == [product.show() for product in best_buy.products]
+    assert [type(product) for product in loaded.products] == [type(product) for product in best_buy.products]
+    assert [product.name for product in loaded.get_all_products()] == \
+           [product.name for product in best_buy.get_all_products()]
+    assert loaded.get_total_quantity() == best_buy.get_total_quantity()
+    # Shared promotions stay shared
+    assert loaded.get_product("Shipping").get_promotion() is loaded.get_product("Windows License").get_promotion()
+    assert loaded.get_product("Windows License").get_promotion().percent == 30
+    assert loaded.get_product("Google Pixel 7").get_promotion().rules == \
+           best_buy.get_product("Google Pixel 7").get_promotion().rules
+    for product in best_buy.products:
+        assert loaded.get_product(product.name).quote(5) == product.quote(5)
+
+
+def test_open_snapshot_is_lazy_and_copy_on_write(tmp_path):
+    best_buy = make_store()
+    path = tmp_path / "catalog.snap"
+    snapshot.save_store(best_buy, path)
+    with snapshot.open_snapshot(path) as table:
+        assert len(table) == 6
+        macbook_air_m2 = table.get("MacBook Air M2")
+        assert macbook_air_m2.show() == best_buy.get_product("MacBook Air M2").show()
+        assert macbook_air_m2.buy(2) == 2175
+        assert macbook_air_m2.quantity == 98
+        assert table[4].maximum == 1
+        with pytest.raises(ValueError, match="Rows cannot be added to a snapshot table!"):
+            table.append(products.Product("Google Pixel 8", price=700, quantity=1))
+    # Changes made through the mapped table are not written to the file
+    assert snapshot.load_store(path).get_product("MacBook Air M2").quantity == 100
+
+
+def test_bad_files(tmp_path):
+    path = tmp_path / "catalog.snap"
+    path.write_bytes(b"not a snapshot at all, just some text")
+    with pytest.raises(ValueError, match="is not a snapshot file!"):
+        snapshot.open_snapshot(path)
+
+    class HalfPrice(promotions.Promotion):
+        def __init__(self, name):
+            self.name = name
+
+        def apply_promotion(self, product, quantity) -> float:
+            return product.price * quantity / 2
+
+    google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
+    google_pixel.set_promotion(HalfPrice("Half price"))
+    with pytest.raises(ValueError, match="Promotion type HalfPrice cannot be saved!"):
+        snapshot.save_snapshot([google_pixel], path)
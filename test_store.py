@@ -0,0 +1,260 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import products
+import promotions
+import store
+
+
+def test_add_and_get_product():
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100)
+    best_buy = store.Store([macbook_air_m2])
+    assert best_buy.get_product("MacBook Air M2") is macbook_air_m2
+    assert best_buy.get_product("Nothing Phone (1)") is None
+    with pytest.raises(ValueError, match="A product with the same name already exists!"):
+        best_buy.add_product(products.Product("MacBook Air M2", price=1, quantity=1))
+
+
+def test_remove_product():
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100)
+    google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
+    best_buy = store.Store([macbook_air_m2, google_pixel])
+    best_buy.remove_product(macbook_air_m2)
+    assert best_buy.products == [google_pixel]
+    assert best_buy.get_all_products() == [google_pixel]
+    with pytest.raises(ValueError, match="A non-existent product cannot be removed!"):
+        best_buy.remove_product(macbook_air_m2)
+    # A removed product no longer updates the store
+    macbook_air_m2.deactivate()
+    macbook_air_m2.activate()
+    assert best_buy.get_all_products() == [google_pixel]
+
+
+def test_active_view_follows_products():
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100)
+    windows_license = products.NonStockedProduct("Windows License", price=125)
+    google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
+    best_buy = store.Store([macbook_air_m2, windows_license, google_pixel])
+    assert best_buy.get_all_products() == [macbook_air_m2, windows_license, google_pixel]
+
+    macbook_air_m2.buy(100)
+    assert best_buy.get_all_products() == [windows_license, google_pixel]
+    google_pixel.deactivate()
+    assert best_buy.get_all_products() == [windows_license]
+    # Re-stock brings the product back
+    macbook_air_m2.set_quantity(5)
+    google_pixel.activate()
+    assert best_buy.get_all_products() == [windows_license, macbook_air_m2, google_pixel]
+
+
+def test_running_totals():
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100)
+    windows_license = products.NonStockedProduct("Windows License", price=125)
+    google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
+    best_buy = store.Store([macbook_air_m2, windows_license, google_pixel])
+    assert best_buy.get_total_quantity() == 350
+    assert best_buy.get_inventory_value() == 1450 * 100 + 500 * 250
+    assert best_buy.get_active_count() == 3
+
+    macbook_air_m2.buy(100)
+    google_pixel.buy(50)
+    windows_license.buy(10)
+    assert best_buy.get_total_quantity() == 200
+    assert best_buy.get_inventory_value() == 500 * 200
+    assert best_buy.get_active_count() == 2
+
+    macbook_air_m2.set_quantity(10)
+    google_pixel.deactivate()
+    assert best_buy.get_total_quantity() == 10
+    assert best_buy.get_inventory_value() == 1450 * 10
+    assert best_buy.get_active_count() == 2
+
+    best_buy.remove_product(macbook_air_m2)
+    assert best_buy.get_total_quantity() == 0
+    assert best_buy.verify_totals() == {}
+
+
+def test_verify_totals_reports_drift():
+    google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
+    best_buy = store.Store([google_pixel])
+    # Bypass set_quantity() so that the store is not notified
+    google_pixel.quantity = 200
+    assert best_buy.verify_totals() == {"quantity": (250, 200), "value": (125000, 100000)}
+    assert best_buy.verify_totals(repair=True) != {}
+    assert best_buy.verify_totals() == {}
+    assert best_buy.get_total_quantity() == 200
+
+
+def test_failed_add_leaves_the_store_untouched():
+    google_pixel = products.Product("Google Pixel 7", price=500, quantity=250)
+    best_buy = store.Store([google_pixel])
+    broken = products.Product("Nothing Phone (1)", price=600, quantity=10)
+    broken.price = float("nan")  # Bypass set_price() validation
+    with pytest.raises(ValueError):
+        best_buy.add_product(broken)
+    assert best_buy.get_product("Nothing Phone (1)") is None
+    assert best_buy.get_all_products() == [google_pixel]
+    assert broken.listeners == ()
+    assert best_buy.verify_totals() == {} and best_buy.get_inventory_value() == 125000
+    with pytest.raises(ValueError, match="A non-existent product cannot be removed!"):
+        best_buy.remove_product(broken)
+
+
+def test_totals_do_not_drift():
+    product_list = [products.Product(f"Product {i}", price=price, quantity=100000)
+                    for i, price in enumerate((0.1, 0.7, 19.99, 33.33, 1234.56))]
+    best_buy = store.Store(product_list)
+    for i in range(5000):
+        best_buy.order([(product_list[i % 5], 1 + i % 3), (product_list[(i + 2) % 5], 2)])
+        if i % 1000 == 0:
+            product_list[i % 5].set_price(product_list[i % 5].price + 0.01)
+    assert best_buy.verify_totals() == {}
+    assert best_buy.get_inventory_value() == round(sum(product.price * product.quantity
+                                                       for product in product_list), 2)
+
+
+def test_order_is_all_or_nothing():
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100)
+    windows_license = products.NonStockedProduct("Windows License", price=125)
+    shipping_fee = products.LimitedProduct("Shipping", price=10, quantity=250, maximum=1)
+    best_buy = store.Store([macbook_air_m2, windows_license, shipping_fee])
+
+    assert best_buy.order([(macbook_air_m2, 10), (windows_license, 2), (shipping_fee, 1)]) == 14760
+    assert macbook_air_m2.quantity == 90
+    assert shipping_fee.quantity == 249
+
+    # The last line fails, so the first one must not be bought either
+    with pytest.raises(ValueError, match="A maximum of 1 units allowed per customer."):
+        best_buy.order([(macbook_air_m2, 10), (shipping_fee, 2)])
+    assert macbook_air_m2.quantity == 90
+    # Lines for the same product are checked against the total quantity
+    with pytest.raises(ValueError, match="There is not enough in stock. Available quantity = 90"):
+        best_buy.order([(macbook_air_m2, 50), (windows_license, 1), (macbook_air_m2, 41)])
+    assert macbook_air_m2.quantity == 90
+    assert best_buy.verify_totals() == {}
+
+
+def test_process_orders():
+    google_pixel = products.Product("Google Pixel 7", price=500, quantity=10)
+    best_buy = store.Store([google_pixel])
+    results = best_buy.process_orders([[(google_pixel, 4)], [(google_pixel, 7)], [(google_pixel, 6)]])
+    assert results == [(2000, None),
+                       (None, "There is not enough in stock. Available quantity = 6"),
+                       (3000, None)]
+    assert google_pixel.quantity == 0
+    assert best_buy.get_all_products() == []
+
+    # A malformed order fails on its own, and the results of the batch are kept
+    google_pixel.set_quantity(10)
+    results = best_buy.process_orders([[(google_pixel, 4)], [(google_pixel, "2")], [(google_pixel, 1)]])
+    assert results[0] == (2000, None) and results[2] == (500, None)
+    assert results[1][0] is None and results[1][1]
+    assert google_pixel.quantity == 5
+
+
+def test_concurrent_orders_never_oversell():
+    """
+    Many threads hammer the same hot product. Every unit must be sold exactly once.
+    """
+    hot_product = products.Product("Google Pixel 7", price=500, quantity=1000)
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100000)
+    best_buy = store.Store([hot_product, macbook_air_m2])
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        def checkout(i):
+            # Half of the baskets list the products the other way round (lock ordering)
+            if i % 2:
+                basket = [(hot_product, 1), (macbook_air_m2, 1)]
+            else:
+                basket = [(macbook_air_m2, 1), (hot_product, 1)]
+            try:
+                best_buy.order(basket)
+            except ValueError:
+                return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(checkout, range(3000)))
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert results.count(True) == 1000
+    assert hot_product.quantity == 0
+    assert macbook_air_m2.quantity == 100000 - 1000
+    assert best_buy.verify_totals() == {}
+
+
+def test_quote():
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100)
+    windows_license = products.NonStockedProduct("Windows License", price=125)
+    best_buy = store.Store([macbook_air_m2, windows_license])
+    windows_license.set_promotion(promotions.SecondHalfPrice("Buy 1 get 1 half price"))
+    assert best_buy.quote([(macbook_air_m2, 2), (windows_license, 2)]) == ([2900, 187.5], 3087.5)
+    assert macbook_air_m2.quantity == 100
+
+    macbook_air_m2.set_price(1000)
+    assert best_buy.get_inventory_value() == 100000
+    assert best_buy.quote([(macbook_air_m2, 2)]) == ([2000], 2000)
+
+
+def test_order_hooks():
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100)
+    best_buy = store.Store([macbook_air_m2])
+    recorded = []
+    best_buy.add_order_hook(lambda shopping_list, line_prices: recorded.append(line_prices))
+    best_buy.order([(macbook_air_m2, 1), (macbook_air_m2, 2)])
+    assert recorded == [[1450, 2900]]
+
+    def failing_hook(shopping_list, line_prices):
+        raise OSError("No space left on device")
+
+    # A failing hook rolls the order back
+    best_buy.add_order_hook(failing_hook)
+    with pytest.raises(OSError):
+        best_buy.order([(macbook_air_m2, 97)])
+    assert macbook_air_m2.quantity == 97
+    best_buy.remove_order_hook(failing_hook)
+    assert best_buy.order([(macbook_air_m2, 97)]) == 140650
+    assert best_buy.get_all_products() == []
+
+
+def test_basket():
+    macbook_air_m2 = products.Product("MacBook Air M2", price=1450, quantity=100)
+    shipping_fee = products.LimitedProduct("Shipping", price=10, quantity=250, maximum=2)
+    basket = store.Basket()
+    assert not basket
+    basket.add(macbook_air_m2, 2)
+    basket.add(shipping_fee, 1)
+    basket.add(macbook_air_m2, 3)
+    assert list(basket) == [(macbook_air_m2, 5), (shipping_fee, 1)]
+    assert len(basket) == 2 and macbook_air_m2 in basket
+    with pytest.raises(ValueError, match="A maximum of 2 units allowed per customer."):
+        basket.add(shipping_fee, 2)
+    assert basket == store.Basket([(macbook_air_m2, 5), (shipping_fee, 1)])
+
+    best_buy = store.Store([macbook_air_m2, shipping_fee])
+    assert best_buy.order(basket) == 7260
+    assert macbook_air_m2.quantity == 95
+    basket.remove(macbook_air_m2)
+    with pytest.raises(ValueError, match="A non-existent product cannot be removed!"):
+        basket.remove(macbook_air_m2)
+    assert list(basket) == [(shipping_fee, 1)]
+
+
+def test_pages():
+    product_list = [products.Product(f"Product {i}", price=10, quantity=1) for i in range(25)]
+    best_buy = store.Store(product_list)
+    assert best_buy.get_page_count(10) == 3
+    assert best_buy.get_page(1, 10) == product_list[:10]
+    assert best_buy.get_page(3, 10) == product_list[20:]
+    assert best_buy.get_page(4, 10) == []
+    with pytest.raises(ValueError, match="Page and page size must be at least 1!"):
+        best_buy.get_page(0, 10)
+    with pytest.raises(ValueError, match="Page and page size must be at least 1!"):
+        best_buy.get_page_count(0)
+
+    listing = best_buy.iter_products()
+    assert next(listing) is product_list[0]
+    product_list[1].buy(1)  # Sold out during the iteration
+    assert list(listing) == product_list[2:]